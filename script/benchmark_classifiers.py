@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Comparaison des backends de classification pixel : temps d'apprentissage, débit de
+prédiction (pixels/s) sur l'image complète, taille du modèle, mémoire crête et F1 par
+classe, avec la même validation croisée et la même prédiction par blocs que
+classification_pixel.py.
+
+Chaque backend tourne dans un processus neuf (méthode 'spawn') qui recharge les
+échantillons mis en cache : la mémoire crête est mesurée à partir de l'état du processus
+après ce chargement et est comparable d'un backend à l'autre.
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/libsigma')
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import os
+import time
+import pickle
+import resource
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from osgeo import gdal
+
+# personal libraries
+from my_function import (
+    CLASSIFIER_BACKENDS,
+    extract_samples_from_polygons,
+    cross_validate_classifier,
+    average_cv_results,
+    make_classifier,
+    predict_image_by_blocks
+)
+
+MY_FOLDER = '/home/onyxia/work/data/project/tmp_classif'
+MY_FOLDER_RESULT = '/home/onyxia/work/projet_901_21/results/data'
+SAMPLE_SHP = os.path.join(MY_FOLDER_RESULT, 'sample', 'Sample_BD_foret_T31TCJ.shp')
+image_filename = os.path.join(MY_FOLDER_RESULT, 'img_pretraitees', 'Serie_temp_S2_allbands.tif')
+out_benchmark = os.path.join(MY_FOLDER, 'benchmark_backends.csv')
+out_X = os.path.join(MY_FOLDER, 'benchmark_backends_X.npy')
+out_Y = os.path.join(MY_FOLDER, 'benchmark_backends_Y.npy')
+
+codes_classif_pixel = [11, 12, 13, 14, 21, 22, 23, 24, 25]
+BACKENDS = list(CLASSIFIER_BACKENDS)
+BACKEND_PARAMS = {}  # ex. {'rf': {'n_estimators': 50}}
+MAX_PER_CLASS = None  # Plafond d'échantillons par classe (None : tous les pixels)
+F1_MIN = 0.5  # Seuil de F1 macro à respecter pour retenir un backend
+BLOCK_SIZE = 512
+
+
+def peak_rss():
+    """Mémoire crête du processus courant en octets (Linux : ru_maxrss en Ko)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def benchmark_backend(backend, queue):
+    """Mesure les performances d'un backend dans un processus dédié."""
+    X, Y = np.load(out_X), np.load(out_Y)
+    baseline = peak_rss()
+    cv_results = cross_validate_classifier(X, Y, backend, BACKEND_PARAMS.get(backend), n_splits=5)
+    average_accuracy, _, average_report = average_cv_results(cv_results)
+
+    # Modèle final appris sur tous les échantillons
+    clf = make_classifier(backend, **BACKEND_PARAMS.get(backend, {}))
+    start = time.perf_counter()
+    clf.fit(X, Y.ravel())
+    training_time = time.perf_counter() - start
+
+    # Débit de la prédiction par blocs sur l'image complète
+    out_classif = os.path.join(MY_FOLDER, f'carte_benchmark_{backend}.tif')
+    start = time.perf_counter()
+    predict_image_by_blocks(clf, image_filename, out_classif, block_size=BLOCK_SIZE)
+    prediction_time = time.perf_counter() - start
+    dataset = gdal.Open(image_filename)
+    nb_pixels = dataset.RasterXSize * dataset.RasterYSize
+    dataset = None
+    os.remove(out_classif)
+
+    result = {
+        "backend": backend,
+        "temps_apprentissage_s": training_time,
+        "temps_apprentissage_pli_s": np.mean(cv_results["fit_times"]),
+        "pixels_par_s": nb_pixels / prediction_time,
+        "taille_modele_mo": len(pickle.dumps(clf)) / 1024 ** 2,
+        "memoire_crete_mo": (peak_rss() - baseline) / 1024 ** 2,
+        "oa": average_accuracy,
+        "f1_macro": average_report['f1-score']['macro avg'],
+    }
+    for code in codes_classif_pixel:
+        result[f"f1_{code}"] = average_report['f1-score'].get(str(code), np.nan)
+    queue.put(result)
+
+
+if __name__ == '__main__':
+    if not os.path.exists(MY_FOLDER):
+        os.makedirs(MY_FOLDER)
+
+    bd_foret = gpd.read_file(SAMPLE_SHP)
+    bd_foret_filtree = bd_foret[bd_foret['Code'].isin(codes_classif_pixel)]
+    X, Y, _, _ = extract_samples_from_polygons(
+        bd_foret_filtree, image_filename, 'Code', max_per_class=MAX_PER_CLASS, seed=0
+        )
+    # Échantillons mis en cache et rechargés par chaque processus
+    np.save(out_X, X.astype(np.float32, copy=False))
+    np.save(out_Y, Y)
+    del X, Y
+
+    results = []
+    context = mp.get_context('spawn')
+    for backend in BACKENDS:
+        # Un processus neuf par backend pour que la mémoire crête lui soit propre
+        queue = context.Queue()
+        process = context.Process(target=benchmark_backend, args=(backend, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+        print(results[-1])
+
+    results_df = pd.DataFrame(results).sort_values("pixels_par_s", ascending=False)
+    results_df.to_csv(out_benchmark, index=False)
+    print(results_df.to_string(index=False))
+
+    eligible = results_df[results_df["f1_macro"] >= F1_MIN]
+    if eligible.empty:
+        print(f"Aucun backend n'atteint un F1 macro de {F1_MIN}")
+    else:
+        print(f"Backend le plus rapide avec F1 macro >= {F1_MIN} : {eligible.iloc[0]['backend']}")
+    os.remove(out_X)
+    os.remove(out_Y)
+    print(f"Benchmark sauvegardé dans {out_benchmark}")
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Contrôle de la mémoire crête (RSS) de l'extraction, de l'apprentissage et de la
+prédiction sur une image synthétique UInt16 de NB_PIXELS pixels x NB_BANDS bandes.
+
+Utilisation : python benchmark_memory.py [nb_pixels]
+Le script se termine en erreur si un budget mémoire est dépassé.
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import os
+import resource
+import tempfile
+import multiprocessing as mp
+import numpy as np
+import geopandas as gpd
+from shapely.geometry import box
+from osgeo import gdal, osr
+from sklearn.ensemble import RandomForestClassifier as RF
+
+# personal libraries
+from my_function import extract_samples_from_polygons, predict_image_by_blocks
+
+NB_PIXELS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+NB_BANDS = 60  # 10 bandes x 6 dates
+BLOCK_SIZE = 512
+POLYGON_SIZE = 50  # Côté des polygones synthétiques en pixels
+CODES = [11, 12, 13, 14, 21, 22, 23, 24, 25]
+MARGIN = 1.5  # Tolérance sur les budgets théoriques
+MB = 1024 ** 2
+
+
+def peak_rss():
+    """Retourne la mémoire crête du processus courant en octets (Linux : ru_maxrss en Ko)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def create_synthetic_data(folder):
+    """Crée une image UInt16 et une grille de polygones couvrant toute l'image."""
+    side = int(np.sqrt(NB_PIXELS))
+    image_filename = os.path.join(folder, 'stack.tif')
+    dataset = gdal.GetDriverByName('GTiff').Create(
+        image_filename, side, side, NB_BANDS, gdal.GDT_UInt16, options=['TILED=YES']
+        )
+    dataset.SetGeoTransform((0, 10, 0, side * 10, 0, -10))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(2154)
+    dataset.SetProjection(srs.ExportToWkt())
+    rng = np.random.default_rng(0)
+    for band in range(1, NB_BANDS + 1):
+        dataset.GetRasterBand(band).WriteArray(
+            rng.integers(1, 10000, size=(side, side), dtype=np.uint16)
+            )
+    dataset = None
+
+    step = POLYGON_SIZE * 10
+    geometries = [box(x, y, x + step, y + step)
+                  for x in range(0, side * 10, step) for y in range(0, side * 10, step)]
+    gdf = gpd.GeoDataFrame(
+        {'Code': rng.choice(CODES, size=len(geometries))}, geometry=geometries, crs='EPSG:2154'
+        )
+    return image_filename, gdf, side * side
+
+
+def stage_extraction(image_filename, gdf, queue):
+    """Extraction des échantillons puis conversion unique en float32."""
+    baseline = peak_rss()
+    X, _, _, _ = extract_samples_from_polygons(gdf, image_filename, 'Code')
+    X = X.astype(np.float32, copy=False)
+    queue.put((peak_rss() - baseline, X.shape[0]))
+
+
+def stage_training(image_filename, gdf, queue):
+    """Apprentissage d'une petite forêt sur les échantillons extraits."""
+    X, Y, _, _ = extract_samples_from_polygons(gdf, image_filename, 'Code')
+    X = X.astype(np.float32, copy=False)
+    baseline = peak_rss()
+    RF(n_estimators=10, max_depth=10, n_jobs=1, random_state=0).fit(X, Y.ravel())
+    queue.put((peak_rss() - baseline, X.shape[0]))
+
+
+def stage_prediction(image_filename, gdf, out_filename, queue):
+    """Prédiction bloc par bloc de l'image complète."""
+    X, Y, _, _ = extract_samples_from_polygons(
+        gdf, image_filename, 'Code', max_per_class=1000, seed=0
+        )
+    clf = RF(n_estimators=10, max_depth=10, n_jobs=1, random_state=0)
+    clf.fit(X.astype(np.float32), Y.ravel())
+    del X, Y
+    baseline = peak_rss()
+    predict_image_by_blocks(clf, image_filename, out_filename, block_size=BLOCK_SIZE)
+    queue.put((peak_rss() - baseline, None))
+
+
+def run_stage(target, *args):
+    """Exécute une étape dans un processus neuf pour isoler sa mémoire crête."""
+    queue = mp.get_context('spawn').Queue()
+    process = mp.get_context('spawn').Process(target=target, args=(*args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        image, polygons, nb_pixels = create_synthetic_data(tmp_folder)
+        uint16_size = nb_pixels * NB_BANDS * 2
+        float32_size = nb_pixels * NB_BANDS * 4
+        block_size = BLOCK_SIZE * BLOCK_SIZE * NB_BANDS * (2 + 4)
+
+        # Budgets théoriques : matrice UInt16 + sa copie float32 pour l'extraction,
+        # une copie float32 pour l'apprentissage, quelques blocs pour la prédiction
+        budgets = {
+            'extraction': (stage_extraction, (image, polygons), uint16_size + float32_size),
+            'apprentissage': (stage_training, (image, polygons), float32_size),
+            'prediction': (stage_prediction,
+                           (image, polygons, os.path.join(tmp_folder, 'carte.tif')),
+                           4 * block_size),
+        }
+
+        failures = []
+        print(f"{nb_pixels} pixels x {NB_BANDS} bandes "
+              f"(float64 : {nb_pixels * NB_BANDS * 8 / MB:.0f} Mo)")
+        for name, (target, args, budget) in budgets.items():
+            delta, _ = run_stage(target, *args)
+            status = 'OK' if delta <= MARGIN * budget else 'DEPASSEMENT'
+            print(f"{name:>14} : crête +{delta / MB:8.1f} Mo "
+                  f"(budget {MARGIN * budget / MB:8.1f} Mo) {status}")
+            if status != 'OK':
+                failures.append(name)
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Vérification et benchmark du post-traitement de la carte des essences :
+- sur des cartes aléatoires synthétiques, aucun groupe ne reste sous l'unité minimale de
+  cartographie après tamisage et le traitement par tuiles donne exactement le résultat
+  de l'image entière (le script se termine en erreur sinon) ;
+- tamisage `sieve_block` contre gdal.SieveFilter sur une tuile complète ;
+- traitement par tuiles parallèles contre traitement de l'image entière (résultat identique).
+
+GDAL fusionne chaque petit groupe avec le plus grand polygone voisin ; `sieve_block` le
+fusionne avec le voisin plus grand avec lequel il a le plus de contacts. Les deux
+fusionnent les plus petits groupes d'abord, jusqu'à ce qu'il n'en reste plus sous l'UMC ;
+le taux d'accord entre les deux est indiqué à titre de comparaison.
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import os
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+from osgeo import gdal
+
+# personal libraries
+from my_function import sieve_block, postprocess_block, postprocess_classification
+
+MY_FOLDER = '/home/onyxia/work/data/project/tmp_classif'
+MY_FOLDER_RESULT = '/home/onyxia/work/projet_901_21/results/data'
+in_classif = os.path.join(MY_FOLDER_RESULT, 'classif', 'carte_essences_echelle_pixel.tif')
+out_whole = os.path.join(MY_FOLDER, 'carte_filtree_image_entiere.tif')
+out_tiled = os.path.join(MY_FOLDER, 'carte_filtree_tuiles.tif')
+out_benchmark = os.path.join(MY_FOLDER, 'benchmark_post_traitement.csv')
+
+MIN_SIZE = 5  # Unité minimale de cartographie en pixels
+MAJORITY_SIZE = 3
+CONNECTIVITY = 8
+TILE_SIZE = 1024
+N_JOBS = [1, 2, 4]
+NB_CHECK = 50  # Nombre de cartes synthétiques vérifiées
+SEED = 0
+
+
+def groups_below(labels, min_size, connectivity, no_data=0):
+    """Nombre de groupes sous `min_size` pixels, hors îlots entourés de no data plus petits
+    que `min_size` (qui ne peuvent être fusionnés avec rien)."""
+    structure = ndimage.generate_binary_structure(2, 1 if connectivity == 4 else 2)
+    regions, _ = ndimage.label(labels != no_data, structure=structure)
+    region_sizes = np.bincount(regions.ravel())
+    nb_below = 0
+    for code in np.unique(labels[labels != no_data]):
+        components, count = ndimage.label(labels == code, structure=structure)
+        sizes = np.bincount(components.ravel(), minlength=count + 1)
+        for component in np.nonzero(sizes[1:] < min_size)[0] + 1:
+            region = regions[components == component][0]
+            nb_below += int(region_sizes[region] >= min_size)
+    return nb_below
+
+
+def write_map(filename, labels):
+    """Écrit une carte de classes Byte (no data 0)."""
+    dataset = gdal.GetDriverByName('GTiff').Create(
+        filename, labels.shape[1], labels.shape[0], 1, gdal.GDT_Byte
+    )
+    dataset.SetGeoTransform((0, 10, 0, labels.shape[0] * 10, 0, -10))
+    dataset.GetRasterBand(1).WriteArray(labels)
+    dataset = None
+
+
+def check_synthetic_maps():
+    """Vérifie l'UMC et l'égalité tuiles / image entière sur des cartes aléatoires."""
+    rng = np.random.default_rng(SEED)
+    nb_errors = 0
+    with tempfile.TemporaryDirectory() as folder:
+        in_map, out_map = os.path.join(folder, 'carte.tif'), os.path.join(folder, 'filtree.tif')
+        for index in range(NB_CHECK):
+            nb_row, nb_col = rng.integers(20, 120, 2)
+            labels = rng.integers(1, rng.integers(3, 10), (nb_row, nb_col)).astype(np.uint8)
+            labels[rng.random((nb_row, nb_col)) < rng.choice([0, 0.05, 0.2])] = 0
+            min_size = int(rng.integers(2, 15))
+            connectivity = int(rng.choice([4, 8]))
+            majority_size = int(rng.choice([0, 3, 5])) or None
+
+            sieved = sieve_block(labels, min_size, connectivity)
+            nb_below = groups_below(sieved, min_size, connectivity)
+            write_map(in_map, labels)
+            postprocess_classification(
+                in_map, out_map, min_size, majority_size, connectivity,
+                tile_size=int(rng.integers(8, 40)), n_jobs=2
+            )
+            identical = np.array_equal(
+                gdal.Open(out_map).ReadAsArray(),
+                postprocess_block(labels, min_size, majority_size, connectivity)
+            )
+            if nb_below or not identical:
+                nb_errors += 1
+                print(f"Carte {index} : {nb_below} groupes sous l'UMC, "
+                      f"tuiles identiques à l'image entière : {identical}")
+    print(f"Cartes synthétiques vérifiées : {NB_CHECK}, erreurs : {nb_errors}")
+    return nb_errors == 0
+
+
+def main():
+    if not check_synthetic_maps():
+        sys.exit(1)
+    if not os.path.exists(MY_FOLDER):
+        os.makedirs(MY_FOLDER)
+    results = []
+
+    # 1 --- Tamisage d'une tuile complète : sieve_block contre gdal.SieveFilter
+    dataset = gdal.Open(in_classif)
+    xsize = min(TILE_SIZE, dataset.RasterXSize)
+    ysize = min(TILE_SIZE, dataset.RasterYSize)
+    tile = dataset.GetRasterBand(1).ReadAsArray(0, 0, xsize, ysize)
+
+    start = time.perf_counter()
+    sieved = sieve_block(tile, MIN_SIZE, CONNECTIVITY)
+    results.append({"methode": "sieve_block (tuile)", "n_jobs": 1,
+                    "temps_s": time.perf_counter() - start})
+
+    mem_ds = gdal.GetDriverByName('MEM').Create('', xsize, ysize, 1, gdal.GDT_Byte)
+    mem_ds.GetRasterBand(1).WriteArray(tile)
+    mask_ds = gdal.GetDriverByName('MEM').Create('', xsize, ysize, 1, gdal.GDT_Byte)
+    mask_ds.GetRasterBand(1).WriteArray((tile != 0).astype(np.uint8))
+    start = time.perf_counter()
+    gdal.SieveFilter(mem_ds.GetRasterBand(1), mask_ds.GetRasterBand(1),
+                     mem_ds.GetRasterBand(1), MIN_SIZE, CONNECTIVITY)
+    results.append({"methode": "gdal.SieveFilter (tuile)", "n_jobs": 1,
+                    "temps_s": time.perf_counter() - start})
+    sieved_gdal = mem_ds.GetRasterBand(1).ReadAsArray()
+    valid = tile != 0
+    agreement = float((sieved_gdal[valid] == sieved[valid]).mean()) if valid.any() else 1.0
+    print(f"Accord sieve_block / gdal.SieveFilter : {agreement:.2%}")
+    print(f"Groupes sous l'UMC : sieve_block {groups_below(sieved, MIN_SIZE, CONNECTIVITY)}, "
+          f"gdal.SieveFilter {groups_below(sieved_gdal, MIN_SIZE, CONNECTIVITY)}")
+    mem_ds = mask_ds = None
+
+    # 2 --- Image entière en une tuile contre tuiles parallèles
+    whole_size = max(dataset.RasterXSize, dataset.RasterYSize)
+    dataset = None
+    start = time.perf_counter()
+    postprocess_classification(in_classif, out_whole, MIN_SIZE, MAJORITY_SIZE, CONNECTIVITY,
+                               tile_size=whole_size, n_jobs=1)
+    results.append({"methode": "image entière", "n_jobs": 1,
+                    "temps_s": time.perf_counter() - start})
+    reference = gdal.Open(out_whole).ReadAsArray()
+
+    for n_jobs in N_JOBS:
+        start = time.perf_counter()
+        postprocess_classification(in_classif, out_tiled, MIN_SIZE, MAJORITY_SIZE, CONNECTIVITY,
+                                   tile_size=TILE_SIZE, n_jobs=n_jobs)
+        elapsed = time.perf_counter() - start
+        identical = bool(np.array_equal(gdal.Open(out_tiled).ReadAsArray(), reference))
+        results.append({"methode": "tuiles", "n_jobs": n_jobs, "temps_s": elapsed,
+                        "identique_image_entiere": identical})
+        if not identical:
+            print(f"ATTENTION : résultat par tuiles différent de l'image entière (n_jobs={n_jobs})")
+
+    results_df = pd.DataFrame(results)
+    results_df.to_csv(out_benchmark, index=False)
+    print(results_df.to_string(index=False))
+    print(f"Benchmark sauvegardé dans {out_benchmark}")
+
+
+if __name__ == '__main__':
+    main()
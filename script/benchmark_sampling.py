@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/libsigma')
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from sklearn.model_selection import GroupShuffleSplit
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.ensemble import RandomForestClassifier as RF
+
+# personal libraries
+from my_function import extract_samples_from_polygons
+
+MY_FOLDER = '/home/onyxia/work/data/project/tmp_classif'
+MY_FOLDER_RESULT = '/home/onyxia/work/projet_901_21/results/data'
+SAMPLE_SHP = os.path.join(MY_FOLDER_RESULT, 'sample', 'Sample_BD_foret_T31TCJ.shp')
+image_filename = os.path.join(MY_FOLDER_RESULT, 'img_pretraitees', 'Serie_temp_S2_allbands.tif')
+out_benchmark = os.path.join(MY_FOLDER, 'benchmark_echantillonnage.csv')
+
+# Plafonds testés : (pixels par classe, pixels par polygone)
+CAPS = [
+    (None, None),
+    (20000, None),
+    (10000, 500),
+    (5000, 200),
+    (2000, 100),
+    (1000, 50),
+]
+SEED = 0
+
+if not os.path.exists(MY_FOLDER):
+    os.makedirs(MY_FOLDER)
+
+# Lecture des polygones d'échantillons
+codes_classif_pixel = [11, 12, 13, 14, 21, 22, 23, 24, 25]
+bd_foret = gpd.read_file(SAMPLE_SHP)
+bd_foret_filtree = bd_foret[bd_foret['Code'].isin(codes_classif_pixel)].reset_index(drop=True)
+
+# Séparation apprentissage / test par polygone pour que le test reste identique
+# quel que soit le plafond appliqué à l'apprentissage
+gss = GroupShuffleSplit(n_splits=1, test_size=0.3, random_state=SEED)
+train_poly, test_poly = next(gss.split(bd_foret_filtree, groups=bd_foret_filtree.index))
+X_test, Y_test, _, _ = extract_samples_from_polygons(
+    bd_foret_filtree.iloc[test_poly], image_filename, 'Code'
+    )
+
+results = []
+for max_per_class, max_per_polygon in CAPS:
+    start = time.perf_counter()
+    X_train, Y_train, _, _ = extract_samples_from_polygons(
+        bd_foret_filtree.iloc[train_poly],
+        image_filename,
+        'Code',
+        max_per_class=max_per_class,
+        max_per_polygon=max_per_polygon,
+        seed=SEED
+        )
+    extraction_time = time.perf_counter() - start
+
+    clf = RF(
+        max_depth=50,
+        oob_score=True,
+        max_samples=0.75,
+        class_weight="balanced",
+        n_jobs=-1,
+        random_state=SEED
+    )
+    start = time.perf_counter()
+    clf.fit(X_train, Y_train.ravel())
+    training_time = time.perf_counter() - start
+
+    Y_predict = clf.predict(X_test)
+    results.append({
+        "max_par_classe": max_per_class,
+        "max_par_polygone": max_per_polygon,
+        "nb_pixels_apprentissage": X_train.shape[0],
+        "temps_extraction_s": extraction_time,
+        "temps_apprentissage_s": training_time,
+        "oa": accuracy_score(Y_test, Y_predict),
+        "f1_macro": f1_score(Y_test, Y_predict, average="macro"),
+    })
+    print(results[-1])
+
+results_df = pd.DataFrame(results)
+results_df.to_csv(out_benchmark, index=False)
+print(results_df.to_string(index=False))
+print(f"Benchmark sauvegardé dans {out_benchmark}")
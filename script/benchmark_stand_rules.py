@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Vérifie que `classify_polygons` (vectorisée) donne exactement les mêmes codes que
+`classify_polygon` sur un corpus aléatoire de comptages, puis compare leurs temps sur
+un nombre de peuplements de l'ordre d'un département.
+
+Le corpus mélange plusieurs familles de cas : comptages quelconques, une essence
+dominante, seuils de 75 % atteints exactement, égalités feuillus / conifères,
+polygones vides, classes hors feuillus et conifères, surfaces autour de 2 ha.
+
+Utilisation : python benchmark_stand_rules.py [nb_peuplements]
+Le script se termine en erreur si un code diffère.
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import time
+import numpy as np
+import pandas as pd
+
+# personal libraries
+from my_function import classify_polygon, classify_polygons
+
+NB_STANDS = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+NB_CHECK = 200_000  # Taille du corpus de vérification
+CLASSES = [11, 12, 13, 14, 21, 22, 23, 24, 25, 31]  # 31 : classe hors des deux groupes
+AREAS = np.array([0.01, 1.0, 1.999, 2.0, 2.001, 15.0])
+SEED = 0
+
+
+def random_corpus(nb, rng):
+    """Comptages (nb, n_classes) et surfaces tirés dans plusieurs familles de cas."""
+    family = rng.integers(0, 6, nb)
+    counts = rng.integers(0, 50, (nb, len(CLASSES))) * rng.integers(0, 2, (nb, len(CLASSES)))
+
+    # Une essence dominante plus ou moins marquée
+    rows = np.nonzero(family == 1)[0]
+    counts[rows, rng.integers(0, 9, rows.size)] += rng.integers(0, 2000, rows.size)
+
+    # Exactement 75 % pour une essence ou un groupe (3 pixels sur 4, 75 sur 100...)
+    rows = np.nonzero(family == 2)[0]
+    scale = rng.integers(1, 40, rows.size)
+    counts[rows] = 0
+    counts[rows, rng.integers(0, 9, rows.size)] = 3 * scale
+    counts[rows, rng.integers(0, len(CLASSES), rows.size)] += scale
+
+    # Égalité stricte feuillus / conifères
+    rows = np.nonzero(family == 3)[0]
+    counts[rows] = 0
+    counts[rows, rng.integers(0, 4, rows.size)] = scale_tie = rng.integers(1, 100, rows.size)
+    counts[rows, rng.integers(4, 9, rows.size)] = scale_tie
+
+    # Polygones vides ou uniquement hors groupes
+    rows = np.nonzero(family == 4)[0]
+    counts[rows, :9] = 0
+
+    # Très grands polygones (comptages élevés)
+    rows = np.nonzero(family == 5)[0]
+    counts[rows] *= rng.integers(1, 10_000, (rows.size, 1))
+
+    areas = np.where(rng.random(nb) < 0.5, rng.choice(AREAS, nb), rng.uniform(0, 20, nb))
+    return counts, areas
+
+
+def reference(counts, areas):
+    """Codes de `classify_polygon`, polygone par polygone."""
+    return np.array([
+        classify_polygon({code: value for code, value in zip(CLASSES, row) if value}, area)
+        for row, area in zip(counts.tolist(), areas.tolist())
+        ])
+
+
+rng = np.random.default_rng(SEED)
+
+# 1 --- Équivalence exacte sur le corpus
+counts, areas = random_corpus(NB_CHECK, rng)
+expected = reference(counts, areas)
+predicted = classify_polygons(counts, CLASSES, areas)
+mismatch = np.nonzero(predicted != expected)[0]
+print(f"Codes vérifiés : {NB_CHECK}, différences : {mismatch.size}")
+print(pd.Series(expected).value_counts().sort_index().to_string())
+if mismatch.size:
+    print(pd.DataFrame(counts[mismatch[:10]], columns=CLASSES).assign(
+        surface_ha=areas[mismatch[:10]], attendu=expected[mismatch[:10]],
+        obtenu=predicted[mismatch[:10]]
+        ).to_string())
+    sys.exit(1)
+
+# 2 --- Temps à l'échelle d'un département
+counts, areas = random_corpus(NB_STANDS, rng)
+start = time.perf_counter()
+reference(counts, areas)
+time_loop = time.perf_counter() - start
+start = time.perf_counter()
+classify_polygons(counts, CLASSES, areas)
+time_vector = time.perf_counter() - start
+print(f"{NB_STANDS} peuplements : boucle {time_loop:.2f} s, vectorisé {time_vector:.3f} s "
+      f"(x{time_loop / time_vector:.0f})")
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Benchmark du comptage des classes par polygone : `zonal_class_counts` (une rasterisation
+et un bincount) et `zonal_statistics` (tuiles en parallèle) contre
+`rasterstats.zonal_stats(..., categorical=True)`, sur une carte de classes synthétique et
+NB_POLYGONS peuplements aux limites non alignées sur les pixels.
+
+Utilisation : python benchmark_zonal.py [nb_polygones]
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import os
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Polygon
+from osgeo import gdal, osr
+from rasterstats import zonal_stats
+
+# personal libraries
+from my_function import zonal_class_counts, zonal_statistics
+
+MY_FOLDER = '/home/onyxia/work/data/project/tmp_classif'
+out_benchmark = os.path.join(MY_FOLDER, 'benchmark_zonal.csv')
+
+NB_POLYGONS = int(sys.argv[1]) if len(sys.argv) > 1 else 30_000
+CELL = 12  # Côté en pixels de la cellule contenant chaque polygone
+TILE_SIZE = 500  # Tuiles volontairement petites : beaucoup de polygones à cheval
+CODES = [11, 12, 13, 14, 21, 22, 23, 24, 25]
+SEED = 0
+
+
+def create_synthetic_data(folder):
+    """Crée une carte de classes Byte et un quadrilatère irrégulier par cellule."""
+    rng = np.random.default_rng(SEED)
+    side = int(np.ceil(np.sqrt(NB_POLYGONS)))
+    size = side * CELL
+    class_filename = os.path.join(folder, 'classes.tif')
+    dataset = gdal.GetDriverByName('GTiff').Create(
+        class_filename, size, size, 1, gdal.GDT_Byte, options=['TILED=YES']
+        )
+    dataset.SetGeoTransform((0, 10, 0, size * 10, 0, -10))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(2154)
+    dataset.SetProjection(srs.ExportToWkt())
+    labels = rng.choice(np.array([0] + CODES, dtype=np.uint8), size=(size, size))
+    dataset.GetRasterBand(1).WriteArray(labels)
+    dataset.GetRasterBand(1).SetNoDataValue(0)
+    dataset = None
+
+    polygons = []
+    for index in range(NB_POLYGONS):
+        x0 = (index % side) * CELL * 10
+        y0 = (index // side) * CELL * 10
+        corners = rng.uniform(1, CELL * 10 / 2 - 1, size=(4, 2))
+        cell = CELL * 10
+        polygons.append(Polygon([
+            (x0 + corners[0, 0], y0 + corners[0, 1]),
+            (x0 + cell - corners[1, 0], y0 + corners[1, 1]),
+            (x0 + cell - corners[2, 0], y0 + cell - corners[2, 1]),
+            (x0 + corners[3, 0], y0 + cell - corners[3, 1]),
+            ]))
+    gdf = gpd.GeoDataFrame({"ID": np.arange(NB_POLYGONS)}, geometry=polygons, crs="EPSG:2154")
+    vector_filename = os.path.join(folder, 'peuplements.gpkg')
+    gdf.to_file(vector_filename)
+    return class_filename, vector_filename, gdf
+
+
+def main():
+    """Compare les trois comptages à rasterstats et sauvegarde les temps."""
+    if not os.path.exists(MY_FOLDER):
+        os.makedirs(MY_FOLDER)
+
+    with tempfile.TemporaryDirectory() as folder:
+        class_filename, vector_filename, gdf = create_synthetic_data(folder)
+
+        start = time.perf_counter()
+        counts, classes = zonal_class_counts(gdf, class_filename, classes=CODES)
+        time_bincount = time.perf_counter() - start
+
+        start = time.perf_counter()
+        counts_sparse, _ = zonal_class_counts(gdf, class_filename, classes=CODES, sparse=True)
+        time_sparse = time.perf_counter() - start
+
+        start = time.perf_counter()
+        counts_tiled = zonal_statistics(gdf, class_raster=class_filename, classes=CODES,
+                                        tile_size=TILE_SIZE)["nb"]
+        time_tiled = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stats = zonal_stats(vector_filename, class_filename, categorical=True, nodata=0)
+        time_rasterstats = time.perf_counter() - start
+
+    expected = np.array([[s.get(code, 0) for code in classes] for s in stats])
+    identical = bool(np.array_equal(counts, expected))
+    identical_sparse = bool(np.array_equal(counts_sparse.toarray(), expected))
+    identical_tiled = bool(np.array_equal(counts_tiled, expected))
+    if not identical:
+        nb_diff = int(np.any(counts != expected, axis=1).sum())
+        print(f"ATTENTION : {nb_diff} polygones diffèrent de rasterstats")
+
+    results_df = pd.DataFrame([
+        {"methode": "rasterstats", "temps_s": time_rasterstats, "identique_rasterstats": True},
+        {"methode": "bincount dense", "temps_s": time_bincount, "identique_rasterstats": identical},
+        {"methode": "bincount creux", "temps_s": time_sparse,
+         "identique_rasterstats": identical_sparse},
+        {"methode": f"tuiles {TILE_SIZE} px", "temps_s": time_tiled,
+         "identique_rasterstats": identical_tiled},
+    ])
+    results_df["nb_polygones"] = NB_POLYGONS
+    results_df["acceleration"] = time_rasterstats / results_df["temps_s"]
+    results_df.to_csv(out_benchmark, index=False)
+    print(results_df.to_string(index=False))
+    print(f"Benchmark sauvegardé dans {out_benchmark}")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,157 +8,206 @@ sys.path.append('/home/onyxia/work/libsigma')
 sys.path.append('/home/onyxia/work/projet_901_21/script')
 
 import os
+import json
+import pickle
 import numpy as np
-from sklearn.model_selection import StratifiedKFold
-from sklearn.metrics import confusion_matrix, classification_report, accuracy_score
-from sklearn.ensemble import RandomForestClassifier as RF
 import geopandas as gpd
 
 # personal libraries
-import classification as cla
-import read_and_write as rw
-from my_function import rasterize, plot_class_quality
+from my_function import (
+    extract_samples_from_polygons,
+    predict_image_by_blocks,
+    cross_validate_classifier,
+    average_cv_results,
+    plot_class_quality,
+    postprocess_classification,
+    export_quicklook,
+    config_hash
+)
 import plots
 
 MY_FOLDER = '/home/onyxia/work/data/project/tmp_classif'
 MY_FOLDER_RESULT = '/home/onyxia/work/projet_901_21/results/data'
 SAMPLE_SHP = os.path.join(MY_FOLDER_RESULT, 'sample', 'Sample_BD_foret_T31TCJ.shp')
-EMPRISE_SHP = '/home/onyxia/work/data/project/emprise_etude.shp'
-
-# Créer le dossier de sortie s'il n'existe pas
-if not os.path.exists(os.path.join(MY_FOLDER_RESULT, 'classif')):
-    os.makedirs(os.path.join(MY_FOLDER_RESULT, 'classif'))
-
-# Créer le dossier de sortie s'il n'existe pas
-if not os.path.exists(MY_FOLDER):
-    os.makedirs(MY_FOLDER)
-
-# Lecture du jeu de données de la bd_foret et de l'emprise d'etude
-bd_foret = gpd.read_file(SAMPLE_SHP)
-emprise = gpd.read_file(EMPRISE_SHP)
 
 # Codes à garder pour la classfication supervisée
 codes_classif_pixel = [11, 12, 13, 14, 21, 22, 23, 24, 25]
 
-# On garde seulement les lignes qui nous intéresse pour la classification
-bd_foret_filtree = bd_foret[bd_foret['Code'].isin(codes_classif_pixel)]
-
-bd_foret_filtree_classif_filename = os.path.join(MY_FOLDER, 'bd_foret_filtree_pour_classif.shp')
-bd_foret_filtree.to_file(bd_foret_filtree_classif_filename)
-# Paramètres de rasterisation
-output_file = os.path.join(MY_FOLDER, 'sample_raster.tif')  # Chemin vers l'image de sortie
-FIELD_NAME = 'Code'  # Champ contenant les valeurs de rasterisation
-SPATIAL_RES = 10  # Résolution spatiale de 10 m
-DATA_TYPE = 'Int8'  # Type de données de sortie
-DRIVER = 'GTiff'  # Format GeoTIFF
-
-# Appel de la fonction pour rasteriser le jeu d'échantillons
-rasterize(
-    bd_foret_filtree_classif_filename,
-    emprise,
-    output_file,
-    SPATIAL_RES,
-    DATA_TYPE,
-    DRIVER,
-    FIELD_NAME
-    )
-
 # Chaîne de traitements pour la classification supervisée
 # 1 --- define parameters
 # inputs
 
-sample_filename = os.path.join(MY_FOLDER, 'sample_raster.tif')
 image_filename = os.path.join(MY_FOLDER_RESULT, 'img_pretraitees', 'Serie_temp_S2_allbands.tif')
+# Métriques phénologiques ajoutées aux variables (None pour ne pas les utiliser)
+PHENOLOGY_FILENAME = None  # ex. os.path.join(MY_FOLDER_RESULT, 'img_pretraitees', 'Serie_temp_S2_phenologie.tif')
+if PHENOLOGY_FILENAME is not None:
+    image_filename = [image_filename, PHENOLOGY_FILENAME]
+
+# Plafonds d'échantillonnage (None pour garder tous les pixels)
+MAX_PER_CLASS = None  # Nombre maximal de pixels par classe
+MAX_PER_POLYGON = None  # Nombre maximal de pixels par polygone
+SEED = 0  # Graine pour un tirage reproductible
+BLOCK_SIZE = 512  # Taille des blocs pour la prédiction de l'image complète
+# Post-traitement de la carte (None pour le désactiver)
+MIN_MAPPING_UNIT = None  # Unité minimale de cartographie en pixels, ex. 5 (500 m²)
+MAJORITY_SIZE = None  # Taille du filtre majoritaire, ex. 3
+OVERVIEWS = 'internal'  # Aperçus des cartes : 'internal', 'external' ou None
+
+# Classifieur : 'rf', 'extra_trees', 'hist_gb' ou 'linear' (voir CLASSIFIER_BACKENDS)
+BACKEND = 'rf'
+BACKEND_PARAMS = {}  # Paramètres qui remplacent ceux par défaut du backend
+
+# Meilleure configuration trouvée par tuning_pixel.py (None pour les paramètres ci-dessus)
+PARAMS_FILE = None  # ex. os.path.join(MY_FOLDER, 'meilleurs_parametres.json')
+if PARAMS_FILE is not None:
+    with open(PARAMS_FILE, encoding="utf-8") as f:
+        tuning = json.load(f)
+    BACKEND = tuning["backend"]
+    BACKEND_PARAMS = {**BACKEND_PARAMS, **tuning["parametres"]}
+
+# Sélection de bandes/dates produite par feature_selection.py (None pour toutes les bandes)
+SELECTION_FILE = None  # ex. os.path.join(MY_FOLDER, 'selection_bandes.json')
+band_indices = None
+if SELECTION_FILE is not None:
+    with open(SELECTION_FILE, encoding="utf-8") as f:
+        band_indices = json.load(f)["indices"]
 
 # outputs
 out_classif = os.path.join(MY_FOLDER_RESULT, 'classif', 'carte_essences_echelle_pixel.tif')
+out_filtree = os.path.join(MY_FOLDER_RESULT, 'classif', 'carte_essences_echelle_pixel_filtree.tif')
+# Cartes optionnelles produites dans la même passe (None pour les désactiver)
+out_confidence = os.path.join(MY_FOLDER_RESULT, 'classif', 'carte_confiance_echelle_pixel.tif')
+out_proba = None  # ex. os.path.join(MY_FOLDER_RESULT, 'classif', 'carte_probas_echelle_pixel.tif')
+# Point de reprise de la prédiction de l'image complète
+out_checkpoint = os.path.join(MY_FOLDER, 'carte_essences_echelle_pixel.checkpoint.json')
+out_model = os.path.join(MY_FOLDER, 'modele_echelle_pixel.pkl')
 out_matrix = os.path.join(MY_FOLDER, 'matrice_confusion_echelle_pixel.png')
 out_qualite = os.path.join(MY_FOLDER, 'graphique_qualite_echelle_pixel.png')
-# 2 --- extract samples
-X, Y, t = cla.get_samples_from_roi(image_filename, sample_filename)
-
-# 3 --- Define StratifiedKFold for 5 folds
-skf = StratifiedKFold(n_splits=5)
-
-# Variables to store results
-accuracies = []
-confusion_matrices = []
-classification_reports = []
-
-# 4 --- Loop over the splits
-for train_index, test_index in skf.split(X, Y):
-    X_train, X_test = X[train_index], X[test_index]
-    Y_train, Y_test = Y[train_index], Y[test_index]
-
-    # 5 --- Train the classifier
-    clf = RF(
-        max_depth=50,
-        oob_score=True,
-        max_samples=0.75,
-        class_weight="balanced",
-        n_jobs=-1
-    )
-    clf.fit(X_train, Y_train.ravel())
-
-    # 6 --- Test the classifier
-    Y_predict = clf.predict(X_test)
-
-    # 7 --- Compute quality metrics
-    cm = confusion_matrix(Y_test, Y_predict)
-    report = classification_report(Y_test, Y_predict, labels=np.unique(Y),
-                                   output_dict=True, zero_division=1)
-    accuracy = accuracy_score(Y_test, Y_predict)
-
-    # Store results
-    accuracies.append(accuracy)
-    confusion_matrices.append(cm)
-    classification_reports.append(report)
-
-# 8 --- Average results over all folds
-# Calculer la moyenne des métriques pour chaque classe
-average_accuracy = np.mean(accuracies)
-
-# Moyenne de la matrice de confusion (en moyenne sur les plis)
-average_cm = np.mean(confusion_matrices, axis=0)
-
-average_report = {}
-
-# Extraire les clés globales et les classes (les classes sont dans les clés du dictionnaire)
-classes = [key for key in classification_reports[0] if isinstance(
-    classification_reports[0][key],
-    dict
-    )]
-keys = ['precision', 'recall', 'f1-score']  # Les métriques que nous voulons moyenner
-
-# Calculer la moyenne des scores pour chaque métrique et chaque classe
-for key in keys:
-    average_report[key] = {}
-    for class_label in classes:
-        # Moyenne de chaque métrique pour chaque classe sur les plis
-        average_report[key][class_label] = np.mean(
-            [r[class_label][key] for r in classification_reports]
-            )
 
-# 9 --- Display and save results
-plots.plot_cm(average_cm, np.unique(Y), out_filename=out_matrix)
-plot_class_quality(average_report, average_accuracy, out_filename=out_qualite)
+def training_configuration():
+    """Configuration dont dépend le modèle entraîné, notée dans le point de reprise."""
+    # Le shapefile des échantillons est identifié par la taille et la date de ses fichiers
+    sample_files = [
+        os.path.splitext(SAMPLE_SHP)[0] + ext for ext in ('.shp', '.dbf', '.shx', '.prj')
+    ]
+    return {
+        "backend": BACKEND,
+        "parametres": BACKEND_PARAMS,
+        "fichier_parametres": PARAMS_FILE,
+        "echantillons": [
+            [path, os.stat(path).st_size, os.stat(path).st_mtime]
+            for path in sample_files if os.path.exists(path)
+        ],
+        "codes": codes_classif_pixel,
+        "max_per_class": MAX_PER_CLASS,
+        "max_per_polygon": MAX_PER_POLYGON,
+        "seed": SEED,
+        "image": image_filename,
+        "band_indices": band_indices,
+    }
+
+
+def main():
+    """Apprentissage, prédiction de l'image complète et post-traitement de la carte."""
+    # Créer le dossier de sortie s'il n'existe pas
+    if not os.path.exists(os.path.join(MY_FOLDER_RESULT, 'classif')):
+        os.makedirs(os.path.join(MY_FOLDER_RESULT, 'classif'))
+
+    # Créer le dossier de sortie s'il n'existe pas
+    if not os.path.exists(MY_FOLDER):
+        os.makedirs(MY_FOLDER)
+
+    # Lecture du jeu de données de la bd_foret
+    bd_foret = gpd.read_file(SAMPLE_SHP)
+
+    # On garde seulement les lignes qui nous intéresse pour la classification
+    bd_foret_filtree = bd_foret[bd_foret['Code'].isin(codes_classif_pixel)]
+
+    # Le modèle sauvegardé n'est réutilisé que s'il a été entraîné avec la même configuration
+    training_config = config_hash(training_configuration())
+    resume = False
+    if os.path.exists(out_checkpoint) and os.path.exists(out_model):
+        with open(out_checkpoint, encoding="utf-8") as f:
+            resume = json.load(f).get("configuration") == training_config
+        if not resume:
+            # Configuration modifiée : nouvel apprentissage et prédiction reprise à zéro
+            print("Configuration modifiée depuis le point de reprise : nouvel apprentissage")
+            os.remove(out_checkpoint)
+
+    if resume:
+        # Reprise d'une prédiction interrompue : on recharge le modèle déjà entraîné
+        # (le point de reprise vérifie l'empreinte du fichier du modèle)
+        with open(out_model, 'rb') as f:
+            clf = pickle.load(f)
+    else:
+        # 2 --- extract samples
+        # Extraction directe depuis les polygones, sans raster d'échantillons intermédiaire
+        X, Y, t, polygon_ids = extract_samples_from_polygons(
+            bd_foret_filtree,
+            image_filename,
+            'Code',
+            max_per_class=MAX_PER_CLASS,
+            max_per_polygon=MAX_PER_POLYGON,
+            seed=SEED,
+            band_indices=band_indices
+            )
 
-# 5 --- apply on the whole image
-# load image
-X_img, _, t_img = cla.get_samples_from_roi(image_filename, image_filename)
+        # Conversion unique en float32 (type utilisé en interne par les arbres de scikit-learn) :
+        # les plis et l'apprentissage travaillent ensuite sans copie cachée en float64
+        X = X.astype(np.float32, copy=False)
 
-# predict image
-Y_predict = clf.predict(X_img)
+        # 3 --- Cross-validation (StratifiedKFold, 5 folds) of the selected backend
+        cv_results = cross_validate_classifier(
+            X, Y, backend=BACKEND, params=BACKEND_PARAMS, n_splits=5
+            )
+        clf = cv_results["clf"]
+
+        # 4 --- Average results over all folds
+        average_accuracy, average_cm, average_report = average_cv_results(cv_results)
+
+        # 5 --- Display and save results
+        plots.plot_cm(average_cm, np.unique(Y), out_filename=out_matrix)
+        plot_class_quality(average_report, average_accuracy, out_filename=out_qualite)
+
+        # Sauvegarde du modèle pour une éventuelle reprise de la prédiction
+        with open(out_model, 'wb') as f:
+            pickle.dump(clf, f)
+
+    # 6 --- apply on the whole image
+    # Prédiction bloc par bloc : l'image n'est jamais chargée entièrement en mémoire
+    predict_image_by_blocks(
+        clf,
+        image_filename,
+        out_classif,
+        block_size=BLOCK_SIZE,
+        out_confidence=out_confidence,
+        out_proba=out_proba,
+        band_indices=band_indices,
+        checkpoint_file=out_checkpoint,
+        overviews=OVERVIEWS,
+        model_file=out_model,
+        training_config=training_config
+        )
+
+    # 7 --- post-processing
+    # Tamisage et filtre majoritaire par tuiles, identiques à un traitement de l'image entière
+    final_map = out_classif
+    if MIN_MAPPING_UNIT or MAJORITY_SIZE:
+        postprocess_classification(
+            out_classif,
+            out_filtree,
+            min_size=MIN_MAPPING_UNIT,
+            majority_size=MAJORITY_SIZE,
+            overviews=OVERVIEWS
+            )
+        final_map = out_filtree
 
-# reshape
-ds = rw.open_image(image_filename)
-nb_row, nb_col, _ = rw.get_image_dimension(ds)
+    # 8 --- quicklook for the report
+    export_quicklook(
+        final_map, os.path.join(MY_FOLDER, 'apercu_carte_essences.png'), categorical=True
+        )
 
-img = np.zeros((nb_row, nb_col, 1), dtype='uint8')
-img[t_img[0], t_img[1], 0] = Y_predict
 
-# write image
-ds = rw.open_image(image_filename)
-rw.write_image(out_classif, img, data_set=ds, gdal_dtype=None,
-            transform=None, projection=None, driver_name=None,
-            nb_col=None, nb_ligne=None, nb_band=1)
+# Le post-traitement lance des processus qui réimportent ce script hors de la méthode 'fork'
+if __name__ == '__main__':
+    main()
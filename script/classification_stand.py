@@ -8,55 +8,88 @@ sys.path.append('/home/onyxia/work/projet_901_21/script')
 sys.path.append('/home/onyxia/work/libsigma')
 
 import os
+import numpy as np
 import geopandas as gpd
-from rasterstats import zonal_stats
 from sklearn.metrics import confusion_matrix
 
 # Personnal libraries
-from my_function import classify_polygon
+from my_function import (
+    classify_polygons,
+    zonal_statistics,
+    stand_probabilities,
+    write_stand_table
+)
 import plots
 
 MY_FOLDER_RESULT = '/home/onyxia/work/projet_901_21/results/data'
+TILE_SIZE = 2048  # Taille des tuiles des statistiques zonales
+N_JOBS = None  # Nombre de processus (None : tous les coeurs)
 
 # Charger les fichiers d'entrées
 raster_path = os.path.join(MY_FOLDER_RESULT, 'classif', 'carte_essences_echelle_pixel.tif')
 bd_foret_path = os.path.join(MY_FOLDER_RESULT, 'sample', 'Sample_BD_foret_T31TCJ.shp')
-
-# Charger le shapefile
-bd_foret = gpd.read_file(bd_foret_path)
-
-# Extraire les noms associés aux codes dynamiquement depuis la bd_foret
-if "Code" in bd_foret.columns and "Nom" in bd_foret.columns:
-    code_to_name = dict(zip(bd_foret["Code"], bd_foret["Nom"]))
-
-# Calculer la surface de chaque polygone en hectares
-bd_foret["surface_ha"] = bd_foret.geometry.area / 10000  # Conversion m² -> ha
-
-# Calculer les statistiques zonales
-stats = zonal_stats(bd_foret_path, raster_path, categorical=True, nodata=0)
-
-# Assigner les classes de peuplement
-bd_foret["codepredit"] = [classify_polygon(s, a) for s, a in zip(stats, bd_foret["surface_ha"])]
-
-# On drop la colonne de la surface car on ne doit pas l'avoir dans le fichier final
-bd_foret = bd_foret.drop(columns=["surface_ha"])
-
-# On réecrit le fichier de polygones d'échantillons avec la nouvelle colonne 'codepredit'
-bd_foret.to_file(bd_foret_path)
-
-# Calculer la matrice de confusion
-bd_foret_valid = bd_foret[bd_foret["codepredit"] != -1]  # Exclure les No Data
-
-y_true = bd_foret_valid["Code"]
-y_pred = bd_foret_valid["codepredit"]
-
-cm = confusion_matrix(y_true, y_pred)
-print("Matrice de confusion :")
-print(cm)
-
-unique_labels = sorted(set(y_true) | set(y_pred))
-plots.plot_cm(
-    cm,
-    labels=[str(label) for label in unique_labels],
-    out_filename="/home/onyxia/work/data/project/tmp_classif/cm_classif_stand.png"
-    )
+# Carte de probabilités de classification_pixel.py (out_proba) : si elle est donnée, les
+# peuplements sont classés à partir des probabilités moyennes plutôt que des labels
+proba_path = None  # ex. os.path.join(MY_FOLDER_RESULT, 'classif', 'carte_probas_echelle_pixel.tif')
+
+# Sorties : table des prédictions jointe aux polygones par leur identifiant BD Forêt
+out_table = os.path.join(MY_FOLDER_RESULT, 'classif', 'predictions_peuplements.parquet')
+out_vector = None  # ex. os.path.join(MY_FOLDER_RESULT, 'classif', 'carte_peuplements.gpkg')
+
+def main():
+    """Classe les peuplements à partir de la carte pixel et évalue le résultat."""
+    # Charger le shapefile
+    bd_foret = gpd.read_file(bd_foret_path)
+
+    # Extraire les noms associés aux codes dynamiquement depuis la bd_foret
+    if "Code" in bd_foret.columns and "Nom" in bd_foret.columns:
+        code_to_name = dict(zip(bd_foret["Code"], bd_foret["Nom"]))
+
+    # Calculer la surface de chaque polygone en hectares
+    bd_foret["surface_ha"] = bd_foret.geometry.area / 10000  # Conversion m² -> ha
+
+    if proba_path is None:
+        # Statistiques zonales par tuiles en parallèle (comptage des classes par polygone)
+        stats = zonal_statistics(
+            bd_foret, class_raster=raster_path, tile_size=TILE_SIZE, n_jobs=N_JOBS
+            )
+        counts, classes = stats["nb"], stats["classes"]
+    else:
+        # Probabilité moyenne de chaque classe par polygone, en une passe sur la carte
+        probabilities, classes, _ = stand_probabilities(
+            bd_foret, proba_path, TILE_SIZE, N_JOBS
+            )
+        counts = np.nan_to_num(probabilities)
+
+    # Assigner les classes de peuplement (règles de classify_polygon, tous les polygones)
+    bd_foret["codepredit"] = classify_polygons(counts, classes, bd_foret["surface_ha"])
+
+    # On drop la colonne de la surface car on ne doit pas l'avoir dans le fichier final
+    bd_foret = bd_foret.drop(columns=["surface_ha"])
+
+    # La couche d'échantillons n'est pas réécrite : seule la colonne 'codepredit' est
+    # sauvegardée, avec l'identifiant des polygones (export vecteur optionnel)
+    write_stand_table(bd_foret, {"codepredit": bd_foret["codepredit"]}, out_table,
+                      out_vector=out_vector)
+
+    # Calculer la matrice de confusion
+    bd_foret_valid = bd_foret[bd_foret["codepredit"] != -1]  # Exclure les No Data
+
+    y_true = bd_foret_valid["Code"]
+    y_pred = bd_foret_valid["codepredit"]
+
+    cm = confusion_matrix(y_true, y_pred)
+    print("Matrice de confusion :")
+    print(cm)
+
+    unique_labels = sorted(set(y_true) | set(y_pred))
+    plots.plot_cm(
+        cm,
+        labels=[str(label) for label in unique_labels],
+        out_filename="/home/onyxia/work/data/project/tmp_classif/cm_classif_stand.png"
+        )
+
+
+# Les processus des tuiles réimportent ce script avec les méthodes 'spawn' et 'forkserver'
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Classification directe des peuplements : chaque polygone de la BD Forêt est résumé par
+des statistiques par bande et par date, puis classé par un classifieur à l'échelle du
+peuplement. Le temps et la précision sont comparés à la chaîne actuelle (classification
+pixel puis vote `classify_polygon`) sur les mêmes polygones de test : ceux qui ont au
+moins un pixel valide, seuls classables par la chaîne objet.
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/libsigma')
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from rasterstats import zonal_stats
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, f1_score
+
+# personal libraries
+from my_function import (
+    extract_polygon_features,
+    extract_samples_from_polygons,
+    make_classifier,
+    predict_image_by_blocks,
+    classify_polygon
+)
+
+MY_FOLDER = '/home/onyxia/work/data/project/tmp_classif'
+MY_FOLDER_RESULT = '/home/onyxia/work/projet_901_21/results/data'
+SAMPLE_SHP = os.path.join(MY_FOLDER_RESULT, 'sample', 'Sample_BD_foret_T31TCJ.shp')
+image_filename = os.path.join(MY_FOLDER_RESULT, 'img_pretraitees', 'Serie_temp_S2_allbands.tif')
+
+# outputs
+out_features = os.path.join(MY_FOLDER, 'variables_peuplements.parquet')
+out_report = os.path.join(MY_FOLDER, 'comparaison_objet_pixel.csv')
+out_pixel_map = os.path.join(MY_FOLDER, 'carte_essences_comparaison.tif')
+
+codes_classif_pixel = [11, 12, 13, 14, 21, 22, 23, 24, 25]
+BACKEND = 'rf'
+STAND_PARAMS = {"max_depth": None, "n_estimators": 300, "max_samples": None}
+SEED = 0
+
+if not os.path.exists(MY_FOLDER):
+    os.makedirs(MY_FOLDER)
+
+bd_foret = gpd.read_file(SAMPLE_SHP).reset_index(drop=True)
+bd_foret["surface_ha"] = bd_foret.geometry.area / 10000
+
+# Polygones de test communs aux deux chaînes
+train_idx, test_idx = train_test_split(
+    np.arange(len(bd_foret)), test_size=0.3, random_state=SEED,
+    stratify=bd_foret["Code"] if bd_foret["Code"].value_counts().min() > 1 else None
+    )
+bd_train = bd_foret.iloc[train_idx]
+
+# --- Chaîne objet : statistiques par polygone puis classifieur de peuplements
+start = time.perf_counter()
+features = extract_polygon_features(bd_foret, image_filename)
+features_time = time.perf_counter() - start
+features.to_parquet(out_features)
+
+valid = features["nb_pixels"] > 0
+X_obj = features.drop(columns="nb_pixels").to_numpy(dtype=np.float32)
+train_obj = train_idx[valid.to_numpy()[train_idx]]
+test_obj = test_idx[valid.to_numpy()[test_idx]]
+
+clf_obj = make_classifier(BACKEND, **STAND_PARAMS, random_state=SEED)
+start = time.perf_counter()
+clf_obj.fit(X_obj[train_obj], bd_foret["Code"].to_numpy()[train_obj])
+obj_training_time = time.perf_counter() - start
+start = time.perf_counter()
+pred_obj = clf_obj.predict(X_obj[test_obj])
+obj_prediction_time = time.perf_counter() - start
+bd_test_obj = bd_foret.iloc[test_obj]
+
+# --- Chaîne pixel : classification pixel, statistiques zonales puis vote
+bd_train_pixel = bd_train[bd_train["Code"].isin(codes_classif_pixel)]
+start = time.perf_counter()
+X_pix, Y_pix, _, _ = extract_samples_from_polygons(bd_train_pixel, image_filename, 'Code')
+X_pix = X_pix.astype(np.float32, copy=False)
+pixel_extraction_time = time.perf_counter() - start
+
+clf_pix = make_classifier(BACKEND, random_state=SEED)
+start = time.perf_counter()
+clf_pix.fit(X_pix, Y_pix.ravel())
+pixel_training_time = time.perf_counter() - start
+del X_pix, Y_pix
+
+start = time.perf_counter()
+predict_image_by_blocks(clf_pix, image_filename, out_pixel_map)
+stats = zonal_stats(bd_test_obj, out_pixel_map, categorical=True, nodata=0)
+pred_pix = np.array([classify_polygon(s, a) for s, a in zip(stats, bd_test_obj["surface_ha"])])
+pixel_prediction_time = time.perf_counter() - start
+os.remove(out_pixel_map)
+
+# --- Comparaison sur les mêmes polygones de test
+y_test = bd_test_obj["Code"].to_numpy()
+print(f"Polygones de test sans pixel valide (exclus des deux chaînes) : "
+      f"{len(test_idx) - len(test_obj)}")
+report = pd.DataFrame([
+    {
+        "chaine": "objet",
+        "temps_variables_s": features_time,
+        "temps_apprentissage_s": obj_training_time,
+        "temps_prediction_s": obj_prediction_time,
+        "nb_polygones_test": len(test_obj),
+        "oa": accuracy_score(y_test, pred_obj),
+        "f1_macro": f1_score(y_test, pred_obj, average="macro"),
+    },
+    {
+        "chaine": "pixel + classify_polygon",
+        "temps_variables_s": pixel_extraction_time,
+        "temps_apprentissage_s": pixel_training_time,
+        "temps_prediction_s": pixel_prediction_time,
+        "nb_polygones_test": len(test_obj),
+        "oa": accuracy_score(y_test, pred_pix),
+        "f1_macro": f1_score(y_test, pred_pix, average="macro"),
+    },
+])
+report.to_csv(out_report, index=False)
+print(report.to_string(index=False))
+print(f"Comparaison sauvegardée dans {out_report}")
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Compaction de la forêt aléatoire : recherche du plus petit couple (nombre d'arbres,
+profondeur) qui garde le F1 de chaque classe dans la tolérance, export de la forêt
+compacte (pickle scikit-learn, utilisable par classification_pixel.py et
+prediction_service.py) et comparaison de la taille du modèle et du débit de prédiction
+avant / après.
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/libsigma')
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import os
+import time
+import pickle
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from osgeo import gdal
+from sklearn.model_selection import train_test_split
+
+# personal libraries
+from my_function import (
+    extract_samples_from_polygons,
+    compact_forest,
+    predict_image_by_blocks
+)
+
+MY_FOLDER = '/home/onyxia/work/data/project/tmp_classif'
+MY_FOLDER_RESULT = '/home/onyxia/work/projet_901_21/results/data'
+SAMPLE_SHP = os.path.join(MY_FOLDER_RESULT, 'sample', 'Sample_BD_foret_T31TCJ.shp')
+image_filename = os.path.join(MY_FOLDER_RESULT, 'img_pretraitees', 'Serie_temp_S2_allbands.tif')
+
+# outputs
+out_search = os.path.join(MY_FOLDER, 'compaction_recherche.csv')
+out_report = os.path.join(MY_FOLDER, 'compaction_rapport.csv')
+out_model = os.path.join(MY_FOLDER, 'modele_compact.pkl')
+
+codes_classif_pixel = [11, 12, 13, 14, 21, 22, 23, 24, 25]
+TOLERANCE = 0.02  # Perte de F1 tolérée par classe
+MAX_PER_CLASS = 20000
+SEED = 0
+
+if not os.path.exists(MY_FOLDER):
+    os.makedirs(MY_FOLDER)
+
+bd_foret = gpd.read_file(SAMPLE_SHP)
+bd_foret_filtree = bd_foret[bd_foret['Code'].isin(codes_classif_pixel)]
+X, Y, _, _ = extract_samples_from_polygons(
+    bd_foret_filtree, image_filename, 'Code', max_per_class=MAX_PER_CLASS, seed=SEED
+    )
+X = X.astype(np.float32, copy=False)
+X_train, X_test, Y_train, Y_test = train_test_split(
+    X, Y.ravel(), test_size=0.3, stratify=Y.ravel(), random_state=SEED
+    )
+
+# Recherche de la forêt compacte
+compact, reference, search = compact_forest(
+    X_train, Y_train, X_test, Y_test, tolerance=TOLERANCE, params={"random_state": SEED}
+    )
+search.to_csv(out_search, index=False)
+with open(out_model, 'wb') as f:
+    pickle.dump(compact, f)
+
+dataset = gdal.Open(image_filename)
+nb_pixels = dataset.RasterXSize * dataset.RasterYSize
+dataset = None
+
+# Taille et débit de chaque version du modèle
+models = {
+    "reference": (reference, len(pickle.dumps(reference))),
+    "compacte": (compact, os.path.getsize(out_model)),
+}
+report = []
+for name, (model, size) in models.items():
+    out_classif = os.path.join(MY_FOLDER, f'carte_compaction_{name}.tif')
+    start = time.perf_counter()
+    predict_image_by_blocks(model, image_filename, out_classif)
+    prediction_time = time.perf_counter() - start
+    os.remove(out_classif)
+    report.append({
+        "modele": name,
+        "n_estimators": len(model.estimators_),
+        "taille_mo": size / 1024 ** 2,
+        "pixels_par_s": nb_pixels / prediction_time,
+        "accord_reference": np.mean(model.predict(X_test) == reference.predict(X_test)),
+    })
+
+report_df = pd.DataFrame(report)
+report_df.to_csv(out_report, index=False)
+print(report_df.to_string(index=False))
+print(f"Modèle compact sauvegardé dans {out_model}")
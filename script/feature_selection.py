@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Sélection des bandes/dates à partir des importances de la forêt aléatoire
+(impureté et permutation). Le rapport compare la précision et le débit de prédiction
+pour chaque taille de sous-ensemble et la sélection recommandée est sauvegardée en JSON,
+lisible par pre_traitement.py et classification_pixel.py.
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/libsigma')
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from osgeo import gdal
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, f1_score
+
+# personal libraries
+from my_function import (
+    extract_samples_from_polygons,
+    make_classifier,
+    predict_image_by_blocks,
+    rank_features,
+    stack_feature_names
+)
+
+MY_FOLDER = '/home/onyxia/work/data/project/tmp_classif'
+MY_FOLDER_RESULT = '/home/onyxia/work/projet_901_21/results/data'
+SAMPLE_SHP = os.path.join(MY_FOLDER_RESULT, 'sample', 'Sample_BD_foret_T31TCJ.shp')
+MASKED_BANDS_FOLDER = '/home/onyxia/work/data/project/pretraitement_masque'
+image_filename = os.path.join(MY_FOLDER_RESULT, 'img_pretraitees', 'Serie_temp_S2_allbands.tif')
+
+# outputs
+out_ranking = os.path.join(MY_FOLDER, 'importance_variables.csv')
+out_report = os.path.join(MY_FOLDER, 'rapport_selection_variables.csv')
+out_selection = os.path.join(MY_FOLDER, 'selection_bandes.json')
+
+codes_classif_pixel = [11, 12, 13, 14, 21, 22, 23, 24, 25]
+band_order = ["B2", "B3", "B4", "B5", "B6", "B7", "B8", "B8A", "B11", "B12"]
+BACKEND = 'rf'
+SUBSET_SIZES = [60, 40, 30, 20, 15, 10, 5]
+OA_TOLERANCE = 0.01  # Perte de précision globale acceptée par rapport à toutes les bandes
+MAX_PER_CLASS = 20000
+SEED = 0
+
+if not os.path.exists(MY_FOLDER):
+    os.makedirs(MY_FOLDER)
+
+# Noms des variables dans l'ordre de l'empilement (date puis bande)
+raster_files = [f for f in os.listdir(MASKED_BANDS_FOLDER) if f.endswith('.tif')]
+feature_names = stack_feature_names(raster_files, band_order)
+
+# Échantillons et séparation apprentissage / test
+bd_foret = gpd.read_file(SAMPLE_SHP)
+bd_foret_filtree = bd_foret[bd_foret['Code'].isin(codes_classif_pixel)]
+X, Y, _, _ = extract_samples_from_polygons(
+    bd_foret_filtree, image_filename, 'Code', max_per_class=MAX_PER_CLASS, seed=SEED
+    )
+X = X.astype(np.float32, copy=False)
+X_train, X_test, Y_train, Y_test = train_test_split(
+    X, Y.ravel(), test_size=0.3, stratify=Y.ravel(), random_state=SEED
+    )
+
+# Classement des variables avec le modèle appris sur toutes les bandes
+clf = make_classifier(BACKEND, random_state=SEED)
+clf.fit(X_train, Y_train)
+ranking = rank_features(clf, X_test, Y_test, feature_names, seed=SEED)
+ranking.to_csv(out_ranking, index=False)
+print(ranking.head(20).to_string(index=False))
+
+dataset = gdal.Open(image_filename)
+nb_pixels = dataset.RasterXSize * dataset.RasterYSize
+dataset = None
+
+# Précision et débit pour chaque taille de sous-ensemble
+report = []
+for size in SUBSET_SIZES:
+    indices = sorted(ranking["indice"].iloc[:size].tolist())
+    clf = make_classifier(BACKEND, random_state=SEED)
+    clf.fit(X_train[:, indices], Y_train)
+    Y_predict = clf.predict(X_test[:, indices])
+
+    # Débit mesuré en ne lisant que les bandes retenues
+    out_classif = os.path.join(MY_FOLDER, 'carte_selection_tmp.tif')
+    start = time.perf_counter()
+    predict_image_by_blocks(clf, image_filename, out_classif, band_indices=indices)
+    prediction_time = time.perf_counter() - start
+    os.remove(out_classif)
+
+    report.append({
+        "nb_variables": size,
+        "oa": accuracy_score(Y_test, Y_predict),
+        "f1_macro": f1_score(Y_test, Y_predict, average="macro"),
+        "pixels_par_s": nb_pixels / prediction_time,
+        "indices": indices,
+    })
+    print({k: v for k, v in report[-1].items() if k != "indices"})
+
+report_df = pd.DataFrame(report)
+report_df.drop(columns="indices").to_csv(out_report, index=False)
+
+# Plus petit sous-ensemble dont la précision reste dans la tolérance
+oa_max = report_df.loc[report_df["nb_variables"].idxmax(), "oa"]
+eligible = report_df[report_df["oa"] >= oa_max - OA_TOLERANCE]
+best = eligible.loc[eligible["nb_variables"].idxmin()]
+selection = {
+    "indices": [int(i) for i in best["indices"]],
+    "variables": [feature_names[i] for i in best["indices"]],
+    "oa": float(best["oa"]),
+    "oa_toutes_bandes": float(oa_max),
+}
+with open(out_selection, "w", encoding="utf-8") as f:
+    json.dump(selection, f, indent=2)
+
+print(report_df.drop(columns="indices").to_string(index=False))
+print(f"Sélection recommandée : {len(selection['indices'])} variables, sauvegardée dans {out_selection}")
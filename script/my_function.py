@@ -5,14 +5,35 @@
 
 import os
 import re
+import copy
+import json
+import time
+import hashlib
 import subprocess
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import geopandas as gpd
 import pandas as pd
 import matplotlib.pyplot as plt
 
 import numpy as np
-from osgeo import gdal
+from scipy import ndimage
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from shapely.geometry import box
+from osgeo import gdal, ogr, osr
+from sklearn.ensemble import (
+    RandomForestClassifier,
+    ExtraTreesClassifier,
+    HistGradientBoostingClassifier
+)
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import confusion_matrix, classification_report, accuracy_score, f1_score
+from sklearn.inspection import permutation_importance
 
 
 def rasterize(
@@ -283,60 +304,98 @@ def rasteriser_avec_gdal(
         raise
 
 
-def count_pixels_by_class(gdf, colonne_classe, classes_selectionnees):
-    """Compte le nombre de pixels par classe en rasterisant les polygones.
+def _grid_from_bounds(bounds, spatial_res):
+    """Grille (géotransformation, colonnes, lignes) couvrant une emprise, calée sur des
+    multiples de la résolution (comme l'option -tap de GDAL)."""
+    xmin, ymin, xmax, ymax = bounds
+    xmin = np.floor(xmin / spatial_res) * spatial_res
+    ymin = np.floor(ymin / spatial_res) * spatial_res
+    xmax = np.ceil(xmax / spatial_res) * spatial_res
+    ymax = np.ceil(ymax / spatial_res) * spatial_res
+    nb_col = int(round((xmax - xmin) / spatial_res))
+    nb_row = int(round((ymax - ymin) / spatial_res))
+    return (float(xmin), spatial_res, 0, float(ymax), 0, -spatial_res), nb_col, nb_row
+
+
+def count_pixels_by_polygon(
+    gdf,
+    colonne_classe,
+    ref_raster=None,
+    emprise=None,
+    spatial_res=10,
+    all_touched=False
+):
+    """Compte exactement les pixels de chaque polygone et de chaque classe, en mémoire.
+
+    Les polygones sont rasterisés une seule fois en mémoire (position du polygone + 1)
+    sur la grille de `ref_raster`, ou sinon sur une grille de résolution `spatial_res`
+    calée sur l'emprise ; un seul bincount donne le nombre de pixels de chaque polygone,
+    dont on déduit le total par classe.
 
     Args :
         gdf (GeoDataFrame) : GeoDataFrame contenant les polygones.
         colonne_classe (str) : Nom de la colonne contenant les valeurs des classes.
-        classes_selectionnees (list) : Liste des classes à analyser.
+        ref_raster (str) : Raster définissant la grille (ex. masque_foret.tif), optionnel.
+        emprise (GeoDataFrame) : Emprise de la grille si `ref_raster` n'est pas donné
+            (par défaut l'emprise des polygones).
+        spatial_res (float) : Résolution de la grille si `ref_raster` n'est pas donné.
+        all_touched (bool) : Si True, compte tous les pixels touchés par un polygone.
 
     Return :
-        dict : Un dictionnaire avec les classes comme clés et le nombre de pixels comme valeurs.
+        tuple : Pixels par polygone (Series alignée sur `gdf`) et pixels par classe (Series
+        indexée par code). Si des polygones se superposent, un pixel compte pour le dernier.
     """
-    # Créer des chemins temporaires pour les fichiers vecteur et raster
-    vecteur_temp = "/tmp/temp_vector.shp"
-    raster_temp = "/tmp/temp_raster.tif"
-    resolution_spatiale = 10  # Définir la résolution spatiale
+    if ref_raster is not None:
+        dataset = gdal.Open(ref_raster)
+        if dataset is None:
+            raise ValueError(f"Impossible d'ouvrir le raster '{ref_raster}'.")
+        geotransform, projection = dataset.GetGeoTransform(), dataset.GetProjection()
+        nb_col, nb_row = dataset.RasterXSize, dataset.RasterYSize
+        dataset = None
+    else:
+        bounds = (emprise if emprise is not None else gdf).total_bounds
+        geotransform, nb_col, nb_row = _grid_from_bounds(bounds, spatial_res)
+        projection = gdf.crs.to_wkt()
+
+    geometries = gdf.geometry.to_numpy()
+    keep = np.array([g is not None and not g.is_empty for g in geometries], dtype=bool)
+    ids = _rasterize_window(
+        geometries[keep], np.arange(1, len(gdf) + 1)[keep], geotransform, projection,
+        (0, 0, nb_col, nb_row), all_touched=all_touched
+    )
 
-    try:
-        # Enregistrer le GeoDataFrame en tant que shapefile temporaire
-        gdf.to_file(vecteur_temp)
-
-        # Rasteriser le shapefile
-        rasteriser_avec_gdal(
-            in_vector=vecteur_temp,
-            out_image=raster_temp,
-            resolution_spatiale=resolution_spatiale,
-            nom_champ=colonne_classe
-        )
+    pixels = np.bincount(ids.ravel(), minlength=len(gdf) + 1)[1:]
+    pixels_by_polygon = pd.Series(pixels, index=gdf.index, name="nb_pixels")
+    pixels_by_class = pixels_by_polygon.groupby(gdf[colonne_classe].to_numpy()).sum()
+    return pixels_by_polygon, pixels_by_class
 
-        # Ouvrir le raster et compter les pixels
-        raster_ds = gdal.Open(raster_temp)
-        raster_array = raster_ds.GetRasterBand(1).ReadAsArray()
 
-        # Compter les pixels pour chaque classe
-        compteur_pixels = {}
-        for classe in classes_selectionnees:
-            compteur_pixels[classe] = np.sum(raster_array == classe)
+def count_pixels_by_class(gdf, colonne_classe, classes_selectionnees, ref_raster=None,
+                          spatial_res=10):
+    """Compte le nombre de pixels par classe en rasterisant les polygones en mémoire.
 
-        # Supprimer les fichiers temporaires
-        os.remove(vecteur_temp)
-        os.remove(raster_temp)
+    Args :
+        gdf (GeoDataFrame) : GeoDataFrame contenant les polygones.
+        colonne_classe (str) : Nom de la colonne contenant les valeurs des classes.
+        classes_selectionnees (list) : Liste des classes à analyser.
+        ref_raster (str) : Raster définissant la grille (voir `count_pixels_by_polygon`).
+        spatial_res (float) : Résolution de la grille si `ref_raster` n'est pas donné.
 
-        return compteur_pixels
+    Return :
+        dict : Un dictionnaire avec les classes comme clés et le nombre de pixels comme valeurs.
+    """
+    try:
+        _, pixels_by_class = count_pixels_by_polygon(
+            gdf, colonne_classe, ref_raster=ref_raster, spatial_res=spatial_res
+        )
+        return {
+            classe: int(pixels_by_class.get(classe, 0)) for classe in classes_selectionnees
+        }
 
     except Exception as e:
         logging.error("Erreur lors du comptage des pixels : %e", e)
         return {}
 
-    finally:
-        # S'assurer que les fichiers temporaires sont supprimés
-        if os.path.exists(vecteur_temp):
-            os.remove(vecteur_temp)
-        if os.path.exists(raster_temp):
-            os.remove(raster_temp)
-
 
 def prepare_violin_plot_data(gdf, class_column, pixel_column):
     """Prépare les données pour un "violin plot".
@@ -373,7 +432,9 @@ def clip_raster(
     data_type,
     driver,
     proj="EPSG:2154",
-    no_data=0
+    no_data=0,
+    overviews=None,
+    overview_resampling="AVERAGE"
 ):
     """Fonction permettant de découper un raster en fonction d'une couche de référence.
 
@@ -387,6 +448,8 @@ def clip_raster(
         driver (str): Driver de format à utiliser pour la sortie (par exemple, 'GTiff').
         proj (str): Projection par défaut EPSG:2154
         no_data (int): Valeur de no data
+        overviews (str): Aperçus 'internal' ou 'external' construits à la fin (None : aucun).
+        overview_resampling (str): Méthode des aperçus ('AVERAGE', ou 'MODE' pour des classes).
     
     Exceptions :
         ValueError: Si un paramètre est invalide ou si la commande échoue.
@@ -445,6 +508,9 @@ def clip_raster(
     if not os.path.exists(out_image):
         raise ValueError(f"L'image de sortie '{out_image}' n'a pas été créée.")
 
+    if overviews is not None:
+        build_overviews(out_image, overview_resampling, overviews)
+
     logging.info("Découpage terminée, fichier sauvegardé à : %o", out_image)
 
 
@@ -455,7 +521,9 @@ def apply_mask(
     data_type,
     driver,
     expression,
-    no_data=0
+    no_data=0,
+    overviews=None,
+    overview_resampling="AVERAGE"
 ):
     """Fonction permettant d'appliquer un masque sur un raster.
 
@@ -467,6 +535,8 @@ def apply_mask(
         driver (str): Driver de format à utiliser pour la sortie (par exemple, 'GTiff').
         expression (str): Expression à effectuer pour le masque
         no_data (int): Valeur de no data
+        overviews (str): Aperçus 'internal' ou 'external' construits à la fin (None : aucun).
+        overview_resampling (str): Méthode des aperçus ('AVERAGE', ou 'MODE' pour des classes).
     
     Exceptions :
         ValueError: Si un paramètre est invalide ou si la commande échoue.
@@ -517,6 +587,9 @@ def apply_mask(
     if not os.path.exists(out_image):
         raise ValueError(f"L'image de sortie '{out_image}' n'a pas été créée.")
 
+    if overviews is not None:
+        build_overviews(out_image, overview_resampling, overviews)
+
     logging.info("Calcul terminée, fichier sauvegardé à : %o", out_image)
 
 
@@ -526,7 +599,10 @@ def concat_bands(
     data_type,
     no_data,
     separate=True,
-    output_format="GTiff"):
+    output_format="GTiff",
+    overviews=None,
+    overview_resampling="AVERAGE",
+    describe_bands=True):
     """Fusionne plusieurs rasters mono-bande en un seul fichier raster.
 
     Args:
@@ -536,6 +612,10 @@ def concat_bands(
         no_data (int): Valeur des nodatas
         separate (bool): Si True, chaque raster sera placé dans une bande distincte.
         output_format (str): Format du fichier de sortie (par défaut "GTiff").
+        overviews (str): Aperçus 'internal' ou 'external' construits à la fin (None : aucun).
+        overview_resampling (str): Méthode des aperçus ('AVERAGE', ou 'MODE' pour des classes).
+        describe_bands (bool): Si True, chaque bande est décrite par le nom de son fichier
+            (date et bande Sentinel-2), relu ensuite par `band_dates`.
         
     """
     # Définir la commande avec les paramètres appropriés
@@ -550,6 +630,7 @@ def concat_bands(
 
     # Construire la commande avec les paramètres
     separate_flag = "-separate" if separate else ""
+    band_names = [os.path.splitext(os.path.basename(f))[0] for f in input_files]
     input_files = " ".join(input_files)
     cmd = cmd_pattern.format(
         output_raster=output_file,
@@ -577,6 +658,15 @@ def concat_bands(
         error_msg = e.stderr.decode() if e.stderr else "Erreur inconnue."
         raise ValueError(f"Erreur lors de l'exécution de gdal_merge.py : {error_msg}") from e
 
+    if describe_bands and separate:
+        dataset = gdal.Open(output_file, gdal.GA_Update)
+        for index, name in enumerate(band_names, start=1):
+            dataset.GetRasterBand(index).SetDescription(name)
+        dataset = None
+
+    if overviews is not None:
+        build_overviews(output_file, overview_resampling, overviews)
+
 
 def calculate_ndvi(
     input_folder,
@@ -671,14 +761,112 @@ def calculate_ndvi(
             logging.warning("Bandes nécessaires (B4, B8) manquantes pour la date %d", date)
 
 
-def analyze_phenology_gdal_alternative(ndvi_raster, shapefile, output_folder, dates):
+def band_dates(raster):
+    """Dates 'AAAA-MM-JJ' des bandes d'un empilement, lues dans leurs descriptions.
+
+    Les descriptions sont les noms des fichiers empilés (voir `concat_bands`), qui
+    contiennent la date d'acquisition Sentinel-2 (AAAAMMJJ-HHMMSS).
+
+    Return :
+        list : Une date par bande, ou None si une bande n'a pas de date.
+    """
+    dataset = gdal.Open(raster)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{raster}'.")
+    dates = []
+    for band in range(1, dataset.RasterCount + 1):
+        description = dataset.GetRasterBand(band).GetDescription()
+        match = re.search(r"(\d{4})(\d{2})(\d{2})-\d{6}", description)
+        if match is None:
+            return None
+        dates.append("-".join(match.groups()))
+    return dates
+
+
+def class_band_statistics(
+    raster,
+    gdf,
+    class_column,
+    classes,
+    block_size=512,
+    no_data=None,
+    all_touched=False
+):
+    """Moyenne et écart type de chaque bande pour chaque classe, en une lecture du raster.
+
+    Les codes des classes sont rasterisés une seule fois sur la grille du raster, puis le
+    raster est lu par blocs : effectifs, sommes et sommes des carrés de toutes les bandes
+    et de toutes les classes sont cumulés par des bincounts pondérés. Les valeurs no data
+    ou non finies sont ignorées bande par bande.
+
+    Args :
+        raster (str) : Raster multibandes (ex. série NDVI).
+        gdf (GeoDataFrame) : Polygones, dans la projection du raster.
+        class_column (str) : Colonne des codes de classe.
+        classes (list) : Codes des classes à résumer.
+        block_size (int) : Taille des blocs lus (par défaut 512 pixels).
+        no_data (float) : Valeur ignorée (par défaut celle du raster).
+        all_touched (bool) : Si True, prend tous les pixels touchés par un polygone.
+
+    Return :
+        tuple : Effectifs, moyennes et écarts types (n_classes, n_bandes).
+    """
+    dataset = gdal.Open(raster)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{raster}'.")
+    nb_band = dataset.RasterCount
+    if no_data is None:
+        no_data = dataset.GetRasterBand(1).GetNoDataValue()
+    classes = np.asarray(classes, dtype=np.int64)
+
+    selected = gdf[gdf[class_column].isin(classes)]
+    codes = _rasterize_window(
+        selected.geometry, selected[class_column], dataset.GetGeoTransform(),
+        dataset.GetProjection(), (0, 0, dataset.RasterXSize, dataset.RasterYSize),
+        all_touched=all_touched
+    )
+
+    size = len(classes) * nb_band
+    counts, sums, squares = np.zeros(size), np.zeros(size), np.zeros(size)
+    band_index = np.arange(nb_band)[:, np.newaxis]
+    windows = _iter_blocks(dataset.RasterXSize, dataset.RasterYSize, block_size)
+    for xoff, yoff, xsize, ysize in windows:
+        class_index = _class_index(codes[yoff:yoff + ysize, xoff:xoff + xsize].ravel(), classes)
+        inside = class_index >= 0
+        if not inside.any():
+            continue
+        values = _read_window(dataset, (xoff, yoff, xsize, ysize)).reshape(nb_band, -1)
+        values = values[:, inside].astype(np.float64)
+        valid = np.isfinite(values)
+        if no_data is not None:
+            valid &= values != no_data
+        # Une case par couple (classe, bande) : toutes les bandes en un seul bincount
+        keys = (class_index[inside][np.newaxis, :] * nb_band + band_index)[valid]
+        values = values[valid]
+        counts += np.bincount(keys, minlength=size)
+        sums += np.bincount(keys, weights=values, minlength=size)
+        squares += np.bincount(keys, weights=values * values, minlength=size)
+    dataset = None
+
+    counts = counts.reshape(len(classes), nb_band)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums.reshape(counts.shape) / counts
+        std = np.sqrt(np.maximum(squares.reshape(counts.shape) / counts - mean ** 2, 0))
+    return counts.astype(np.int64), mean, std
+
+
+def analyze_phenology_gdal_alternative(ndvi_raster, shapefile, output_folder, dates=None):
     """Analyse la phénologie des classes de la BD forêt classifié et produit un graphique amélioré.
 
+    Les statistiques de toutes les bandes et de toutes les classes sont calculées en une
+    lecture du raster (voir `class_band_statistics`).
+
     Args :
         ndvi_raster (str) : Chemin du raster multibandes NDVI
         shapefile (str) : Chemin du shapefile de la BD forêt classifié
         output_folder (str) : Dossier pour sauvegarder les résultats
-        dates (list) : Liste des dates associées aux bandes du raster NDVI
+        dates (list) : Liste des dates associées aux bandes du raster NDVI (par défaut, lues
+            dans les descriptions des bandes)
 
     """
     # Classes pertinentes
@@ -686,9 +874,6 @@ def analyze_phenology_gdal_alternative(ndvi_raster, shapefile, output_folder, da
     
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
-    
-    if not os.path.exists("/home/onyxia/work/data/project/tmp"):
-        os.makedirs("/home/onyxia/work/data/project/tmp")
 
     # Charger les noms des classes à partir du shapefile
     gdf = gpd.read_file(shapefile)
@@ -697,68 +882,21 @@ def analyze_phenology_gdal_alternative(ndvi_raster, shapefile, output_folder, da
         for _, row in gdf.iterrows() if row['Code'] in selected_classes
     }
 
-    # Initialisation des résultats
-    stats = {cls: {"mean": [], "std": []} for cls in selected_classes}
-    bands_count = 6  # Supposons que le raster NDVI contient 6 bandes temporelles
-
-    for i in range(1, bands_count + 1):
-        logging.info("Traitement de la bande %i...", i)
-        temp_band_raster = f"/home/onyxia/work/data/project/tmp/temp_band_{i}.tif"
-
-        # Extraire la bande NDVI i
-        cmd_extract_band = (
-            f"gdal_translate -b {i} {ndvi_raster} {temp_band_raster} "
-            f"-of GTiff -q"
-        )
-        subprocess.run(cmd_extract_band, shell=True, check=True)
-
-        for cls in selected_classes:
-            logging.info("Traitement de la classe %c...", cls)
+    # Dates et nombre de bandes tirés de l'empilement lui-même
+    stack_dates = band_dates(ndvi_raster)
+    if stack_dates is not None:
+        dates = stack_dates
+    _, means, stds = class_band_statistics(ndvi_raster, gdf, "Code", selected_classes)
+    if dates is None:
+        dates = [f"Bande {i}" for i in range(1, means.shape[1] + 1)]
+    if len(dates) != means.shape[1]:
+        raise ValueError(f"{len(dates)} dates pour {means.shape[1]} bandes dans '{ndvi_raster}'.")
 
-            # Créer un masque pour la classe
-            temp_mask = f"/home/onyxia/work/data/project/tmp/temp_mask_{cls}.shp"
-            cmd_create_mask = (
-                f"ogr2ogr -where \"Code={cls}\" {temp_mask} {shapefile}"
-            )
-            subprocess.run(cmd_create_mask, shell=True, check=True)
-
-            # Découper le raster par la classe
-            temp_cropped_raster = f"/home/onyxia/work/data/project/tmp/temp_cropped_band_{i}_class_{cls}.tif"
-            cmd_crop_raster = (
-                f"gdalwarp -cutline {temp_mask} -crop_to_cutline -dstnodata -9999 "
-                f"{temp_band_raster} {temp_cropped_raster}"
-            )
-            subprocess.run(cmd_crop_raster, shell=True, check=True)
-
-            # Obtenir les statistiques avec gdalinfo
-            cmd_get_stats = f"gdalinfo -stats {temp_cropped_raster}"
-            result = subprocess.run(
-                cmd_get_stats,
-                shell=True,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            stats_output = result.stdout.decode()
-
-            # Extraire les statistiques
-            mean_value, std_value = None, None
-            for line in stats_output.split("\n"):
-                if "STATISTICS_MEAN=" in line:
-                    mean_value = float(line.split("=")[-1])
-                if "STATISTICS_STDDEV=" in line:
-                    std_value = float(line.split("=")[-1])
-
-            # Sauvegarder les résultats
-            stats[cls]["mean"].append(mean_value)
-            stats[cls]["std"].append(std_value)
-
-            # Nettoyer les fichiers temporaires
-            os.remove(temp_mask)
-            os.remove(temp_cropped_raster)
-
-        # Supprimer le raster temporaire
-        os.remove(temp_band_raster)
+    # Initialisation des résultats
+    stats = {
+        cls: {"mean": list(means[i]), "std": list(stds[i])}
+        for i, cls in enumerate(selected_classes)
+    }
 
     # Création du graphique
     logging.info("Création du graphique des signatures temporelles...")
@@ -917,6 +1055,60 @@ def classify_polygon(stats, area_ha):
         else:
             return 29
 
+# Codes des essences de la carte pixel, par groupe, dans l'ordre de `classify_polygon`
+CODES_FEUILLUS = [11, 12, 13, 14]
+CODES_CONIFERES = [21, 22, 23, 24, 25]
+
+
+def classify_polygons(counts, classes, area_ha):
+    """Version vectorisée de `classify_polygon` pour tous les polygones à la fois.
+
+    Les pourcentages sont calculés avec les mêmes opérations que `classify_polygon`
+    (somme entière / total * 100), les codes prédits sont donc identiques. `counts` peut
+    aussi contenir des probabilités moyennes par classe (voir `stand_probabilities`).
+
+    Args :
+        counts (ndarray | csr_matrix) : Pixels par polygone et par classe.
+        classes (list) : Code de chaque colonne de `counts`.
+        area_ha (array-like) : Surface de chaque polygone en hectares.
+
+    Return :
+        ndarray : Code prédit par polygone (-1 pour les polygones sans pixel).
+    """
+    counts = counts.toarray() if hasattr(counts, "toarray") else np.asarray(counts)
+    # Les comptages entiers restent entiers (mêmes opérations que classify_polygon) ; des
+    # effectifs réels (probabilités moyennes) sont aussi acceptés
+    dtype = np.int64 if np.issubdtype(counts.dtype, np.integer) else np.float64
+    counts = counts.astype(dtype, copy=False)
+    area_ha = np.asarray(area_ha, dtype=np.float64)
+    classes = list(np.asarray(classes).tolist())
+
+    def column(code):
+        if code not in classes:
+            return np.zeros(len(counts), dtype=dtype)
+        return counts[:, classes.index(code)]
+
+    total = counts.sum(axis=1)
+    empty = total == 0
+    total = np.where(empty, 1, total)
+    feuillus = sum(column(code) for code in CODES_FEUILLUS) / total * 100
+    coniferes = sum(column(code) for code in CODES_CONIFERES) / total * 100
+
+    mixed = np.where(coniferes > feuillus, 28, 29)
+    small = np.select([feuillus > 75, coniferes > 75], [16, 27], mixed)
+    large = np.select([feuillus > 75, coniferes > 75], [15, 26], mixed)
+
+    # Essence dominante (plus de 75 %) : au plus une par polygone, celle du plus grand comptage
+    dominant_codes = CODES_FEUILLUS + CODES_CONIFERES
+    essences = np.stack([column(code) for code in dominant_codes], axis=1)
+    best = essences.argmax(axis=1)
+    dominant = essences[np.arange(len(essences)), best] / total * 100 > 75
+    large = np.where(dominant, np.asarray(dominant_codes)[best], large)
+
+    predicted = np.where(area_ha < 2, small, large)
+    return np.where(empty, -1, predicted)
+
+
 def custom_sort_key(filename, band_order):
     """Permet de filtrer les fichiers des bandes pour qu'il soit ordonné pour la concaténation
 
@@ -936,3 +1128,2803 @@ def custom_sort_key(filename, band_order):
         return (date, band_order.index(band))
     # Clé par défaut pour les fichiers ne correspondant pas au schéma
     return ("", float('inf'))
+
+
+def _polygon_window(bounds, geotransform, nb_col, nb_row):
+    """Calcule la fenêtre pixel (xoff, yoff, xsize, ysize) couvrant l'emprise d'un polygone.
+
+    Args :
+        bounds (tuple) : Emprise du polygone (min_x, min_y, max_x, max_y).
+        geotransform (tuple) : Géotransformation GDAL du raster de référence.
+        nb_col (int) : Nombre de colonnes du raster.
+        nb_row (int) : Nombre de lignes du raster.
+
+    Return :
+        tuple : Fenêtre (xoff, yoff, xsize, ysize) ou None si le polygone est hors du raster.
+    """
+    min_x, min_y, max_x, max_y = bounds
+    start_col = max(0, int(np.floor((min_x - geotransform[0]) / geotransform[1])))
+    end_col = min(nb_col, int(np.ceil((max_x - geotransform[0]) / geotransform[1])))
+    start_row = max(0, int(np.floor((max_y - geotransform[3]) / geotransform[5])))
+    end_row = min(nb_row, int(np.ceil((min_y - geotransform[3]) / geotransform[5])))
+
+    if end_col <= start_col or end_row <= start_row:
+        return None
+    return start_col, start_row, end_col - start_col, end_row - start_row
+
+
+def _open_stack(image_filename):
+    """Ouvre une image, ou plusieurs images sur la même grille dont les bandes se suivent.
+
+    Args :
+        image_filename (str | list) : Chemin d'une image ou liste de chemins (ex. empilement
+            Sentinel-2 puis métriques phénologiques).
+
+    Return :
+        list : Datasets GDAL ouverts, le premier sert de référence pour la grille.
+
+    Exceptions :
+        ValueError : Si une image ne peut pas être ouverte ou n'a pas la même taille.
+    """
+    filenames = [image_filename] if isinstance(image_filename, str) else list(image_filename)
+    datasets = []
+    for filename in filenames:
+        dataset = gdal.Open(filename)
+        if dataset is None:
+            raise ValueError(f"Impossible d'ouvrir l'image '{filename}'.")
+        if datasets and (dataset.RasterXSize, dataset.RasterYSize) != (
+            datasets[0].RasterXSize, datasets[0].RasterYSize
+        ):
+            raise ValueError(f"L'image '{filename}' n'est pas sur la même grille que '{filenames[0]}'.")
+        datasets.append(dataset)
+    return datasets
+
+
+def _stack_bands(datasets, band_indices=None):
+    """Liste des couples (dataset, numéro de bande GDAL) de l'empilement, ou de sa sélection."""
+    datasets = datasets if isinstance(datasets, (list, tuple)) else [datasets]
+    bands = [(dataset, band) for dataset in datasets for band in range(1, dataset.RasterCount + 1)]
+    if band_indices is None:
+        return bands
+    return [bands[int(index)] for index in band_indices]
+
+
+def _stack_nodata(datasets, band_indices=None, default=0):
+    """Valeur de no data de chaque bande lue (celle du raster, sinon `default`)."""
+    values = []
+    for dataset, band in _stack_bands(datasets, band_indices):
+        value = dataset.GetRasterBand(band).GetNoDataValue()
+        values.append(default if value is None else value)
+    return np.asarray(values)
+
+
+def _read_window(dataset, window, band_indices=None):
+    """Lit une fenêtre d'un raster, éventuellement limitée à une sélection de bandes.
+
+    Args :
+        dataset (gdal.Dataset | list) : Raster ouvert, ou liste de rasters empilés.
+        window (tuple) : Fenêtre (xoff, yoff, xsize, ysize) à lire.
+        band_indices (list) : Positions (à partir de 0) des bandes à lire dans l'empilement,
+            toutes par défaut.
+
+    Return :
+        ndarray : Tableau (n_bandes, ysize, xsize), dans le type natif du raster (ou le type
+        commun aux rasters empilés).
+    """
+    xoff, yoff, xsize, ysize = window
+    if band_indices is None and not isinstance(dataset, (list, tuple)):
+        block = dataset.ReadAsArray(xoff, yoff, xsize, ysize)
+        return block[np.newaxis, :, :] if block.ndim == 2 else block
+    if band_indices is None and len(dataset) == 1:
+        return _read_window(dataset[0], window)
+
+    # Seules les bandes sélectionnées sont lues sur le disque
+    return np.stack([
+        ds.GetRasterBand(band).ReadAsArray(xoff, yoff, xsize, ysize)
+        for ds, band in _stack_bands(dataset, band_indices)
+    ])
+
+
+def _rasterize_window(
+    geometries,
+    values,
+    geotransform,
+    projection,
+    window,
+    data_type=gdal.GDT_Int32,
+    all_touched=False
+):
+    """Rasterise des géométries en mémoire sur une fenêtre de la grille de référence.
+
+    Args :
+        geometries (iterable) : Géométries shapely à graver.
+        values (iterable) : Valeur à graver pour chaque géométrie.
+        geotransform (tuple) : Géotransformation GDAL de la grille complète.
+        projection (str) : Projection WKT de la grille.
+        window (tuple) : Fenêtre (xoff, yoff, xsize, ysize) à rasteriser.
+        data_type (int) : Type GDAL du raster en mémoire (par défaut Int32).
+        all_touched (bool) : Si True, grave tous les pixels touchés par la géométrie.
+
+    Return :
+        ndarray : Tableau (ysize, xsize) des valeurs gravées, 0 en dehors des géométries.
+    """
+    xoff, yoff, xsize, ysize = window
+
+    # Raster en mémoire calé sur la fenêtre de la grille de référence
+    raster_ds = gdal.GetDriverByName("MEM").Create("", xsize, ysize, 1, data_type)
+    raster_ds.SetGeoTransform((
+        geotransform[0] + xoff * geotransform[1], geotransform[1], 0,
+        geotransform[3] + yoff * geotransform[5], 0, geotransform[5]
+    ))
+    raster_ds.SetProjection(projection)
+
+    # Couche vecteur en mémoire avec la valeur à graver en attribut
+    vector_ds = ogr.GetDriverByName("Memory").CreateDataSource("")
+    couche = vector_ds.CreateLayer(
+        "polygones",
+        srs=osr.SpatialReference(wkt=projection),
+        geom_type=ogr.wkbUnknown
+    )
+    couche.CreateField(ogr.FieldDefn("valeur", ogr.OFTInteger64))
+    definition = couche.GetLayerDefn()
+    for geometry, value in zip(geometries, values):
+        feature = ogr.Feature(definition)
+        feature.SetField("valeur", int(value))
+        feature.SetGeometry(ogr.CreateGeometryFromWkb(geometry.wkb))
+        couche.CreateFeature(feature)
+
+    options = ["ATTRIBUTE=valeur"]
+    if all_touched:
+        options.append("ALL_TOUCHED=TRUE")
+    gdal.RasterizeLayer(raster_ds, [1], couche, options=options)
+
+    return raster_ds.GetRasterBand(1).ReadAsArray()
+
+
+class StackReader:
+    """Lecture par fenêtres d'une image, ou d'un empilement d'images sur la même grille.
+
+    Regroupe l'ouverture de l'empilement, la sélection des bandes et leurs valeurs de no
+    data, pour lire une emprise ou un polygone sans parcourir toute l'image.
+
+    Args :
+        image_filename (str | list) : Chemin de l'image, ou liste d'images empilées.
+        band_indices (list) : Positions (à partir de 0) des bandes à lire, toutes par défaut.
+        no_data (int) : Valeur de no data des bandes qui n'en déclarent pas.
+
+    Exceptions :
+        ValueError : Si une image ne peut pas être ouverte ou n'est pas sur la même grille.
+    """
+
+    def __init__(self, image_filename, band_indices=None, no_data=0):
+        self.datasets = _open_stack(image_filename)
+        self.band_indices = band_indices
+        self.nodata_values = _stack_nodata(self.datasets, band_indices, no_data)
+        self.geotransform = self.datasets[0].GetGeoTransform()
+        self.projection = self.datasets[0].GetProjection()
+        self.nb_col = self.datasets[0].RasterXSize
+        self.nb_row = self.datasets[0].RasterYSize
+
+    @property
+    def nb_band(self):
+        """Nombre de bandes lues."""
+        return len(self.nodata_values)
+
+    def window(self, bounds):
+        """Fenêtre pixel (xoff, yoff, xsize, ysize) d'une emprise, None si hors de l'image."""
+        return _polygon_window(bounds, self.geotransform, self.nb_col, self.nb_row)
+
+    def mask(self, geometry, window, all_touched=False):
+        """Masque booléen (ysize, xsize) des pixels d'une géométrie sur une fenêtre."""
+        return _rasterize_window(
+            [geometry], [1], self.geotransform, self.projection, window,
+            data_type=gdal.GDT_Byte, all_touched=all_touched
+        ).astype(bool)
+
+    def read(self, window):
+        """Lit une fenêtre des bandes sélectionnées.
+
+        Return :
+            tuple : (tableau (n_bandes, ysize, xsize), masque des pixels valides, c'est-à-dire
+            dont au moins une bande n'est pas en no data).
+        """
+        block = _read_window(self.datasets, window, self.band_indices)
+        valid = np.any(block != self.nodata_values[:, np.newaxis, np.newaxis], axis=0)
+        return block, valid
+
+    def close(self):
+        """Ferme les images."""
+        self.datasets = None
+
+
+def _reservoir_update(reservoir, items, capacity, rng):
+    """Met à jour un réservoir d'échantillons (algorithme R) avec un lot de nouveaux éléments.
+
+    Le tirage est vectorisé sur le lot mais reste équivalent à un traitement élément par
+    élément : chaque élément d'index global k remplace une case tirée dans [0, k] si elle
+    est inférieure à la capacité.
+
+    Args :
+        reservoir (dict) : Réservoir {"seen": nb d'éléments vus, "data": {nom: tableau}}.
+        items (dict) : Nouveaux éléments {nom: tableau}, tous de même longueur.
+        capacity (int) : Taille maximale du réservoir.
+        rng (Generator) : Générateur aléatoire numpy.
+    """
+    n_new = len(next(iter(items.values())))
+    seen = reservoir["seen"]
+    data = reservoir["data"]
+
+    if not data:
+        for name, values in items.items():
+            data[name] = np.empty((capacity,) + values.shape[1:], dtype=values.dtype)
+
+    # Phase de remplissage tant que le réservoir n'est pas plein
+    n_fill = min(max(capacity - seen, 0), n_new)
+    if n_fill:
+        for name, values in items.items():
+            data[name][seen:seen + n_fill] = values[:n_fill]
+
+    # Phase de remplacement
+    if n_new > n_fill:
+        positions = np.arange(seen + n_fill, seen + n_new)
+        slots = rng.integers(0, positions + 1)
+        accepted = np.nonzero(slots < capacity)[0]
+        # Si plusieurs éléments visent la même case, seul le dernier est conservé
+        slots_rev, first_rev = np.unique(slots[accepted][::-1], return_index=True)
+        last = accepted[::-1][first_rev] + n_fill
+        for name, values in items.items():
+            data[name][slots_rev] = values[last]
+
+    reservoir["seen"] = seen + n_new
+
+
+def extract_samples_from_polygons(
+    gdf,
+    image_filename,
+    field_name="Code",
+    all_touched=False,
+    max_per_class=None,
+    max_per_polygon=None,
+    seed=None,
+    band_indices=None
+):
+    """Extrait les échantillons d'une image directement depuis les polygones d'un GeoDataFrame.
+
+    Chaque polygone est rasterisé en mémoire sur sa seule fenêtre englobante et seule
+    cette fenêtre est lue dans l'image : aucun raster d'échantillons intermédiaire n'est écrit.
+    Un pixel couvert par plusieurs polygones superposés n'est extrait qu'une fois, pour le
+    dernier d'entre eux dans le GeoDataFrame (comme une rasterisation de toute la couche).
+    Avec `max_per_class`, un réservoir par classe est alimenté au fil des polygones, la
+    matrice complète des échantillons n'est donc jamais construite.
+
+    Args :
+        gdf (GeoDataFrame) : Polygones d'échantillons, dans la projection de l'image.
+        image_filename (str | list) : Chemin de l'image multibandes (ex.
+            Serie_temp_S2_allbands.tif), ou liste d'images sur la même grille.
+        field_name (str) : Nom de la colonne contenant le code de classe (par défaut 'Code').
+        all_touched (bool) : Si True, garde tous les pixels touchés par le polygone.
+        max_per_class (int) : Nombre maximal de pixels gardés par classe (par défaut sans limite).
+        max_per_polygon (int) : Nombre maximal de pixels tirés par polygone (par défaut sans limite).
+        seed (int) : Graine du générateur aléatoire pour un tirage reproductible.
+        band_indices (list) : Positions (à partir de 0) des bandes à extraire, toutes par défaut.
+
+    Return :
+        tuple : (X, Y, t, ids) avec X la matrice (n_pixels, n_bandes), Y les labels
+        (n_pixels, 1), t le tuple (lignes, colonnes) des pixels et ids l'identifiant
+        (voir `stand_ids`) du polygone source de chaque pixel.
+
+    Exceptions :
+        ValueError : Si l'image ne peut pas être ouverte ou si la colonne n'existe pas.
+    """
+    if field_name not in gdf.columns:
+        raise ValueError(f"La colonne '{field_name}' n'existe pas dans le GeoDataFrame.")
+
+    datasets = _open_stack(image_filename)
+    geotransform = datasets[0].GetGeoTransform()
+    projection = datasets[0].GetProjection()
+    nb_col, nb_row = datasets[0].RasterXSize, datasets[0].RasterYSize
+
+    rng = np.random.default_rng(seed)
+    sindex = gdf.sindex
+    reservoirs = {}
+    samples, labels, rows, cols, ids = [], [], [], [], []
+    for polygon_id, (geometry, code) in enumerate(zip(gdf.geometry, gdf[field_name])):
+        if geometry is None or geometry.is_empty:
+            continue
+        window = _polygon_window(geometry.bounds, geotransform, nb_col, nb_row)
+        if window is None:
+            continue
+
+        # Masque du polygone limité à sa fenêtre englobante
+        mask = _rasterize_window(
+            [geometry], [1], geotransform, projection, window,
+            data_type=gdal.GDT_Byte, all_touched=all_touched
+        ).astype(bool)
+
+        # Pixels repris par un polygone suivant qui le recouvre : extraits avec ce dernier
+        later = sindex.query(geometry, predicate="intersects")
+        later = later[later > polygon_id]
+        if later.size and mask.any():
+            covered = _rasterize_window(
+                list(gdf.geometry.iloc[later]), [1] * later.size, geotransform, projection,
+                window, data_type=gdal.GDT_Byte, all_touched=all_touched
+            ).astype(bool)
+            mask &= ~covered
+        if not mask.any():
+            continue
+
+        xoff, yoff, xsize, ysize = window
+        block = _read_window(datasets, window, band_indices)
+
+        row_idx, col_idx = np.nonzero(mask)
+
+        # Tirage sans remise des pixels du polygone au-delà du plafond
+        if max_per_polygon is not None and row_idx.size > max_per_polygon:
+            selection = np.sort(rng.choice(row_idx.size, max_per_polygon, replace=False))
+            row_idx, col_idx = row_idx[selection], col_idx[selection]
+
+        items = {
+            "X": block[:, row_idx, col_idx].T,
+            "rows": row_idx + yoff,
+            "cols": col_idx + xoff,
+            "ids": np.full(row_idx.size, polygon_id, dtype=np.int32),
+        }
+
+        if max_per_class is None:
+            samples.append(items["X"])
+            labels.append(np.full(row_idx.size, code, dtype=np.int32))
+            rows.append(items["rows"])
+            cols.append(items["cols"])
+            ids.append(items["ids"])
+        else:
+            reservoir = reservoirs.setdefault(code, {"seen": 0, "data": {}})
+            _reservoir_update(reservoir, items, max_per_class, rng)
+
+    datasets = None
+
+    # Vidage des réservoirs, classe par classe
+    for code, reservoir in sorted(reservoirs.items()):
+        kept = min(reservoir["seen"], max_per_class)
+        samples.append(reservoir["data"]["X"][:kept])
+        labels.append(np.full(kept, code, dtype=np.int32))
+        rows.append(reservoir["data"]["rows"][:kept])
+        cols.append(reservoir["data"]["cols"][:kept])
+        ids.append(reservoir["data"]["ids"][:kept])
+        logging.info("Classe %s : %i pixels gardés sur %i", code, kept, reservoir["seen"])
+
+    if not samples:
+        raise ValueError("Aucun pixel d'échantillon n'a été extrait de l'image.")
+
+    X = np.concatenate(samples)
+    Y = np.concatenate(labels).reshape(-1, 1)
+    t = (np.concatenate(rows), np.concatenate(cols))
+
+    # Positions des polygones converties en identifiants stables (texte pour la BD Forêt)
+    id_values = stand_ids(gdf).to_numpy()
+    if id_values.dtype == object:
+        id_values = id_values.astype(str)
+    polygon_ids = id_values[np.concatenate(ids)]
+
+    logging.info("%i pixels extraits depuis %i polygones", X.shape[0], len(gdf))
+
+    return X, Y, t, polygon_ids
+
+
+def _iter_blocks(nb_col, nb_row, block_size):
+    """Découpe une grille en fenêtres carrées successives.
+
+    Args :
+        nb_col (int) : Nombre de colonnes de la grille.
+        nb_row (int) : Nombre de lignes de la grille.
+        block_size (int) : Taille (en pixels) du côté des blocs.
+
+    Return :
+        generator : Fenêtres (xoff, yoff, xsize, ysize), ligne de blocs par ligne de blocs.
+    """
+    for yoff in range(0, nb_row, block_size):
+        ysize = min(block_size, nb_row - yoff)
+        for xoff in range(0, nb_col, block_size):
+            xsize = min(block_size, nb_col - xoff)
+            yield xoff, yoff, xsize, ysize
+
+
+def _create_output_raster(out_filename, ref_dataset, nb_band, gdal_type, driver="GTiff"):
+    """Crée un raster de sortie calé sur la grille d'un raster de référence.
+
+    Args :
+        out_filename (str) : Chemin du raster à créer.
+        ref_dataset (gdal.Dataset) : Raster de référence (taille, géotransformation, projection).
+        nb_band (int) : Nombre de bandes du raster créé.
+        gdal_type (int) : Type GDAL des bandes (ex. gdal.GDT_Byte).
+        driver (str) : Driver de format à utiliser pour la sortie (par défaut 'GTiff').
+
+    Return :
+        gdal.Dataset : Raster ouvert en écriture.
+
+    Exceptions :
+        ValueError : Si le raster ne peut pas être créé.
+    """
+    out_ds = gdal.GetDriverByName(driver).Create(
+        out_filename, ref_dataset.RasterXSize, ref_dataset.RasterYSize, nb_band, gdal_type
+    )
+    if out_ds is None:
+        raise ValueError(f"Impossible de créer le raster '{out_filename}'.")
+    out_ds.SetGeoTransform(ref_dataset.GetGeoTransform())
+    out_ds.SetProjection(ref_dataset.GetProjection())
+    return out_ds
+
+
+def _open_output_raster(out_filename, ref_dataset, nb_band, gdal_type, driver, resume):
+    """Ouvre une sortie existante en mise à jour (reprise) ou la crée sinon.
+
+    Exceptions :
+        ValueError : Si la sortie à reprendre n'a pas la taille ou le nombre de bandes attendus.
+    """
+    if not resume:
+        return _create_output_raster(out_filename, ref_dataset, nb_band, gdal_type, driver)
+
+    out_ds = gdal.Open(out_filename, gdal.GA_Update)
+    if out_ds is None or (out_ds.RasterXSize, out_ds.RasterYSize, out_ds.RasterCount) != (
+        ref_dataset.RasterXSize, ref_dataset.RasterYSize, nb_band
+    ):
+        raise ValueError(f"La sortie partielle '{out_filename}' ne peut pas être reprise.")
+    return out_ds
+
+
+def _model_hash(model_file):
+    """Empreinte SHA-256 du fichier d'un modèle sauvegardé, lu par morceaux."""
+    digest = hashlib.sha256()
+    with open(model_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_hash(config):
+    """Empreinte SHA-256 d'une configuration d'apprentissage.
+
+    Args :
+        config (dict) : Paramètres sérialisables en JSON (backend, paramètres, fichiers
+            d'entrée...). L'ordre des clés n'a pas d'importance.
+
+    Return :
+        str : Empreinte hexadécimale de la configuration.
+    """
+    text = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _write_checkpoint(checkpoint_file, checkpoint):
+    """Écrit le point de reprise de façon atomique (fichier temporaire puis renommage)."""
+    tmp_file = f"{checkpoint_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def _quantize_probabilities(probabilities):
+    """Quantifie des probabilités [0, 1] sur 8 bits (0-255)."""
+    return np.rint(probabilities * 255).astype(np.uint8)
+
+
+def predict_image_by_blocks(
+    clf,
+    image_filename,
+    out_filename,
+    block_size=512,
+    no_data=0,
+    driver="GTiff",
+    dtype=np.float32,
+    out_confidence=None,
+    out_proba=None,
+    band_indices=None,
+    checkpoint_file=None,
+    overviews=None,
+    model_file=None,
+    training_config=None
+):
+    """Applique un classifieur entraîné à toute une image, bloc par bloc.
+
+    Seul un bloc de l'image est chargé à la fois : les valeurs sont lues dans le type
+    natif du raster (UInt16) et converties une seule fois dans `dtype` avant la prédiction,
+    ce qui évite les copies implicites en float64.
+
+    Si une carte de confiance ou de probabilités est demandée, `predict_proba` est appelé
+    une seule fois par bloc et le label en est déduit (classe la plus probable), la carte
+    de classes est donc produite dans la même passe. Les probabilités sont quantifiées
+    sur 8 bits (valeur = probabilité x 255).
+
+    Args :
+        clf (estimator) : Classifieur scikit-learn entraîné.
+        image_filename (str | list) : Chemin de l'image multibandes à classer, ou liste
+            d'images sur la même grille dont les bandes sont mises bout à bout.
+        out_filename (str) : Chemin de la carte de classes produite (Byte).
+        block_size (int) : Taille des blocs lus (par défaut 512 pixels).
+        no_data (int) : Valeur de no data des bandes qui n'en déclarent pas, laissée à 0
+            dans les cartes. Un pixel est classé si au moins une bande est renseignée.
+        driver (str) : Driver de format à utiliser pour la sortie (par défaut 'GTiff').
+        dtype (type) : Type numpy des variables passées au classifieur (par défaut float32).
+        out_confidence (str) : Chemin optionnel d'une carte de confiance à 2 bandes
+            (probabilité maximale, écart entre les deux classes les plus probables).
+        out_proba (str) : Chemin optionnel d'une carte avec une bande de probabilité par
+            classe, dans l'ordre de `clf.classes_`.
+        band_indices (list) : Positions (à partir de 0) des bandes passées au classifieur,
+            toutes par défaut. Seules ces bandes sont lues.
+        checkpoint_file (str) : Chemin optionnel d'un fichier JSON de reprise. Le nombre de
+            blocs terminés y est noté au fil du calcul ; si le fichier existe au lancement,
+            le calcul reprend au premier bloc non terminé dans les sorties déjà commencées.
+            Le fichier est supprimé à la fin du calcul.
+        overviews (str) : 'internal' ou 'external' pour construire les aperçus des sorties
+            (classe majoritaire pour la carte de classes, moyenne pour les probabilités).
+        model_file (str) : Fichier où `clf` est sauvegardé, obligatoire avec
+            `checkpoint_file` : l'empreinte de ses octets identifie le modèle.
+        training_config (str) : Empreinte optionnelle de la configuration d'apprentissage
+            (voir `config_hash`), notée dans le point de reprise et vérifiée à la reprise.
+
+    Exceptions :
+        ValueError : Si l'image ne peut pas être ouverte, la sortie créée, si
+            `checkpoint_file` est donné sans `model_file`, ou si le point de reprise ne
+            correspond pas au modèle, à la configuration, à l'image ou aux paramètres.
+    """
+    if checkpoint_file is not None and model_file is None:
+        raise ValueError("Un point de reprise nécessite le fichier du modèle (model_file).")
+
+    datasets = _open_stack(image_filename)
+    dataset = datasets[0]
+    nb_col, nb_row = dataset.RasterXSize, dataset.RasterYSize
+    nodata_values = _stack_nodata(datasets, band_indices, no_data)[:, np.newaxis, np.newaxis]
+
+    # Point de reprise : empreintes du modèle, de l'image et des paramètres du calcul
+    checkpoint, nb_done = None, 0
+    if checkpoint_file is not None:
+        filenames = [image_filename] if isinstance(image_filename, str) else list(image_filename)
+        checkpoint = {
+            "modele": _model_hash(model_file),
+            "configuration": training_config,
+            "images": [
+                {
+                    "chemin": os.path.abspath(filename),
+                    "taille": os.stat(filename).st_size,
+                    "modification": os.stat(filename).st_mtime,
+                    "dimensions": [ds.RasterXSize, ds.RasterYSize, ds.RasterCount],
+                }
+                for filename, ds in zip(filenames, datasets)
+            ],
+            "sorties": [out_filename, out_confidence, out_proba],
+            "block_size": block_size,
+            "band_indices": None if band_indices is None else [int(i) for i in band_indices],
+            "nb_blocs_termines": 0,
+        }
+        if os.path.exists(checkpoint_file):
+            with open(checkpoint_file, encoding="utf-8") as f:
+                previous = json.load(f)
+            nb_done = previous.pop("nb_blocs_termines")
+            expected = dict(checkpoint)
+            expected.pop("nb_blocs_termines")
+            if previous != json.loads(json.dumps(expected)):
+                raise ValueError(
+                    f"Le point de reprise '{checkpoint_file}' ne correspond pas au modèle, à la "
+                    "configuration, à l'image ou aux paramètres : supprimez-le pour relancer "
+                    "le calcul."
+                )
+            logging.info("Reprise de la classification après %i blocs", nb_done)
+    resume = nb_done > 0
+
+    out_ds = _open_output_raster(out_filename, dataset, 1, gdal.GDT_Byte, driver, resume)
+    out_band = out_ds.GetRasterBand(1)
+
+    with_proba = out_confidence is not None or out_proba is not None
+    confidence_ds, proba_ds = None, None
+    if out_confidence is not None:
+        confidence_ds = _open_output_raster(
+            out_confidence, dataset, 2, gdal.GDT_Byte, driver, resume
+        )
+        confidence_ds.GetRasterBand(1).SetDescription("proba_max")
+        confidence_ds.GetRasterBand(2).SetDescription("marge_top2")
+    if out_proba is not None:
+        proba_ds = _open_output_raster(
+            out_proba, dataset, len(clf.classes_), gdal.GDT_Byte, driver, resume
+        )
+        for index, code in enumerate(clf.classes_, start=1):
+            proba_ds.GetRasterBand(index).SetDescription(f"proba_{code}")
+
+    for block_index, (xoff, yoff, xsize, ysize) in enumerate(
+        _iter_blocks(nb_col, nb_row, block_size)
+    ):
+        if block_index < nb_done:
+            continue
+        block = _read_window(datasets, (xoff, yoff, xsize, ysize), band_indices)
+
+        labels = np.zeros((ysize, xsize), dtype=np.uint8)
+        valid = np.any(block != nodata_values, axis=0)
+        if with_proba:
+            proba_block = np.zeros((len(clf.classes_), ysize, xsize), dtype=np.uint8)
+
+        if valid.any():
+            # Une seule conversion, vers un tableau contigu (n_pixels, n_bandes)
+            pixels = np.ascontiguousarray(block[:, valid].T, dtype=dtype)
+            if with_proba:
+                probabilities = clf.predict_proba(pixels)
+                labels[valid] = clf.classes_[np.argmax(probabilities, axis=1)]
+                proba_block[:, valid] = _quantize_probabilities(probabilities).T
+            else:
+                labels[valid] = clf.predict(pixels)
+        out_band.WriteArray(labels, xoff, yoff)
+
+        if confidence_ds is not None:
+            # Les deux plus grandes probabilités de chaque pixel
+            top2 = np.sort(proba_block, axis=0)[-2:]
+            best = top2[-1]
+            margin = best - top2[0] if top2.shape[0] == 2 else best
+            confidence_ds.GetRasterBand(1).WriteArray(best, xoff, yoff)
+            confidence_ds.GetRasterBand(2).WriteArray(margin, xoff, yoff)
+        if proba_ds is not None:
+            for index in range(proba_block.shape[0]):
+                proba_ds.GetRasterBand(index + 1).WriteArray(proba_block[index], xoff, yoff)
+
+        if checkpoint is not None:
+            # Le bloc n'est noté terminé qu'une fois écrit sur le disque
+            for output in (out_ds, confidence_ds, proba_ds):
+                if output is not None:
+                    output.FlushCache()
+            checkpoint["nb_blocs_termines"] = block_index + 1
+            _write_checkpoint(checkpoint_file, checkpoint)
+
+    out_band.FlushCache()
+    out_ds = None
+    confidence_ds = None
+    proba_ds = None
+    dataset = None
+    datasets = None
+
+    if checkpoint_file is not None and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    if overviews is not None:
+        build_overviews(out_filename, "MODE", overviews)
+        for continuous in (out_confidence, out_proba):
+            if continuous is not None:
+                build_overviews(continuous, "AVERAGE", overviews)
+
+    logging.info("Classification terminée, carte sauvegardée à : %s", out_filename)
+
+
+def _linear_classifier(**params):
+    """Modèle linéaire de référence : standardisation puis régression logistique."""
+    return make_pipeline(StandardScaler(), LogisticRegression(**params))
+
+
+# Backends disponibles pour la classification pixel : (constructeur, paramètres par défaut)
+CLASSIFIER_BACKENDS = {
+    "rf": (RandomForestClassifier, {
+        "max_depth": 50,
+        "oob_score": True,
+        "max_samples": 0.75,
+        "class_weight": "balanced",
+        "n_jobs": -1,
+    }),
+    "extra_trees": (ExtraTreesClassifier, {
+        "max_depth": 50,
+        "class_weight": "balanced",
+        "n_jobs": -1,
+    }),
+    "hist_gb": (HistGradientBoostingClassifier, {
+        "max_iter": 200,
+        "class_weight": "balanced",
+        "early_stopping": True,
+    }),
+    "linear": (_linear_classifier, {
+        "max_iter": 1000,
+        "class_weight": "balanced",
+    }),
+}
+
+
+def make_classifier(backend="rf", **params):
+    """Instancie le classifieur d'un backend avec ses paramètres par défaut.
+
+    Args :
+        backend (str) : Nom du backend ('rf', 'extra_trees', 'hist_gb' ou 'linear').
+        **params : Paramètres qui remplacent ou complètent ceux par défaut.
+
+    Return :
+        estimator : Classifieur scikit-learn non entraîné.
+
+    Exceptions :
+        ValueError : Si le backend est inconnu.
+    """
+    if backend not in CLASSIFIER_BACKENDS:
+        raise ValueError(
+            f"Backend '{backend}' inconnu, choix possibles : {list(CLASSIFIER_BACKENDS)}"
+        )
+    constructor, default_params = CLASSIFIER_BACKENDS[backend]
+    return constructor(**{**default_params, **params})
+
+
+def cross_validate_classifier(X, Y, backend="rf", params=None, n_splits=5):
+    """Validation croisée stratifiée d'un backend de classification.
+
+    Args :
+        X (ndarray) : Matrice des échantillons (n_pixels, n_bandes).
+        Y (ndarray) : Labels des échantillons (n_pixels, 1) ou (n_pixels,).
+        backend (str) : Nom du backend (voir `CLASSIFIER_BACKENDS`).
+        params (dict) : Paramètres du classifieur (par défaut ceux du backend).
+        n_splits (int) : Nombre de plis (par défaut 5).
+
+    Return :
+        dict : Classifieur du dernier pli ('clf'), labels ('labels'), et par pli :
+        'accuracies', 'confusion_matrices', 'reports', 'fit_times', 'predict_times'.
+    """
+    Y = np.ravel(Y)
+    labels = np.unique(Y)
+    results = {
+        "clf": None, "labels": labels, "accuracies": [], "confusion_matrices": [],
+        "reports": [], "fit_times": [], "predict_times": [],
+    }
+
+    skf = StratifiedKFold(n_splits=n_splits)
+    for train_index, test_index in skf.split(X, Y):
+        X_train, X_test = X[train_index], X[test_index]
+        Y_train, Y_test = Y[train_index], Y[test_index]
+
+        # Apprentissage
+        clf = make_classifier(backend, **(params or {}))
+        start = time.perf_counter()
+        clf.fit(X_train, Y_train)
+        results["fit_times"].append(time.perf_counter() - start)
+
+        # Test
+        start = time.perf_counter()
+        Y_predict = clf.predict(X_test)
+        results["predict_times"].append(time.perf_counter() - start)
+
+        # Indicateurs de qualité
+        results["confusion_matrices"].append(confusion_matrix(Y_test, Y_predict, labels=labels))
+        results["reports"].append(classification_report(
+            Y_test, Y_predict, labels=labels, output_dict=True, zero_division=1
+        ))
+        results["accuracies"].append(accuracy_score(Y_test, Y_predict))
+        results["clf"] = clf
+
+    return results
+
+
+def average_cv_results(results):
+    """Moyenne sur les plis des résultats de `cross_validate_classifier`.
+
+    Args :
+        results (dict) : Résultats de la validation croisée.
+
+    Return :
+        tuple : (précision globale moyenne, matrice de confusion moyenne,
+        rapport moyen {métrique: {classe: valeur}}).
+    """
+    average_accuracy = np.mean(results["accuracies"])
+    average_cm = np.mean(results["confusion_matrices"], axis=0)
+
+    # Les classes (et moyennes) sont les clés dont la valeur est un dictionnaire
+    reports = results["reports"]
+    classes = [key for key in reports[0] if isinstance(reports[0][key], dict)]
+
+    average_report = {}
+    for key in ['precision', 'recall', 'f1-score']:
+        average_report[key] = {}
+        for class_label in classes:
+            average_report[key][class_label] = np.mean([r[class_label][key] for r in reports])
+
+    return average_accuracy, average_cm, average_report
+
+
+def stack_feature_names(raster_files, band_order):
+    """Nomme les variables d'un empilement dans l'ordre de concaténation (date puis bande).
+
+    Args :
+        raster_files (list) : Fichiers mono-bande empilés (noms au format Sentinel-2 THEIA).
+        band_order (list) : Ordre des bandes au sein d'une date.
+
+    Return :
+        list : Noms '<AAAAMMJJ>_<bande>' dans l'ordre des bandes de l'empilement.
+    """
+    names = []
+    for filename in sorted(raster_files, key=lambda x: custom_sort_key(os.path.basename(x), band_order)):
+        date, band = custom_sort_key(os.path.basename(filename), band_order)
+        if date:
+            names.append(f"{date[:8]}_{band_order[band]}")
+    return names
+
+
+def select_band_files(raster_files, selected_features, band_order):
+    """Garde uniquement les fichiers mono-bande d'une sélection de variables.
+
+    Args :
+        raster_files (list) : Fichiers mono-bande candidats à l'empilement.
+        selected_features (list) : Noms '<AAAAMMJJ>_<bande>' à conserver.
+        band_order (list) : Ordre des bandes au sein d'une date.
+
+    Return :
+        list : Fichiers retenus, triés dans l'ordre de concaténation.
+    """
+    selected = set(selected_features)
+    kept = []
+    for filename in raster_files:
+        date, band = custom_sort_key(os.path.basename(filename), band_order)
+        if date and f"{date[:8]}_{band_order[band]}" in selected:
+            kept.append(filename)
+    return sorted(kept, key=lambda x: custom_sort_key(os.path.basename(x), band_order))
+
+
+def rank_features(clf, X_test, Y_test, feature_names, n_repeats=5, seed=0):
+    """Classe les variables d'un modèle entraîné par importance d'impureté et par permutation.
+
+    Les modèles sans `feature_importances_` (ex. 'hist_gb', 'linear') sont classés par la
+    seule importance par permutation.
+
+    Args :
+        clf (estimator) : Classifieur entraîné.
+        X_test (ndarray) : Échantillons de test (n_pixels, n_variables).
+        Y_test (ndarray) : Labels de test.
+        feature_names (list) : Nom de chaque variable (voir `stack_feature_names`).
+        n_repeats (int) : Nombre de permutations par variable.
+        seed (int) : Graine du générateur aléatoire.
+
+    Return :
+        DataFrame : Une ligne par variable ('variable', 'date', 'bande', 'indice',
+        'importance_impurete', 'importance_permutation'), triée par importance décroissante.
+    """
+    permutation = permutation_importance(
+        clf, X_test, np.ravel(Y_test), n_repeats=n_repeats, random_state=seed, n_jobs=-1
+    )
+    ranking = pd.DataFrame({
+        "variable": feature_names,
+        "date": [name.split("_")[0] for name in feature_names],
+        "bande": [name.split("_")[1] for name in feature_names],
+        "indice": np.arange(len(feature_names)),
+        "importance_impurete": getattr(clf, "feature_importances_", np.full(len(feature_names), np.nan)),
+        "importance_permutation": permutation.importances_mean,
+    })
+    # Rang moyen des deux critères pour départager les variables
+    ranking["rang"] = ranking["importance_permutation"].rank(ascending=False)
+    if hasattr(clf, "feature_importances_"):
+        ranking["rang"] = (
+            ranking["rang"] + ranking["importance_impurete"].rank(ascending=False)
+        ) / 2
+    return ranking.sort_values("rang").reset_index(drop=True)
+
+
+def _truncate_forest(clf, n_estimators):
+    """Copie légère d'une forêt entraînée limitée à ses `n_estimators` premiers arbres."""
+    truncated = copy.copy(clf)
+    truncated.estimators_ = clf.estimators_[:n_estimators]
+    truncated.n_estimators = n_estimators
+    return truncated
+
+
+def compact_forest(
+    X_train,
+    Y_train,
+    X_test,
+    Y_test,
+    n_estimators_grid=(10, 20, 30, 50, 75, 100),
+    max_depth_grid=(10, 15, 20, 30, 50),
+    tolerance=0.02,
+    backend="rf",
+    params=None
+):
+    """Cherche la plus petite forêt (nombre d'arbres, profondeur) qui garde le F1 par classe.
+
+    Pour chaque profondeur, une seule forêt est entraînée avec le nombre maximal d'arbres,
+    puis évaluée tronquée à ses k premiers arbres.
+
+    Args :
+        X_train, Y_train (ndarray) : Échantillons et labels d'apprentissage.
+        X_test, Y_test (ndarray) : Échantillons et labels de test.
+        n_estimators_grid (tuple) : Nombres d'arbres testés.
+        max_depth_grid (tuple) : Profondeurs maximales testées.
+        tolerance (float) : Perte de F1 tolérée pour chaque classe par rapport à la référence.
+        backend (str) : Backend à base d'arbres ('rf' ou 'extra_trees').
+        params (dict) : Paramètres de référence du classifieur.
+
+    Return :
+        tuple : (forêt compacte retenue, forêt de référence, DataFrame des configurations
+        testées avec leur F1 par classe et leur respect de la tolérance).
+    """
+    Y_train, Y_test = np.ravel(Y_train), np.ravel(Y_test)
+    labels = np.unique(Y_train)
+    params = dict(params or {})
+
+    reference = make_classifier(backend, **params)
+    reference.fit(X_train, Y_train)
+    reference_f1 = f1_score(Y_test, reference.predict(X_test), labels=labels, average=None)
+
+    results, candidates = [], []
+    for max_depth in max_depth_grid:
+        forest = make_classifier(
+            backend, **{**params, "max_depth": max_depth, "n_estimators": max(n_estimators_grid)}
+        )
+        forest.fit(X_train, Y_train)
+        for n_estimators in sorted(n_estimators_grid):
+            candidate = _truncate_forest(forest, n_estimators)
+            f1 = f1_score(Y_test, candidate.predict(X_test), labels=labels, average=None)
+            valid = bool(np.all(f1 >= reference_f1 - tolerance))
+            results.append({
+                "n_estimators": n_estimators,
+                "max_depth": max_depth,
+                "nb_noeuds": sum(e.tree_.node_count for e in candidate.estimators_),
+                "f1_min": f1.min(),
+                "valide": valid,
+                **{f"f1_{label}": value for label, value in zip(labels, f1)},
+            })
+            if valid:
+                candidates.append((results[-1]["nb_noeuds"], n_estimators, max_depth, candidate))
+
+    results_df = pd.DataFrame(results)
+    if not candidates:
+        logging.warning("Aucune configuration ne respecte la tolérance, la référence est gardée")
+        return reference, reference, results_df
+
+    # Configuration valide avec le moins de noeuds (taille et coût de prédiction)
+    _, n_estimators, max_depth, best = min(candidates, key=lambda c: c[:3])
+    logging.info("Forêt compacte : %i arbres, profondeur %i", n_estimators, max_depth)
+    return best, reference, results_df
+
+
+def cache_samples(gdf, image_filename, cache_folder, field_name="Code", **extract_params):
+    """Extrait une seule fois les échantillons et les met en cache sous forme de fichiers .npy.
+
+    Les appels suivants avec la même image (chemin, taille, date de modification), les mêmes
+    polygones et les mêmes paramètres relisent le cache en mémoire mappée, sans relire l'image.
+
+    Args :
+        gdf (GeoDataFrame) : Polygones d'échantillons.
+        image_filename (str) : Chemin de l'image multibandes.
+        cache_folder (str) : Dossier du cache.
+        field_name (str) : Nom de la colonne contenant le code de classe.
+        **extract_params : Paramètres passés à `extract_samples_from_polygons`.
+
+    Return :
+        tuple : (X, Y, ids) en mémoire mappée (lecture seule).
+    """
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+
+    stat = os.stat(image_filename)
+    signature = {
+        "image": os.path.abspath(image_filename),
+        "taille": stat.st_size,
+        "modification": stat.st_mtime,
+        "nb_polygones": len(gdf),
+        "emprise_polygones": [float(v) for v in gdf.total_bounds],
+        "champ": field_name,
+        "parametres": {k: (list(v) if isinstance(v, (list, tuple, np.ndarray)) else v)
+                       for k, v in extract_params.items()},
+    }
+    signature_file = os.path.join(cache_folder, "signature.json")
+    filenames = {name: os.path.join(cache_folder, f"{name}.npy") for name in ("X", "Y", "ids")}
+
+    cached = False
+    if os.path.exists(signature_file) and all(os.path.exists(f) for f in filenames.values()):
+        with open(signature_file, encoding="utf-8") as f:
+            cached = json.load(f) == json.loads(json.dumps(signature))
+
+    if not cached:
+        logging.info("Extraction des échantillons vers le cache %s", cache_folder)
+        X, Y, _, ids = extract_samples_from_polygons(gdf, image_filename, field_name, **extract_params)
+        for name, array in zip(("X", "Y", "ids"), (X, Y, ids)):
+            np.save(filenames[name], array)
+        del X, Y, ids
+        with open(signature_file, "w", encoding="utf-8") as f:
+            json.dump(signature, f, indent=2)
+    else:
+        logging.info("Échantillons relus depuis le cache %s", cache_folder)
+
+    return tuple(np.load(filenames[name], mmap_mode="r") for name in ("X", "Y", "ids"))
+
+
+def _grouped_stats(keys, values, percentiles):
+    """Moyenne, écart type et centiles (interpolation linéaire, comme np.percentile) de
+    chaque bande, pour chaque valeur de `keys`.
+
+    Args :
+        keys (ndarray) : Clé (polygone) de chaque pixel.
+        values (ndarray) : Valeurs des pixels (n_pixels, n_bandes).
+        percentiles (tuple) : Centiles calculés.
+
+    Return :
+        tuple : (clés présentes triées, statistiques (n_clés, n_bandes, 2 + n_centiles),
+        nombre de pixels par clé).
+    """
+    present, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    stats = np.empty((present.size, values.shape[1], 2 + len(percentiles)), dtype=np.float64)
+    for band in range(values.shape[1]):
+        band_values = values[:, band].astype(np.float64)
+        mean = np.bincount(inverse, weights=band_values) / counts
+        stats[:, band, 0] = mean
+        stats[:, band, 1] = np.sqrt(
+            np.bincount(inverse, weights=(band_values - mean[inverse]) ** 2) / counts
+        )
+        # Valeurs triées par clé puis par valeur : centiles par position dans chaque groupe
+        ordered = band_values[np.lexsort((band_values, inverse))]
+        for index, q in enumerate(percentiles):
+            position = (counts - 1) * q / 100
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, counts - 1)
+            below, above = ordered[starts + low], ordered[starts + high]
+            stats[:, band, 2 + index] = below + (above - below) * (position - low)
+    return present, stats, counts
+
+
+def extract_polygon_features(
+    gdf,
+    image_filename,
+    feature_names=None,
+    percentiles=(10, 50, 90),
+    no_data=0,
+    band_indices=None,
+    block_size=1024,
+    all_touched=False
+):
+    """Résume chaque polygone par des statistiques par bande (moyenne, écart type, centiles).
+
+    L'image est lue une seule fois, par blocs. Dans chaque bloc, seuls les polygones qui le
+    touchent sont rasterisés (voir `_block_polygons`). Les statistiques d'un polygone
+    contenu dans le bloc sont calculées aussitôt ; les pixels d'un polygone à cheval sur
+    plusieurs blocs sont gardés jusqu'à la lecture de son dernier bloc, les centiles
+    demandant toutes ses valeurs. La mémoire dépend de la taille des blocs et des polygones
+    coupés par une limite de blocs, pas de la taille de l'image.
+
+    Args :
+        gdf (GeoDataFrame) : Polygones (peuplements) sans recouvrement, dans la projection
+            de l'image.
+        image_filename (str | list) : Chemin de l'image multibandes, ou liste d'images.
+        feature_names (list) : Noms des bandes lues (par défaut 'b1', 'b2', ...).
+        percentiles (tuple) : Centiles calculés pour chaque bande.
+        no_data (int) : Valeur de no data des bandes qui n'en déclarent pas.
+        band_indices (list) : Positions (à partir de 0) des bandes à lire, toutes par défaut.
+        block_size (int) : Taille des blocs lus (par défaut 1024 pixels).
+        all_touched (bool) : Si True, prend tous les pixels touchés par un polygone.
+
+    Return :
+        DataFrame : Une ligne par polygone (même index que `gdf`), une colonne par couple
+        (bande, statistique), plus 'nb_pixels'. Les polygones sans pixel valide sont à NaN.
+    """
+    datasets = _open_stack(image_filename)
+    geotransform = datasets[0].GetGeoTransform()
+    projection = datasets[0].GetProjection()
+    nb_col, nb_row = datasets[0].RasterXSize, datasets[0].RasterYSize
+    nodata_values = _stack_nodata(datasets, band_indices, no_data)
+    nb_band = len(nodata_values)
+    if feature_names is None:
+        feature_names = [f"b{i + 1}" for i in range(nb_band)]
+
+    stat_names = ["moy", "std"] + [f"p{q}" for q in percentiles]
+    features = np.full((len(gdf), nb_band, len(stat_names)), np.nan, dtype=np.float32)
+    nb_pixels = np.zeros(len(gdf), dtype=np.int64)
+
+    # Nombre de blocs touchés par chaque polygone, pour savoir quand il est complet
+    geometries = gdf.geometry.to_numpy()
+    sindex = gdf.sindex
+    windows = list(_iter_blocks(nb_col, nb_row, block_size))
+    block_positions = [_block_polygons(sindex, geometries, geotransform, w) for w in windows]
+    remaining = np.zeros(len(gdf), dtype=np.int64)
+    for positions in block_positions:
+        remaining[positions] += 1
+    pending = {}
+
+    def finish(keys, values):
+        present, stats, counts = _grouped_stats(keys, values, percentiles)
+        features[present] = stats
+        nb_pixels[present] = counts
+
+    for window, positions in zip(windows, block_positions):
+        if positions.size == 0:
+            continue
+        ids = _rasterize_window(
+            geometries[positions], np.arange(1, positions.size + 1), geotransform,
+            projection, window, all_touched=all_touched
+        ).ravel()
+        block = _read_window(datasets, window, band_indices).reshape(nb_band, -1)
+        keep = (ids > 0) & np.any(block != nodata_values[:, np.newaxis], axis=0)
+        keys = positions[ids[keep] - 1]
+        values = block[:, keep].T.astype(np.float32)
+
+        remaining[positions] -= 1
+        # Polygones terminés dans ce bloc sans morceau en attente : calcul direct
+        direct = (remaining[keys] == 0) & ~np.isin(keys, list(pending))
+        if direct.any():
+            finish(keys[direct], values[direct])
+        split = ~direct
+        if split.any():
+            split_keys, split_values = keys[split], values[split]
+            order = np.argsort(split_keys, kind="stable")
+            split_keys, split_values = split_keys[order], split_values[order]
+            present, starts = np.unique(split_keys, return_index=True)
+            for key, chunk in zip(present, np.split(split_values, starts[1:])):
+                pending.setdefault(key, []).append(chunk)
+
+        done = [key for key in positions if remaining[key] == 0 and key in pending]
+        if done:
+            chunks = [np.concatenate(pending.pop(key)) for key in done]
+            finish(np.repeat(done, [len(chunk) for chunk in chunks]), np.concatenate(chunks))
+
+    datasets = None
+
+    columns = [f"{name}_{stat}" for name in feature_names for stat in stat_names]
+    # Ordre des colonnes : toutes les statistiques d'une bande, bande par bande
+    features_df = pd.DataFrame(
+        features.reshape(len(gdf), -1), columns=columns, index=gdf.index
+    )
+    features_df["nb_pixels"] = nb_pixels
+    return features_df
+
+
+# Métriques phénologiques calculées sur la série NDVI, dans l'ordre des bandes produites
+PHENOLOGY_METRICS = ["ndvi_min", "ndvi_max", "amplitude", "jour_max", "integrale", "pente_verdissement"]
+
+
+def dates_to_days(dates):
+    """Convertit des dates d'acquisition en nombre de jours depuis la première date.
+
+    Args :
+        dates (list) : Dates 'AAAA-MM-JJ' ou 'AAAAMMJJ' (éventuellement suivies d'une heure).
+
+    Return :
+        ndarray : Jours (float64) écoulés depuis la première date, espacement réel respecté.
+    """
+    days = []
+    for date in dates:
+        digits = re.sub(r"\D", "", str(date))[:8]
+        days.append(np.datetime64(f"{digits[:4]}-{digits[4:6]}-{digits[6:8]}", "D"))
+    days = np.asarray(days)
+    return (days - days[0]).astype(np.float64)
+
+
+def phenology_metrics(ndvi, days):
+    """Calcule les métriques phénologiques de chaque pixel d'une série NDVI.
+
+    Le calcul est vectorisé sur tous les pixels. Un pixel avec au moins une date manquante
+    (NaN) n'a pas de métrique : les trous peuvent être comblés au préalable par
+    `clean_time_series`.
+
+    Args :
+        ndvi (ndarray) : Série NDVI (n_dates, n_pixels), NaN pour les valeurs manquantes.
+        days (ndarray) : Jours de chaque date depuis la première (voir `dates_to_days`).
+
+    Return :
+        ndarray : Métriques (len(PHENOLOGY_METRICS), n_pixels) en float32 : minimum, maximum,
+        amplitude, jour du maximum, intégrale saisonnière (méthode des trapèzes, NDVI x jours)
+        et pente de verdissement maximale entre deux dates (NDVI par jour).
+    """
+    ndvi = ndvi.astype(np.float32, copy=False)
+    days = np.asarray(days, dtype=np.float32)
+    invalid = np.isnan(ndvi).any(axis=0)
+
+    intervals = np.diff(days)[:, np.newaxis]
+    intervals = np.where(intervals > 0, intervals, np.nan)
+    ndvi_min = ndvi.min(axis=0)
+    ndvi_max = ndvi.max(axis=0)
+
+    metrics = np.stack([
+        ndvi_min,
+        ndvi_max,
+        ndvi_max - ndvi_min,
+        days[np.argmax(np.where(np.isnan(ndvi), -np.inf, ndvi), axis=0)],
+        ((ndvi[1:] + ndvi[:-1]) / 2 * np.nan_to_num(intervals)).sum(axis=0),
+        np.nanmax(np.diff(ndvi, axis=0) / intervals, axis=0, initial=-np.inf),
+    ]).astype(np.float32)
+    metrics[:, invalid] = np.nan
+    return metrics
+
+
+def compute_phenology_metrics(
+    ndvi_raster,
+    out_raster,
+    dates,
+    block_size=512,
+    no_data=-9999,
+    driver="GTiff",
+    overviews=None
+):
+    """Écrit un raster de métriques phénologiques à partir de la série NDVI, bloc par bloc.
+
+    Le raster produit (une bande par métrique de PHENOLOGY_METRICS, Float32) est sur la
+    même grille que la série et peut être ajouté aux variables du classifieur en passant
+    [empilement, métriques] comme image à `extract_samples_from_polygons` et
+    `predict_image_by_blocks`.
+
+    Args :
+        ndvi_raster (str) : Chemin du raster NDVI multidates (une bande par date).
+        out_raster (str) : Chemin du raster de métriques produit.
+        dates (list) : Dates des bandes du raster NDVI, dans l'ordre des bandes.
+        block_size (int) : Taille des blocs lus (par défaut 512 pixels).
+        no_data (float) : Valeur de no data du NDVI et des métriques.
+        driver (str) : Driver de format à utiliser pour la sortie (par défaut 'GTiff').
+        overviews (str) : 'internal' ou 'external' pour construire les aperçus (None : aucun).
+
+    Exceptions :
+        ValueError : Si le raster ne peut pas être ouvert ou si le nombre de dates diffère
+            du nombre de bandes.
+    """
+    dataset = gdal.Open(ndvi_raster)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{ndvi_raster}'.")
+    if len(dates) != dataset.RasterCount:
+        raise ValueError(
+            f"{len(dates)} dates fournies pour {dataset.RasterCount} bandes dans '{ndvi_raster}'."
+        )
+    days = dates_to_days(dates)
+
+    out_ds = _create_output_raster(
+        out_raster, dataset, len(PHENOLOGY_METRICS), gdal.GDT_Float32, driver
+    )
+    for index, name in enumerate(PHENOLOGY_METRICS, start=1):
+        out_ds.GetRasterBand(index).SetDescription(name)
+        out_ds.GetRasterBand(index).SetNoDataValue(no_data)
+
+    for xoff, yoff, xsize, ysize in _iter_blocks(dataset.RasterXSize, dataset.RasterYSize, block_size):
+        block = _read_window(dataset, (xoff, yoff, xsize, ysize)).astype(np.float32)
+        block[block == no_data] = np.nan
+        metrics = phenology_metrics(block.reshape(block.shape[0], -1), days)
+        metrics = np.nan_to_num(metrics, nan=no_data).reshape(-1, ysize, xsize)
+        for index in range(metrics.shape[0]):
+            out_ds.GetRasterBand(index + 1).WriteArray(metrics[index], xoff, yoff)
+
+    out_ds = None
+    dataset = None
+    if overviews is not None:
+        build_overviews(out_raster, "AVERAGE", overviews)
+
+    logging.info("Métriques phénologiques sauvegardées à : %s", out_raster)
+
+
+def _savgol_matrix(days, window, polyorder):
+    """Matrice de lissage de Savitzky-Golay pour des dates irrégulières.
+
+    Pour chaque date, un polynôme de degré `polyorder` est ajusté par moindres carrés sur
+    les `window` dates voisines (fenêtre décalée aux extrémités), en temps réel (jours).
+    La valeur lissée est la valeur du polynôme à cette date : elle ne dépend que des
+    dates, la matrice est donc la même pour tous les pixels.
+
+    Args :
+        days (ndarray) : Jours de chaque date depuis la première.
+        window (int) : Nombre de dates de la fenêtre (impair, au plus le nombre de dates).
+        polyorder (int) : Degré du polynôme (inférieur à `window`).
+
+    Return :
+        ndarray : Matrice (n_dates, n_dates) telle que lissé = matrice @ série.
+    """
+    nb_dates = len(days)
+    # Fenêtre ramenée au plus grand nombre impair de dates disponibles
+    window = min(window, nb_dates - 1 + nb_dates % 2)
+    if polyorder >= window:
+        raise ValueError("Le degré du polynôme doit être inférieur à la taille de la fenêtre.")
+
+    matrix = np.zeros((nb_dates, nb_dates))
+    half = window // 2
+    for t in range(nb_dates):
+        start = min(max(0, t - half), nb_dates - window)
+        neighbours = np.arange(start, start + window)
+        vander = np.vander(days[neighbours] - days[t], polyorder + 1, increasing=True)
+        # Première ligne de la pseudo-inverse : coefficient constant = valeur en t
+        matrix[t, neighbours] = np.linalg.pinv(vander)[0]
+    return matrix
+
+
+def clean_time_series_block(values, valid, days, smoothing=None):
+    """Comble les dates invalides par interpolation linéaire temporelle, puis lisse.
+
+    Le calcul est vectorisé sur tous les pixels : pour chaque date, la dernière date valide
+    précédente et la première date valide suivante sont trouvées par cumuls, puis la valeur
+    est interpolée selon l'écart réel en jours. Avant la première (après la dernière) date
+    valide, la valeur valide la plus proche est reprise. Les pixels sans aucune date valide
+    restent à NaN.
+
+    Args :
+        values (ndarray) : Série (n_dates, n_pixels).
+        valid (ndarray) : Validité booléenne de chaque observation (n_dates, n_pixels).
+        days (ndarray) : Jours de chaque date depuis la première (voir `dates_to_days`).
+        smoothing (ndarray) : Matrice de lissage optionnelle (voir `_savgol_matrix`).
+
+    Return :
+        ndarray : Série nettoyée (n_dates, n_pixels) en float32.
+    """
+    nb_dates = values.shape[0]
+    days = np.asarray(days, dtype=np.float32)[:, np.newaxis]
+    index = np.arange(nb_dates)[:, np.newaxis]
+
+    # Dernière date valide précédente et première date valide suivante (-1 / n_dates sinon)
+    previous = np.maximum.accumulate(np.where(valid, index, -1), axis=0)
+    following = np.minimum.accumulate(np.where(valid, index, nb_dates)[::-1], axis=0)[::-1]
+    has_previous, has_following = previous >= 0, following < nb_dates
+    previous = np.where(has_previous, previous, following).clip(0, nb_dates - 1)
+    following = np.where(has_following, following, previous).clip(0, nb_dates - 1)
+
+    values = values.astype(np.float32, copy=False)
+    value_prev = np.take_along_axis(values, previous, axis=0)
+    value_next = np.take_along_axis(values, following, axis=0)
+    day_prev, day_next = days[previous, 0], days[following, 0]
+    span = day_next - day_prev
+    weight = np.divide(days - day_prev, span, out=np.zeros_like(span), where=span > 0)
+
+    cleaned = np.where(valid, values, value_prev + (value_next - value_prev) * weight)
+    cleaned[:, ~valid.any(axis=0)] = np.nan
+
+    if smoothing is not None:
+        cleaned = (smoothing.astype(np.float32) @ cleaned).astype(np.float32)
+    return cleaned
+
+
+def clean_time_series(
+    in_raster,
+    out_raster,
+    dates,
+    bands_per_date=1,
+    mask_rasters=None,
+    valid_range=None,
+    reference_band=0,
+    smoothing_window=None,
+    polyorder=2,
+    block_size=512,
+    no_data=None,
+    driver="GTiff",
+    overviews=None
+):
+    """Nettoie une série temporelle raster : masque des nuages, comblement des trous, lissage.
+
+    Une observation est invalide si le masque de sa date est non nul (produits MASKS
+    Sentinel-2, ex. CLM : 0 = ciel clair), si la bande de référence de la date sort de
+    `valid_range`, ou si elle vaut le no data. Les valeurs invalides sont interpolées
+    linéairement dans le temps selon les dates réelles, puis la série peut être lissée par
+    Savitzky-Golay. Les pixels sans aucune observation valide restent à no data.
+
+    Args :
+        in_raster (str) : Série d'entrée, bandes rangées par date (date puis bande).
+        out_raster (str) : Chemin de la série nettoyée (même type et même grille).
+        dates (list) : Dates d'acquisition, dans l'ordre des bandes.
+        bands_per_date (int) : Nombre de bandes par date (1 pour le NDVI, 10 pour l'empilement).
+        mask_rasters (list) : Masques par date sur la même grille (optionnel).
+        valid_range (tuple) : Intervalle (min, max) de validité de la bande de référence.
+        reference_band (int) : Position de la bande de référence au sein d'une date.
+        smoothing_window (int) : Taille impaire de la fenêtre du lissage de Savitzky-Golay
+            (None : aucun).
+        polyorder (int) : Degré du polynôme de lissage.
+        block_size (int) : Taille des blocs lus (par défaut 512 pixels).
+        no_data (float) : Valeur de no data (par défaut celle du raster d'entrée), obligatoire
+            pour un raster de type entier : les pixels sans observation valide y sont écrits.
+        driver (str) : Driver de format à utiliser pour la sortie (par défaut 'GTiff').
+        overviews (str) : 'internal' ou 'external' pour construire les aperçus (None : aucun).
+
+    Exceptions :
+        ValueError : Si un raster ne peut pas être ouvert, si les dimensions ne concordent pas,
+            si la fenêtre de lissage est paire ou si un raster entier n'a pas de no data.
+    """
+    if smoothing_window is not None and smoothing_window % 2 == 0:
+        raise ValueError(f"La fenêtre de lissage doit être impaire (reçu {smoothing_window}).")
+
+    dataset = gdal.Open(in_raster)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{in_raster}'.")
+    nb_dates = len(dates)
+    if nb_dates * bands_per_date != dataset.RasterCount:
+        raise ValueError(
+            f"{nb_dates} dates x {bands_per_date} bandes ne correspondent pas aux "
+            f"{dataset.RasterCount} bandes de '{in_raster}'."
+        )
+    if mask_rasters is not None and len(mask_rasters) != nb_dates:
+        raise ValueError("Il faut un masque par date.")
+    masks = _open_stack(mask_rasters) if mask_rasters else None
+
+    if no_data is None:
+        no_data = dataset.GetRasterBand(1).GetNoDataValue()
+    days = dates_to_days(dates)
+    smoothing = _savgol_matrix(days, smoothing_window, polyorder) if smoothing_window else None
+
+    gdal_type = dataset.GetRasterBand(1).DataType
+    is_integer = gdal_type in (
+        gdal.GDT_Byte, gdal.GDT_UInt16, gdal.GDT_Int16, gdal.GDT_UInt32, gdal.GDT_Int32
+    )
+    if is_integer and no_data is None:
+        # Les trous (NaN) ne peuvent pas être convertis en entiers sans valeur de no data
+        raise ValueError(
+            f"'{in_raster}' est de type entier : une valeur de no data est nécessaire."
+        )
+    out_ds = _create_output_raster(out_raster, dataset, dataset.RasterCount, gdal_type, driver)
+    for band in range(1, dataset.RasterCount + 1):
+        description = dataset.GetRasterBand(band).GetDescription()
+        out_ds.GetRasterBand(band).SetDescription(description)
+        if no_data is not None:
+            out_ds.GetRasterBand(band).SetNoDataValue(no_data)
+
+    for window in _iter_blocks(dataset.RasterXSize, dataset.RasterYSize, block_size):
+        xoff, yoff, xsize, ysize = window
+        block = _read_window(dataset, window).reshape(nb_dates, bands_per_date, -1)
+
+        # Validité par date, commune à toutes les bandes de la date
+        reference = block[:, reference_band, :]
+        valid = np.ones(reference.shape, dtype=bool)
+        if no_data is not None:
+            valid &= reference != no_data
+        if valid_range is not None:
+            valid &= (reference >= valid_range[0]) & (reference <= valid_range[1])
+        if masks is not None:
+            valid &= _read_window(masks, window).reshape(nb_dates, -1) == 0
+
+        cleaned = np.empty(block.shape, dtype=np.float32)
+        for band in range(bands_per_date):
+            cleaned[:, band, :] = clean_time_series_block(block[:, band, :], valid, days, smoothing)
+
+        cleaned = cleaned.reshape(-1, ysize, xsize)
+        if no_data is not None:
+            cleaned = np.where(np.isnan(cleaned), no_data, cleaned)
+        if is_integer:
+            cleaned = np.rint(cleaned)
+        for band in range(cleaned.shape[0]):
+            out_ds.GetRasterBand(band + 1).WriteArray(cleaned[band], xoff, yoff)
+
+    out_ds = None
+    dataset = None
+    masks = None
+    if overviews is not None:
+        build_overviews(out_raster, "AVERAGE", overviews)
+
+    logging.info("Série nettoyée sauvegardée à : %s", out_raster)
+
+
+def _box_sum(mask, size):
+    """Somme exacte de `mask` sur une fenêtre size x size centrée (bords complétés par 0)."""
+    radius = size // 2
+    padded = np.pad(mask.astype(np.int32), radius + 1)[:-1, :-1]
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    nb_row, nb_col = mask.shape
+    return (
+        integral[size:size + nb_row, size:size + nb_col]
+        - integral[:nb_row, size:size + nb_col]
+        - integral[size:size + nb_row, :nb_col]
+        + integral[:nb_row, :nb_col]
+    )
+
+
+def majority_filter_block(labels, size, no_data=0):
+    """Filtre majoritaire size x size d'une carte de classes.
+
+    Chaque pixel prend la classe la plus fréquente de sa fenêtre, sans compter le no data.
+    En cas d'égalité, la classe du pixel est conservée si elle fait partie des ex aequo,
+    sinon la plus petite classe est retenue. Les pixels no data restent no data.
+
+    Args :
+        labels (ndarray) : Carte de classes 2D.
+        size (int) : Taille impaire de la fenêtre.
+        no_data (int) : Valeur de no data.
+
+    Return :
+        ndarray : Carte filtrée, de même type.
+    """
+    best_label = labels.copy()
+    best_count = np.zeros(labels.shape, dtype=np.int32)
+    center_count = np.zeros(labels.shape, dtype=np.int32)
+    for code in np.unique(labels):
+        if code == no_data:
+            continue
+        count = _box_sum(labels == code, size)
+        better = count > best_count
+        best_label[better] = code
+        best_count[better] = count[better]
+        center_count[labels == code] = count[labels == code]
+
+    filtered = np.where(center_count == best_count, labels, best_label)
+    filtered[labels == no_data] = no_data
+    return filtered
+
+
+def _component_labels(labels, structure, no_data=0):
+    """Groupes connexes de même classe, numérotés de 1 à n sur la tuile (0 : no data).
+
+    Return :
+        tuple : (identifiants des groupes (int64), classe de chaque groupe (n,), n).
+    """
+    components = np.zeros(labels.shape, dtype=np.int64)
+    classes = []
+    nb_components = 0
+    for code in np.unique(labels):
+        if code == no_data:
+            continue
+        component, count = ndimage.label(labels == code, structure=structure)
+        components[component > 0] = component[component > 0] + nb_components
+        classes.append(np.full(count, code, dtype=np.int64))
+        nb_components += count
+    classes = np.concatenate(classes) if classes else np.empty(0, dtype=np.int64)
+    return components, classes, nb_components
+
+
+def _forward_offsets(connectivity):
+    """Décalages (dy, dx) qui comptent une seule fois chaque paire de pixels voisins."""
+    return [(0, 1), (1, 0)] + ([(1, 1), (1, -1)] if connectivity == 8 else [])
+
+
+def _sum_pairs(u, v, w):
+    """Regroupe des arêtes non orientées (u, v) en additionnant leurs poids."""
+    lo, hi = np.minimum(u, v).astype(np.int64), np.maximum(u, v).astype(np.int64)
+    nb_nodes = int(hi.max()) + 1 if hi.size else 1
+    keys, inverse = np.unique(lo * nb_nodes + hi, return_inverse=True)
+    return keys // nb_nodes, keys % nb_nodes, np.bincount(inverse, weights=w).astype(np.int64)
+
+
+def _sieve_tile_graph(labels, core, origin, nb_col, min_size, connectivity=8, no_data=0):
+    """Graphe des groupes d'une tuile pour le tamisage : groupes, contacts et bords.
+
+    Args :
+        labels (ndarray) : Tuile lue avec une ligne de plus en bas et une colonne de plus
+            de chaque côté quand elles existent.
+        core (tuple) : (ligne, colonne, hauteur, largeur) de la tuile dans `labels`.
+        origin (tuple) : (ligne, colonne) de la tuile dans l'image.
+        nb_col (int) : Largeur de l'image, pour les indices globaux des pixels.
+        min_size (int) : Unité minimale de cartographie, en pixels.
+        connectivity (int) : Connexité des groupes (4 ou 8).
+        no_data (int) : Valeur de no data.
+
+    Return :
+        dict : classes, tailles et premier pixel (indice global) des groupes ; contacts
+        internes (au moins un groupe de moins de `min_size` pixels dans la tuile) ;
+        paires de pixels voisins avec les tuiles suivantes ; groupes des pixels du bord.
+    """
+    cy, cx, height, width = core
+    structure = ndimage.generate_binary_structure(2, 1 if connectivity == 4 else 2)
+    components, classes, nb_components = _component_labels(
+        labels[cy:cy + height, cx:cx + width], structure, no_data
+    )
+    sizes = np.bincount(components.ravel(), minlength=nb_components + 1)[1:]
+    # Le parcours ligne par ligne de la tuile suit l'ordre des indices globaux
+    ids, first = np.unique(components.ravel(), return_index=True)
+    first_pixel = np.empty(nb_components, dtype=np.int64)
+    first_pixel[ids[ids > 0] - 1] = (
+        (origin[0] + first[ids > 0] // width) * nb_col + origin[1] + first[ids > 0] % width
+    )
+
+    pair_u, pair_v = [], []
+    for dy, dx in _forward_offsets(connectivity):
+        u = components[:height - dy, max(0, -dx):width - max(0, dx)]
+        v = components[dy:, max(0, dx):width + min(0, dx)]
+        keep = (u > 0) & (v > 0) & (u != v)
+        pair_u.append(u[keep])
+        pair_v.append(v[keep])
+    pair_u, pair_v = np.concatenate(pair_u) - 1, np.concatenate(pair_v) - 1
+    small = sizes < min_size
+    keep = small[pair_u] | small[pair_v]
+    edges = _sum_pairs(pair_u[keep], pair_v[keep], np.ones(int(keep.sum())))
+
+    # Pixels du bord de la tuile et paires de pixels voisins vers les tuiles suivantes
+    border = np.zeros((height, width), dtype=bool)
+    border[[0, -1], :] = True
+    border[:, [0, -1]] = True
+    rows, cols = np.nonzero(border & (components > 0))
+    border_pixels = (origin[0] + rows) * nb_col + origin[1] + cols
+    border_ids = components[rows, cols] - 1
+
+    cross_ids, cross_pixels = [], []
+    for dy, dx in _forward_offsets(connectivity):
+        rows_q, cols_q = rows + dy, cols + dx
+        outside = (rows_q >= height) | (cols_q >= width) | (cols_q < 0)
+        inside = (
+            (rows_q + cy < labels.shape[0]) & (cols_q + cx >= 0) & (cols_q + cx < labels.shape[1])
+        )
+        keep = np.nonzero(outside & inside)[0]
+        keep = keep[labels[rows_q[keep] + cy, cols_q[keep] + cx] != no_data]
+        cross_ids.append(border_ids[keep])
+        cross_pixels.append((origin[0] + rows_q[keep]) * nb_col + origin[1] + cols_q[keep])
+
+    return {
+        "classes": classes, "sizes": sizes, "first_pixel": first_pixel, "edges": edges,
+        "cross_ids": np.concatenate(cross_ids), "cross_pixels": np.concatenate(cross_pixels),
+        "border_ids": border_ids, "border_pixels": border_pixels,
+    }
+
+
+def _merge_small_groups(classes, sizes, first_pixel, u, v, w, min_size):
+    """Fusionne les groupes de moins de `min_size` pixels jusqu'à ce qu'il n'en reste plus.
+
+    À chaque passe, chaque petit groupe rejoint, parmi ses voisins plus grands que lui
+    (taille, puis premier pixel pour départager), celui avec lequel il a le plus de
+    contacts. Les plus petits groupes sont donc absorbés en premier et un groupe n'absorbe
+    jamais un groupe plus grand. Les chaînes de fusions sont suivies jusqu'à leur racine,
+    puis les groupes voisins devenus de même classe sont réunis. Seul un petit groupe sans
+    aucun voisin (îlot entouré de no data) peut rester sous `min_size`.
+
+    Args :
+        classes, sizes, first_pixel (ndarray) : Classe, taille et premier pixel des groupes.
+        u, v, w (ndarray) : Arêtes non orientées entre groupes et nombre de contacts.
+        min_size (int) : Unité minimale de cartographie, en pixels.
+
+    Return :
+        ndarray : Classe finale de chaque groupe d'entrée.
+    """
+    group = np.arange(sizes.size)
+    while True:
+        small = sizes < min_size
+        source, target, contacts = np.r_[u, v], np.r_[v, u], np.r_[w, w]
+        bigger = (sizes[target] > sizes[source]) | (
+            (sizes[target] == sizes[source]) & (first_pixel[target] < first_pixel[source])
+        )
+        allowed = small[source] & bigger
+        if not allowed.any():
+            return classes[group]
+        source, target, contacts = source[allowed], target[allowed], contacts[allowed]
+
+        # Meilleur voisin : plus de contacts, puis plus grand, puis plus petite classe
+        order = np.lexsort(
+            (first_pixel[target], classes[target], -sizes[target], -contacts, source)
+        )
+        first = order[np.r_[True, source[order][1:] != source[order][:-1]]]
+        parent = np.arange(sizes.size)
+        parent[source[first]] = target[first]
+        while True:
+            grand_parent = parent[parent]
+            if np.array_equal(grand_parent, parent):
+                break
+            parent = grand_parent
+        classes = classes[parent]
+
+        # Réunion des groupes voisins de même classe (dont chaque groupe et sa cible)
+        same = classes[u] == classes[v]
+        graph = csr_matrix(
+            (np.ones(int(same.sum()), dtype=np.int8), (u[same], v[same])),
+            shape=(sizes.size, sizes.size)
+        )
+        nb_groups, merged = connected_components(graph, directed=False)
+        group = merged[group]
+        new_classes = np.empty(nb_groups, dtype=classes.dtype)
+        new_classes[merged] = classes
+        new_first = np.full(nb_groups, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(new_first, merged, first_pixel)
+        classes, first_pixel = new_classes, new_first
+        sizes = np.bincount(merged, weights=sizes, minlength=nb_groups).astype(np.int64)
+
+        u, v = merged[u], merged[v]
+        keep = u != v
+        u, v, w = _sum_pairs(u[keep], v[keep], w[keep])
+        small = sizes < min_size
+        keep = small[u] | small[v]
+        u, v, w = u[keep], v[keep], w[keep]
+
+
+def _sieve_resolve(graphs, min_size):
+    """Classe finale de chaque groupe de chaque tuile, à partir des graphes de toutes les tuiles.
+
+    Les morceaux d'un même groupe coupé par les tuiles sont réunis, puis les petits groupes
+    sont fusionnés sur l'image entière : le résultat ne dépend pas du découpage en tuiles.
+
+    Return :
+        list : Classe finale des groupes de chaque tuile, dans l'ordre de `graphs`.
+    """
+    counts = [graph["sizes"].size for graph in graphs]
+    offsets = np.r_[0, np.cumsum(counts)].astype(np.int64)
+    nb_components = int(offsets[-1])
+
+    def stack(values, shift=False):
+        """Concatène une entrée des graphes, en numérotation globale des groupes si `shift`."""
+        return np.concatenate([
+            values(graph) + (offset if shift else 0) for graph, offset in zip(graphs, offsets)
+        ])
+
+    classes = stack(lambda graph: graph["classes"])
+    sizes = stack(lambda graph: graph["sizes"]).astype(np.int64)
+    first_pixel = stack(lambda graph: graph["first_pixel"])
+    u = stack(lambda graph: graph["edges"][0], shift=True)
+    v = stack(lambda graph: graph["edges"][1], shift=True)
+    w = stack(lambda graph: graph["edges"][2])
+
+    # Paires de pixels voisins entre tuiles : groupe du pixel voisin retrouvé par son indice
+    border_pixels = stack(lambda graph: graph["border_pixels"])
+    border_ids = stack(lambda graph: graph["border_ids"], shift=True)
+    order = np.argsort(border_pixels)
+    border_pixels, border_ids = border_pixels[order], border_ids[order]
+    cross_u = stack(lambda graph: graph["cross_ids"], shift=True)
+    cross_pixels = stack(lambda graph: graph["cross_pixels"])
+    cross_v = border_ids[np.searchsorted(border_pixels, cross_pixels)] if cross_u.size else cross_u
+
+    # Morceaux de même classe de part et d'autre d'une limite de tuiles : même groupe
+    same = classes[cross_u] == classes[cross_v]
+    graph = csr_matrix(
+        (np.ones(int(same.sum()), dtype=np.int8), (cross_u[same], cross_v[same])),
+        shape=(nb_components, nb_components)
+    )
+    nb_groups, group = connected_components(graph, directed=False)
+    group_classes = np.empty(nb_groups, dtype=classes.dtype)
+    group_classes[group] = classes
+    group_first = np.full(nb_groups, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(group_first, group, first_pixel)
+    group_sizes = np.bincount(group, weights=sizes, minlength=nb_groups).astype(np.int64)
+
+    u = group[np.r_[u, cross_u[~same]]]
+    v = group[np.r_[v, cross_v[~same]]]
+    w = np.r_[w, np.ones(int((~same).sum()), dtype=np.int64)]
+    keep = u != v
+    u, v, w = _sum_pairs(u[keep], v[keep], w[keep])
+    small = group_sizes < min_size
+    keep = small[u] | small[v]
+
+    final = _merge_small_groups(
+        group_classes, group_sizes, group_first, u[keep], v[keep], w[keep], min_size
+    )[group]
+    return [final[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _sieve_apply(labels, final_classes, connectivity=8, no_data=0):
+    """Remplace la classe de chaque groupe de la tuile par sa classe finale."""
+    structure = ndimage.generate_binary_structure(2, 1 if connectivity == 4 else 2)
+    components, _, _ = _component_labels(labels, structure, no_data)
+    sieved = labels.copy()
+    valid = components > 0
+    sieved[valid] = final_classes[components[valid] - 1].astype(labels.dtype)
+    return sieved
+
+
+def sieve_block(labels, min_size, connectivity=8, no_data=0):
+    """Supprime les groupes de pixels connexes de même classe plus petits que `min_size`.
+
+    Les petits groupes sont fusionnés de façon itérative, les plus petits d'abord, avec le
+    voisin plus grand avec lequel ils partagent le plus de contacts (paires de pixels
+    voisins), jusqu'à ce qu'aucun groupe ne soit sous `min_size` (voir
+    `_merge_small_groups`). Seul un îlot entouré de no data plus petit que `min_size` est
+    conservé. `postprocess_classification` donne le même résultat par tuiles.
+
+    Args :
+        labels (ndarray) : Carte de classes 2D.
+        min_size (int) : Unité minimale de cartographie, en pixels.
+        connectivity (int) : Connexité des groupes (4 ou 8).
+        no_data (int) : Valeur de no data.
+
+    Return :
+        ndarray : Carte filtrée, de même type.
+    """
+    nb_row, nb_col = labels.shape
+    graph = _sieve_tile_graph(
+        labels, (0, 0, nb_row, nb_col), (0, 0), nb_col, min_size, connectivity, no_data
+    )
+    final_classes = _sieve_resolve([graph], min_size)[0]
+    return _sieve_apply(labels, final_classes, connectivity, no_data)
+
+
+def postprocess_block(labels, min_size=None, majority_size=None, connectivity=8, no_data=0):
+    """Applique le tamisage puis le filtre majoritaire à une carte de classes."""
+    if min_size:
+        labels = sieve_block(labels, min_size, connectivity, no_data)
+    if majority_size:
+        labels = majority_filter_block(labels, majority_size, no_data)
+    return labels
+
+
+def postprocess_halo(majority_size=None):
+    """Marge (pixels) à lire autour d'une tuile pour un filtre majoritaire identique à
+    l'image entière : le rayon de la fenêtre. Le tamisage n'a pas besoin de marge, les
+    petits groupes étant fusionnés sur le graphe de l'image entière."""
+    return (majority_size or 0) // 2
+
+
+def _read_tile(in_raster, window, margins):
+    """Lit une tuile avec ses marges (gauche, haut, droite, bas) limitées à l'image.
+
+    Return :
+        tuple : (tableau lu, (ligne, colonne) de la tuile dans le tableau).
+    """
+    dataset = gdal.Open(in_raster)
+    xoff, yoff, xsize, ysize = window
+    left, top, right, bottom = margins
+    x0, y0 = max(0, xoff - left), max(0, yoff - top)
+    x1 = min(dataset.RasterXSize, xoff + xsize + right)
+    y1 = min(dataset.RasterYSize, yoff + ysize + bottom)
+    labels = dataset.GetRasterBand(1).ReadAsArray(x0, y0, x1 - x0, y1 - y0)
+    dataset = None
+    return labels, (yoff - y0, xoff - x0)
+
+
+def _sieve_graph_tile(in_raster, window, nb_col, min_size, connectivity, no_data):
+    """Graphe de tamisage d'une tuile lue avec une ligne et une colonne de voisins."""
+    labels, (cy, cx) = _read_tile(in_raster, window, (1, 0, 1, 1))
+    xoff, yoff, xsize, ysize = window
+    return window, _sieve_tile_graph(
+        labels, (cy, cx, ysize, xsize), (yoff, xoff), nb_col, min_size, connectivity, no_data
+    )
+
+
+def _sieve_apply_tile(in_raster, window, final_classes, connectivity, no_data):
+    """Applique les classes finales du tamisage à une tuile."""
+    labels, _ = _read_tile(in_raster, window, (0, 0, 0, 0))
+    return window, _sieve_apply(labels, final_classes, connectivity, no_data)
+
+
+def _majority_tile(in_raster, window, majority_size, no_data):
+    """Lit une tuile avec sa marge, la filtre et renvoie la partie centrale."""
+    halo = postprocess_halo(majority_size)
+    labels, (cy, cx) = _read_tile(in_raster, window, (halo,) * 4)
+    xsize, ysize = window[2], window[3]
+    result = postprocess_block(labels, majority_size=majority_size, no_data=no_data)
+    return window, result[cy:cy + ysize, cx:cx + xsize]
+
+
+def _map_tiles(executor, n_jobs, func, tasks):
+    """Soumet les tuiles au pool et renvoie leurs résultats dans l'ordre, avec au plus
+    2 x n_jobs tuiles en attente."""
+    pending = deque()
+    for args in tasks:
+        pending.append(executor.submit(func, *args))
+        if len(pending) >= 2 * n_jobs:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def postprocess_classification(
+    in_raster,
+    out_raster,
+    min_size=None,
+    majority_size=None,
+    connectivity=8,
+    tile_size=1024,
+    n_jobs=None,
+    no_data=0,
+    driver="GTiff",
+    overviews=None
+):
+    """Post-traitement d'une carte de classes par tuiles : tamisage (UMC) et filtre majoritaire.
+
+    Le tamisage se fait en deux passes sur les tuiles : la première construit le graphe
+    des groupes de chaque tuile (groupes, contacts, pixels de bord), les groupes coupés par
+    les tuiles sont réunis et les petits groupes fusionnés sur ce graphe (voir
+    `_merge_small_groups`), puis la seconde écrit la classe finale de chaque pixel. Le
+    filtre majoritaire lit chaque tuile avec une marge (`postprocess_halo`) et n'écrit que
+    sa partie centrale. Le résultat est identique à `postprocess_block` sur l'image
+    entière, avec une mémoire bornée par la taille des tuiles et le nombre de groupes.
+    Les tuiles sont traitées en parallèle et au plus 2 x n_jobs tuiles sont en attente.
+
+    Args :
+        in_raster (str) : Carte de classes d'entrée (1 bande).
+        out_raster (str) : Chemin de la carte post-traitée.
+        min_size (int) : Unité minimale de cartographie en pixels (None : pas de tamisage).
+        majority_size (int) : Taille impaire du filtre majoritaire (None : pas de filtre).
+        connectivity (int) : Connexité des groupes pour le tamisage (4 ou 8).
+        tile_size (int) : Taille des tuiles (par défaut 1024 pixels).
+        n_jobs (int) : Nombre de processus (par défaut le nombre de coeurs).
+        no_data (int) : Valeur de no data.
+        driver (str) : Driver de format à utiliser pour la sortie (par défaut 'GTiff').
+        overviews (str) : 'internal' ou 'external' pour construire les aperçus (None : aucun).
+
+    Exceptions :
+        ValueError : Si le raster ne peut pas être ouvert ou si la fenêtre est paire.
+    """
+    if majority_size and majority_size % 2 == 0:
+        raise ValueError("La taille du filtre majoritaire doit être impaire.")
+    dataset = gdal.Open(in_raster)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{in_raster}'.")
+    nb_col = dataset.RasterXSize
+    windows = list(_iter_blocks(dataset.RasterXSize, dataset.RasterYSize, tile_size))
+    # Carte tamisée intermédiaire quand le filtre majoritaire suit
+    sieved_raster = out_raster
+    if majority_size:
+        sieved_raster = f"{os.path.splitext(out_raster)[0]}_tamisee.tif"
+
+    def create(filename, file_driver):
+        out_ds = _create_output_raster(
+            filename, dataset, 1, dataset.GetRasterBand(1).DataType, file_driver
+        )
+        out_ds.GetRasterBand(1).SetNoDataValue(no_data)
+        return out_ds
+
+    n_jobs = n_jobs or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        source = in_raster
+        if min_size:
+            graphs = dict(_map_tiles(executor, n_jobs, _sieve_graph_tile, (
+                (in_raster, window, nb_col, min_size, connectivity, no_data) for window in windows
+            )))
+            final_classes = _sieve_resolve([graphs.pop(window) for window in windows], min_size)
+            out_ds = create(sieved_raster, "GTiff" if majority_size else driver)
+            for window, result in _map_tiles(executor, n_jobs, _sieve_apply_tile, (
+                (in_raster, window, classes, connectivity, no_data)
+                for window, classes in zip(windows, final_classes)
+            )):
+                out_ds.GetRasterBand(1).WriteArray(result, window[0], window[1])
+            out_ds = None
+            source = sieved_raster
+
+        if majority_size or not min_size:
+            out_ds = create(out_raster, driver)
+            for window, result in _map_tiles(executor, n_jobs, _majority_tile, (
+                (source, window, majority_size, no_data) for window in windows
+            )):
+                out_ds.GetRasterBand(1).WriteArray(result, window[0], window[1])
+            out_ds = None
+    dataset = None
+    if source != in_raster and source != out_raster:
+        gdal.GetDriverByName("GTiff").Delete(source)
+
+    if overviews is not None:
+        build_overviews(out_raster, "MODE", overviews)
+
+    logging.info("Carte post-traitée sauvegardée à : %s", out_raster)
+
+
+def _overview_levels(nb_col, nb_row, min_size=256):
+    """Facteurs de réduction 2, 4, 8... jusqu'à ce que l'aperçu tienne dans `min_size` pixels."""
+    levels = []
+    factor = 2
+    while max(nb_col, nb_row) / (factor // 2) > min_size:
+        levels.append(factor)
+        factor *= 2
+    return levels
+
+
+def build_overviews(raster_file, resampling="AVERAGE", mode="internal", levels=None):
+    """Construit les aperçus (pyramides) d'un raster, sur tous les coeurs disponibles.
+
+    Les bandes continues (réflectances, NDVI, probabilités) se réduisent par moyenne
+    ('AVERAGE'), les cartes de classes par classe majoritaire ('MODE') pour ne pas créer
+    de codes qui n'existent pas.
+
+    Args :
+        raster_file (str) : Chemin du raster.
+        resampling (str) : Méthode de rééchantillonnage GDAL ('AVERAGE', 'MODE', 'NEAREST'...).
+        mode (str) : 'internal' (dans le fichier) ou 'external' (fichier .ovr à côté).
+        levels (list) : Facteurs de réduction (par défaut 2, 4, 8... jusqu'à 256 pixels).
+
+    Exceptions :
+        ValueError : Si le raster ne peut pas être ouvert ou si le mode est inconnu.
+    """
+    if mode not in ("internal", "external"):
+        raise ValueError("Le mode des aperçus doit être 'internal' ou 'external'.")
+    # Ouvert en lecture seule, GDAL écrit les aperçus dans un fichier .ovr externe
+    access = gdal.GA_Update if mode == "internal" else gdal.GA_ReadOnly
+    dataset = gdal.Open(raster_file, access)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{raster_file}'.")
+    if levels is None:
+        levels = _overview_levels(dataset.RasterXSize, dataset.RasterYSize)
+    if not levels:
+        return
+
+    config_keys = ("GDAL_NUM_THREADS", "COMPRESS_OVERVIEW")
+    previous = {key: gdal.GetConfigOption(key) for key in config_keys}
+    gdal.SetConfigOption("GDAL_NUM_THREADS", "ALL_CPUS")
+    gdal.SetConfigOption("COMPRESS_OVERVIEW", "DEFLATE")
+    try:
+        dataset.BuildOverviews(resampling, levels)
+    finally:
+        for key, value in previous.items():
+            gdal.SetConfigOption(key, value)
+    dataset = None
+
+    logging.info("Aperçus %s (%s) construits pour : %s", levels, resampling, raster_file)
+
+
+# Couleurs par défaut des aperçus de cartes d'essences (feuillus en vert, conifères en bleu)
+CLASS_COLORS = {
+    0: (255, 255, 255),  # No data
+    11: (116, 196, 118),  # Autres feuillus
+    12: (35, 139, 69),  # Chêne
+    13: (199, 233, 192),  # Robinier
+    14: (255, 237, 111),  # Peupleraie
+    21: (107, 174, 214),  # Autres conifères autre que pin
+    22: (158, 154, 200),  # Autres pins
+    23: (8, 69, 148),  # Douglas
+    24: (84, 39, 143),  # Pin laricio ou pin noir
+    25: (203, 24, 29),  # Pin maritime
+}
+
+
+def export_quicklook(
+    raster_file,
+    out_filename,
+    bands=None,
+    max_size=1024,
+    categorical=False,
+    colors=None
+):
+    """Exporte un aperçu léger (PNG, JPEG...) d'un raster pour les rapports.
+
+    La lecture passe par les aperçus du raster s'ils existent, ce qui évite de lire toute
+    l'image en pleine résolution. Les bandes continues sont étirées entre leurs minimum
+    et maximum, les cartes de classes sont réduites par classe majoritaire et colorées
+    avec leur propre table de couleurs, ou à défaut avec `CLASS_COLORS`.
+
+    Args :
+        raster_file (str) : Chemin du raster.
+        out_filename (str) : Chemin de l'aperçu ; le format est déduit de l'extension.
+        bands (list) : Bandes exportées (numérotées à partir de 1), ex. [3, 2, 1] pour une
+            composition colorée. Par défaut la première bande.
+        max_size (int) : Taille maximale du plus grand côté de l'aperçu, en pixels.
+        categorical (bool) : True pour une carte de classes.
+        colors (dict) : Couleurs {code: (r, g, b)} d'une carte de classes, qui remplacent
+            la table de couleurs de la carte et `CLASS_COLORS`.
+
+    Exceptions :
+        ValueError : Si le raster ne peut pas être ouvert.
+    """
+    dataset = gdal.Open(raster_file)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{raster_file}'.")
+    bands = bands or [1]
+    ratio = max_size / max(dataset.RasterXSize, dataset.RasterYSize)
+    width = max(1, round(dataset.RasterXSize * min(1, ratio)))
+    height = max(1, round(dataset.RasterYSize * min(1, ratio)))
+
+    options = {"format": "MEM", "bandList": bands, "width": width, "height": height}
+    if categorical:
+        options.update(resampleAlg="mode", outputType=gdal.GDT_Byte)
+    else:
+        # Étirement de chaque bande entre son minimum et son maximum
+        options.update(
+            resampleAlg="average", outputType=gdal.GDT_Byte, scaleParams=[[]] * len(bands)
+        )
+    preview = gdal.Translate("", dataset, **options)
+
+    if categorical:
+        # Table de couleurs : celle demandée, sinon celle de la carte, sinon celle par défaut
+        color_table = dataset.GetRasterBand(bands[0]).GetColorTable()
+        if colors or color_table is None:
+            color_table = gdal.ColorTable()
+            for code, rgb in (colors or CLASS_COLORS).items():
+                color_table.SetColorEntry(int(code), tuple(rgb))
+        preview.GetRasterBand(1).SetRasterColorTable(color_table)
+
+    extension = os.path.splitext(out_filename)[1].lower()
+    driver = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG"}.get(extension, "PNG")
+    gdal.GetDriverByName(driver).CreateCopy(out_filename, preview)
+    preview = None
+    dataset = None
+
+    logging.info("Aperçu sauvegardé à : %s", out_filename)
+
+
+def rasterize_polygon_ids(gdf, ref_raster, all_touched=False):
+    """Rasterise en une fois les identifiants des polygones sur la grille d'un raster.
+
+    Chaque pixel reçoit la position du polygone dans `gdf` plus 1 (0 en dehors des
+    polygones). Si des polygones se superposent, le dernier l'emporte.
+
+    Args :
+        gdf (GeoDataFrame) : Polygones, dans la projection du raster.
+        ref_raster (str) : Raster définissant la grille.
+        all_touched (bool) : Si True, grave tous les pixels touchés par un polygone.
+
+    Return :
+        ndarray : Identifiants (lignes, colonnes) en int32.
+
+    Exceptions :
+        ValueError : Si le raster ne peut pas être ouvert.
+    """
+    dataset = gdal.Open(ref_raster)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{ref_raster}'.")
+    window = (0, 0, dataset.RasterXSize, dataset.RasterYSize)
+    geotransform, projection = dataset.GetGeoTransform(), dataset.GetProjection()
+    dataset = None
+
+    geometries = gdf.geometry.to_numpy()
+    keep = np.array([g is not None and not g.is_empty for g in geometries], dtype=bool)
+    ids = np.arange(1, len(gdf) + 1)[keep]
+    return _rasterize_window(
+        geometries[keep], ids, geotransform, projection, window, all_touched=all_touched
+    ).astype(np.int32)
+
+
+def _raster_classes(band):
+    """Valeurs présentes dans une bande Byte, d'après son histogramme exact."""
+    histogram = band.GetHistogram(-0.5, 255.5, 256, include_out_of_range=0, approx_ok=0)
+    return np.nonzero(histogram)[0]
+
+
+def zonal_class_counts(
+    gdf,
+    class_raster,
+    classes=None,
+    no_data=0,
+    sparse=False,
+    all_touched=False
+):
+    """Compte les pixels de chaque classe dans chaque polygone, en une seule passe.
+
+    Les identifiants des polygones sont rasterisés une fois sur la grille de la carte,
+    puis la matrice polygones x classes est obtenue par un seul `np.bincount` sur les
+    couples (polygone, classe). Remplace `zonal_stats(..., categorical=True)`.
+
+    Args :
+        gdf (GeoDataFrame) : Polygones, dans la projection de la carte.
+        class_raster (str) : Carte de classes (1 bande).
+        classes (list) : Codes à compter (par défaut toutes les valeurs d'une carte Byte).
+        no_data (int) : Valeur ignorée dans la carte.
+        sparse (bool) : Si True, renvoie une matrice creuse `scipy.sparse.csr_matrix`.
+        all_touched (bool) : Si True, compte tous les pixels touchés par un polygone.
+
+    Return :
+        tuple : Matrice (n_polygones, n_classes) en int64 dans l'ordre de `gdf`, et les codes
+        des colonnes.
+
+    Exceptions :
+        ValueError : Si la carte ne peut pas être ouverte, ou si `classes` manque pour une
+            carte qui n'est pas en Byte.
+    """
+    dataset = gdal.Open(class_raster)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{class_raster}'.")
+    band = dataset.GetRasterBand(1)
+    if classes is None:
+        if band.DataType != gdal.GDT_Byte:
+            raise ValueError("Les classes doivent être fournies pour une carte non Byte.")
+        classes = _raster_classes(band)
+    classes = np.asarray([code for code in classes if code != no_data], dtype=np.int64)
+    values = band.ReadAsArray()
+    dataset = None
+
+    ids = rasterize_polygon_ids(gdf, class_raster, all_touched)
+    counts = _class_counts(ids, values, len(gdf), classes, sparse)
+    return counts, classes
+
+
+def _class_index(values, classes):
+    """Position de chaque valeur dans `classes`, -1 si la valeur n'en fait pas partie.
+
+    La table de correspondance est décalée de la plus petite valeur : une valeur négative
+    (no data Int16...) ne peut pas reboucler sur la fin de la table.
+    """
+    offset = min(int(classes.min(initial=0)), int(values.min(initial=0)))
+    size = max(int(classes.max(initial=0)), int(values.max(initial=0))) - offset + 1
+    lookup = np.full(size, -1)
+    lookup[classes - offset] = np.arange(len(classes))
+    return lookup[values - offset]
+
+
+def _class_counts(ids, values, nb_polygons, classes, sparse=False):
+    """Matrice polygones x classes à partir des identifiants (position + 1) et des classes."""
+    class_index = _class_index(values.astype(np.int64, copy=False), classes)
+    inside = (ids > 0) & (class_index >= 0)
+    keys = (ids[inside].astype(np.int64) - 1) * len(classes) + class_index[inside]
+
+    if sparse:
+        keys, counts = np.unique(keys, return_counts=True)
+        return csr_matrix(
+            (counts, (keys // len(classes), keys % len(classes))),
+            shape=(nb_polygons, len(classes))
+        )
+    counts = np.bincount(keys, minlength=nb_polygons * len(classes))
+    return counts.reshape(nb_polygons, len(classes))
+
+
+def _zonal_tile(value_raster, class_raster, window, geometries, classes, band_indices,
+                no_data, all_touched):
+    """Statistiques partielles d'une tuile : effectifs, sommes et sommes des carrés.
+
+    Return :
+        dict : 'polygones' (positions locales des polygones présents), 'nb' (k, n_classes),
+        'somme' et 'somme_carres' (k, n_classes, n_bandes), en float64.
+    """
+    reference = gdal.Open(class_raster if class_raster is not None else value_raster)
+    geotransform, projection = reference.GetGeoTransform(), reference.GetProjection()
+    reference = None
+    xsize, ysize = window[2], window[3]
+    nb_polygons, nb_classes = len(geometries), max(len(classes), 1)
+
+    ids = _rasterize_window(
+        geometries, np.arange(1, nb_polygons + 1), geotransform, projection, window,
+        all_touched=all_touched
+    )
+    valid = ids > 0
+    class_index = np.zeros((ysize, xsize), dtype=np.int64)
+    if class_raster is not None:
+        class_ds = gdal.Open(class_raster)
+        labels = _read_window(class_ds, window)[0].astype(np.int64)
+        class_ds = None
+        class_index = _class_index(labels, classes)
+        valid &= class_index >= 0
+
+    block = None
+    if value_raster is not None:
+        datasets = _open_stack(value_raster)
+        nodata_values = _stack_nodata(datasets, band_indices, no_data)[:, np.newaxis, np.newaxis]
+        block = _read_window(datasets, window, band_indices)
+        valid &= np.any(block != nodata_values, axis=0)
+        datasets = None
+
+    keys = (ids[valid].astype(np.int64) - 1) * nb_classes + class_index[valid]
+    size = nb_polygons * nb_classes
+    partial = {"nb": np.bincount(keys, minlength=size).reshape(nb_polygons, nb_classes)}
+    if block is not None:
+        values = block[:, valid].astype(np.float64)
+        partial["somme"] = np.stack(
+            [np.bincount(keys, weights=band, minlength=size) for band in values], axis=-1
+        ).reshape(nb_polygons, nb_classes, -1)
+        partial["somme_carres"] = np.stack(
+            [np.bincount(keys, weights=band * band, minlength=size) for band in values], axis=-1
+        ).reshape(nb_polygons, nb_classes, -1)
+
+    # Seuls les polygones présents dans la tuile sont renvoyés
+    present = partial["nb"].sum(axis=1) > 0
+    partial = {key: value[present] for key, value in partial.items()}
+    partial["polygones"] = np.nonzero(present)[0]
+    return partial
+
+
+def merge_zonal_partials(total, partial, positions):
+    """Ajoute des statistiques partielles aux statistiques globales (addition exacte).
+
+    Args :
+        total (dict) : Statistiques globales, indexées par position de polygone.
+        partial (dict) : Statistiques partielles d'une tuile (voir `zonal_statistics`).
+        positions (ndarray) : Position globale de chaque polygone de la tuile.
+    """
+    rows = positions[partial["polygones"]]
+    for key in ("nb", "somme", "somme_carres"):
+        if key in partial:
+            # Chaque polygone n'apparaît qu'une fois par tuile : l'indexation suffit
+            total[key][rows] += partial[key]
+
+
+def zonal_statistics(
+    gdf,
+    value_raster=None,
+    class_raster=None,
+    classes=None,
+    tile_size=2048,
+    n_jobs=None,
+    no_data=0,
+    band_indices=None,
+    all_touched=False
+):
+    """Statistiques zonales par polygone et par classe, par tuiles traitées en parallèle.
+
+    Le raster est découpé en tuiles ; chaque processus rasterise les seuls polygones qui
+    touchent sa tuile et renvoie des effectifs, sommes et sommes des carrés par polygone
+    et par classe. Ces résultats partiels s'additionnent exactement, un polygone à cheval
+    sur plusieurs tuiles est donc combiné sans perte. La mémoire est bornée par la taille
+    des tuiles et au plus 2 x n_jobs résultats partiels sont en attente.
+
+    Args :
+        gdf (GeoDataFrame) : Polygones, dans la projection des rasters.
+        value_raster (str | list) : Image dont on résume les bandes (optionnel).
+        class_raster (str) : Carte de classes sur la même grille (optionnel).
+        classes (list) : Codes de `class_raster` à distinguer (par défaut toutes les valeurs
+            d'une carte Byte).
+        tile_size (int) : Taille des tuiles (par défaut 2048 pixels).
+        n_jobs (int) : Nombre de processus (par défaut le nombre de coeurs).
+        no_data (int) : Valeur de no data de la carte et des bandes qui n'en déclarent pas.
+        band_indices (list) : Positions (à partir de 0) des bandes de `value_raster` à lire.
+        all_touched (bool) : Si True, compte tous les pixels touchés par un polygone.
+
+    Return :
+        dict : 'classes', 'nb' (n_polygones, n_classes) et, avec `value_raster`, 'somme' et
+        'somme_carres' (n_polygones, n_classes, n_bandes), dans l'ordre de `gdf`. Sans carte
+        de classes, il n'y a qu'une classe.
+
+    Exceptions :
+        ValueError : Si aucun raster n'est donné, si un raster ne peut pas être ouvert, ou si
+            `classes` manque pour une carte de classes qui n'est pas en Byte.
+    """
+    if value_raster is None and class_raster is None:
+        raise ValueError("Il faut au moins un raster de valeurs ou une carte de classes.")
+    reference = _open_stack(class_raster if class_raster is not None else value_raster)[0]
+    geotransform = reference.GetGeoTransform()
+    nb_col, nb_row = reference.RasterXSize, reference.RasterYSize
+    if class_raster is not None and classes is None:
+        band = reference.GetRasterBand(1)
+        if band.DataType != gdal.GDT_Byte:
+            raise ValueError("Les classes doivent être fournies pour une carte non Byte.")
+        classes = _raster_classes(band)
+    reference = None
+    classes = [] if classes is None else [code for code in classes if code != no_data]
+    classes = np.asarray(classes, dtype=np.int64)
+
+    nb_classes = max(len(classes), 1)
+    total = {"classes": classes, "nb": np.zeros((len(gdf), nb_classes), dtype=np.int64)}
+    if value_raster is not None:
+        nb_band = len(_stack_nodata(_open_stack(value_raster), band_indices, no_data))
+        total["somme"] = np.zeros((len(gdf), nb_classes, nb_band))
+        total["somme_carres"] = np.zeros((len(gdf), nb_classes, nb_band))
+
+    geometries = gdf.geometry.to_numpy()
+    sindex = gdf.sindex
+    n_jobs = n_jobs or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        pending = deque()
+        for window in _iter_blocks(nb_col, nb_row, tile_size):
+            xoff, yoff, xsize, ysize = window
+            # Emprise de la tuile et polygones qui la touchent
+            x0 = geotransform[0] + xoff * geotransform[1]
+            y0 = geotransform[3] + yoff * geotransform[5]
+            x1 = x0 + xsize * geotransform[1]
+            y1 = y0 + ysize * geotransform[5]
+            positions = sindex.query(box(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+            positions = np.sort(positions)
+            keep = [g is not None and not g.is_empty for g in geometries[positions]]
+            positions = positions[np.asarray(keep, dtype=bool)]
+            if positions.size == 0:
+                continue
+            future = executor.submit(
+                _zonal_tile, value_raster, class_raster, window, geometries[positions],
+                classes, band_indices, no_data, all_touched
+            )
+            pending.append((future, positions))
+            if len(pending) >= 2 * n_jobs:
+                future, positions = pending.popleft()
+                merge_zonal_partials(total, future.result(), positions)
+        while pending:
+            future, positions = pending.popleft()
+            merge_zonal_partials(total, future.result(), positions)
+
+    return total
+
+
+def zonal_mean_std(stats):
+    """Moyenne et écart type par polygone, classe et bande à partir de `zonal_statistics`.
+
+    Return :
+        tuple : Moyennes et écarts types (n_polygones, n_classes, n_bandes), NaN sans pixel.
+    """
+    nb = stats["nb"][..., np.newaxis].astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = stats["somme"] / nb
+        variance = stats["somme_carres"] / nb - mean ** 2
+    return mean, np.sqrt(np.maximum(variance, 0))
+
+
+def stand_ids(gdf, id_field="ID"):
+    """Identifiant stable de chaque polygone : le champ `id_field` (ID de la BD Forêt)
+    s'il existe et est unique, sinon l'index du GeoDataFrame.
+
+    Return :
+        Series : Identifiants, alignés sur `gdf`, nommés `id_field`.
+    """
+    if id_field in gdf.columns and gdf[id_field].notna().all() and gdf[id_field].is_unique:
+        return gdf[id_field].rename(id_field)
+    logging.warning("Champ '%s' absent ou non unique : l'index sert d'identifiant", id_field)
+    return pd.Series(gdf.index, index=gdf.index, name=id_field)
+
+
+def write_stand_table(gdf, columns, out_table, id_field="ID", out_vector=None):
+    """Écrit les résultats par peuplement dans une table Parquet séparée, sans toucher à la
+    couche d'entrée.
+
+    La table ne contient que l'identifiant stable et les colonnes produites ; elle se
+    joint à la couche par `join_stand_table`. Un export vecteur (GeoPackage, shapefile...)
+    de la couche jointe peut être demandé en plus.
+
+    Args :
+        gdf (GeoDataFrame) : Polygones classés.
+        columns (dict) : Colonnes à écrire {nom: valeurs alignées sur `gdf`}.
+        out_table (str) : Chemin de la table Parquet.
+        id_field (str) : Nom du champ identifiant (voir `stand_ids`).
+        out_vector (str) : Chemin optionnel d'un export vecteur ; le format est déduit de
+            l'extension (.gpkg, .shp...).
+
+    Return :
+        DataFrame : Table écrite.
+    """
+    table = pd.DataFrame({name: np.asarray(values) for name, values in columns.items()})
+    table.insert(0, id_field, stand_ids(gdf, id_field).to_numpy())
+    table.to_parquet(out_table, index=False)
+    logging.info("Table des peuplements sauvegardée à : %s", out_table)
+
+    if out_vector is not None:
+        layer = gdf.drop(columns=[c for c in table.columns if c in gdf.columns])
+        layer = layer.assign(**{id_field: table[id_field].to_numpy()})
+        layer.merge(table, on=id_field, how="left").to_file(out_vector)
+        logging.info("Couche des peuplements exportée à : %s", out_vector)
+    return table
+
+
+def join_stand_table(gdf, table_file, id_field="ID"):
+    """Joint une table de résultats par peuplement (voir `write_stand_table`) à la couche."""
+    table = pd.read_parquet(table_file)
+    layer = gdf.assign(**{id_field: stand_ids(gdf, id_field).to_numpy()})
+    return layer.merge(table, on=id_field, how="left")
+
+
+def proba_classes(proba_raster):
+    """Codes des classes d'une carte de probabilités, lus dans les descriptions 'proba_<code>'."""
+    dataset = gdal.Open(proba_raster)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{proba_raster}'.")
+    descriptions = [
+        dataset.GetRasterBand(band).GetDescription() for band in range(1, dataset.RasterCount + 1)
+    ]
+    dataset = None
+    if not all(re.fullmatch(r"proba_\d+", d) for d in descriptions):
+        raise ValueError(f"Les bandes de '{proba_raster}' ne sont pas nommées 'proba_<code>'.")
+    return np.array([int(d.split("_")[1]) for d in descriptions])
+
+
+def stand_probabilities(gdf, proba_raster, tile_size=2048, n_jobs=None):
+    """Probabilité moyenne de chaque classe par polygone, en une passe sur la carte de
+    probabilités produite par `predict_image_by_blocks` (`out_proba`).
+
+    Les sommes par polygone sont obtenues par bincount pondéré, tuile par tuile (voir
+    `zonal_statistics`). Seuls les pixels classés (au moins une probabilité non nulle)
+    sont pris en compte.
+
+    Args :
+        gdf (GeoDataFrame) : Polygones, dans la projection de la carte.
+        proba_raster (str) : Carte de probabilités (une bande 'proba_<code>' par classe, 0-255).
+        tile_size (int) : Taille des tuiles (par défaut 2048 pixels).
+        n_jobs (int) : Nombre de processus (par défaut le nombre de coeurs).
+
+    Return :
+        tuple : Probabilités moyennes (n_polygones, n_classes) entre 0 et 1 (NaN sans pixel),
+        codes des classes et nombre de pixels par polygone.
+    """
+    classes = proba_classes(proba_raster)
+    stats = zonal_statistics(gdf, value_raster=proba_raster, tile_size=tile_size, n_jobs=n_jobs)
+    nb_pixels = stats["nb"][:, 0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        probabilities = stats["somme"][:, 0, :] / nb_pixels[:, np.newaxis] / 255
+    return probabilities, classes, nb_pixels
+
+
+def _block_moments(keys, values, size):
+    """Effectif, moyenne, somme des carrés des écarts, min et max par clé sur un bloc.
+
+    La somme des carrés des écarts est calculée autour de la moyenne du bloc (deux passes
+    sur des données déjà en mémoire), ce qui évite la soustraction de grands nombres.
+    """
+    count = np.bincount(keys, minlength=size).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(keys, weights=values, minlength=size) / count
+    m2 = np.bincount(keys, weights=(values - mean[keys]) ** 2, minlength=size)
+
+    minimum = np.full(size, np.inf)
+    maximum = np.full(size, -np.inf)
+    if keys.size == 0:
+        return count, np.nan_to_num(mean), m2, minimum, maximum
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.r_[0, np.nonzero(np.diff(sorted_keys))[0] + 1]
+    present = sorted_keys[starts]
+    minimum[present] = np.minimum.reduceat(values[order], starts)
+    maximum[present] = np.maximum.reduceat(values[order], starts)
+    return count, np.nan_to_num(mean), m2, minimum, maximum
+
+
+def _merge_moments(total, partial, rows):
+    """Fusion de Chan et al. de statistiques partielles dans les statistiques globales."""
+    count, mean, m2, minimum, maximum = partial
+    n_a, mean_a = total["nb"][rows], total["moyenne"][rows]
+    n = n_a + count
+    delta = mean - mean_a
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weight = np.where(n > 0, count / n, 0)
+    total["moyenne"][rows] = mean_a + delta * weight
+    total["m2"][rows] += m2 + delta ** 2 * n_a * weight
+    total["nb"][rows] = n
+    total["min"][rows] = np.minimum(total["min"][rows], minimum)
+    total["max"][rows] = np.maximum(total["max"][rows], maximum)
+
+
+def polygon_band_profiles(
+    gdf,
+    raster,
+    band_indices=None,
+    block_size=1024,
+    id_field="ID",
+    no_data=None,
+    all_touched=False,
+    out_table=None
+):
+    """Profil de chaque polygone pour chaque bande : effectif, moyenne, variance, min, max.
+
+    Le raster est lu par blocs ; dans chaque bloc, seuls les polygones qui le touchent sont
+    rasterisés, et leurs statistiques de bloc sont fusionnées aux statistiques globales par
+    la formule de Chan et al. (Welford par lots), numériquement stable. La mémoire dépend
+    de la taille des blocs et du nombre de polygones, pas de la taille de l'image.
+
+    Args :
+        gdf (GeoDataFrame) : Polygones, dans la projection du raster.
+        raster (str) : Raster multibandes (série NDVI, empilement des bandes...).
+        band_indices (list) : Positions (à partir de 0) des bandes à résumer, toutes par défaut.
+        block_size (int) : Taille des blocs lus (par défaut 1024 pixels).
+        id_field (str) : Champ identifiant des polygones (voir `stand_ids`).
+        no_data (float) : Valeur ignorée (par défaut celle du raster).
+        all_touched (bool) : Si True, prend tous les pixels touchés par un polygone.
+        out_table (str) : Chemin optionnel de la table Parquet produite.
+
+    Return :
+        DataFrame : Une ligne par polygone et par bande : identifiant, 'bande', 'date' (si
+        elle figure dans la description des bandes), 'nb_pixels', 'moyenne', 'variance'
+        (population), 'min' et 'max'.
+    """
+    dataset = gdal.Open(raster)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{raster}'.")
+    geotransform, projection = dataset.GetGeoTransform(), dataset.GetProjection()
+    if no_data is None:
+        no_data = dataset.GetRasterBand(1).GetNoDataValue()
+    if band_indices is None:
+        band_indices = list(range(dataset.RasterCount))
+    nb_band, nb_polygons = len(band_indices), len(gdf)
+    shape = (nb_polygons, nb_band)
+    total = {
+        "nb": np.zeros(shape), "moyenne": np.zeros(shape), "m2": np.zeros(shape),
+        "min": np.full(shape, np.inf), "max": np.full(shape, -np.inf),
+    }
+
+    geometries = gdf.geometry.to_numpy()
+    sindex = gdf.sindex
+    band_index = np.arange(nb_band)[:, np.newaxis]
+    for window in _iter_blocks(dataset.RasterXSize, dataset.RasterYSize, block_size):
+        positions = _block_polygons(sindex, geometries, geotransform, window)
+        if positions.size == 0:
+            continue
+
+        ids = _rasterize_window(
+            geometries[positions], np.arange(1, positions.size + 1), geotransform,
+            projection, window, all_touched=all_touched
+        ).ravel()
+        inside = ids > 0
+        if not inside.any():
+            continue
+        values = _read_window(dataset, window, band_indices).reshape(nb_band, -1)
+        values = values[:, inside].astype(np.float64)
+        valid = np.isfinite(values)
+        if no_data is not None:
+            valid &= values != no_data
+        # Polygones du bloc uniquement en no data (hors masque forêt, NaN du nettoyage)
+        if not valid.any():
+            continue
+
+        keys = ((ids[inside][np.newaxis, :] - 1) * nb_band + band_index)[valid]
+        partial = _block_moments(keys, values[valid], positions.size * nb_band)
+        partial = [stat.reshape(positions.size, nb_band) for stat in partial]
+        _merge_moments(total, partial, positions)
+
+    descriptions = [dataset.GetRasterBand(i + 1).GetDescription() for i in band_indices]
+    dataset = None
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = total["m2"] / total["nb"]
+    empty = total["nb"] == 0
+    dates = [re.search(r"(\d{4})(\d{2})(\d{2})-\d{6}", d) for d in descriptions]
+    profiles = pd.DataFrame({
+        id_field: np.repeat(stand_ids(gdf, id_field).to_numpy(), nb_band),
+        "bande": np.tile([d or f"b{i + 1}" for d, i in zip(descriptions, band_indices)],
+                         nb_polygons),
+        "date": np.tile(["-".join(m.groups()) if m else None for m in dates], nb_polygons),
+        "nb_pixels": total["nb"].astype(np.int64).ravel(),
+        "moyenne": np.where(empty, np.nan, total["moyenne"]).ravel(),
+        "variance": variance.ravel(),
+        "min": np.where(empty, np.nan, total["min"]).ravel(),
+        "max": np.where(empty, np.nan, total["max"]).ravel(),
+    })
+    if out_table is not None:
+        profiles.to_parquet(out_table, index=False)
+        logging.info("Profils des polygones sauvegardés à : %s", out_table)
+    return profiles
+
+
+def _block_polygons(sindex, geometries, geotransform, window):
+    """Positions (triées) des polygones non vides dont l'emprise touche une fenêtre."""
+    xoff, yoff, xsize, ysize = window
+    x0 = geotransform[0] + xoff * geotransform[1]
+    y0 = geotransform[3] + yoff * geotransform[5]
+    x1, y1 = x0 + xsize * geotransform[1], y0 + ysize * geotransform[5]
+    positions = np.sort(sindex.query(box(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))))
+    keep = [g is not None and not g.is_empty for g in geometries[positions]]
+    return positions[np.asarray(keep, dtype=bool)]
+
+
+def centroid_distances(
+    gdf,
+    class_column,
+    ref_raster,
+    block_size=1024,
+    no_data=None,
+    all_touched=False
+):
+    """Distance moyenne des pixels au centroïde de leur classe et de leur polygone.
+
+    Le centroïde d'une classe est la moyenne des centroïdes de ses polygones. Le raster est
+    parcouru une seule fois par blocs : dans chaque bloc, les polygones qui le touchent
+    sont rasterisés, les coordonnées des centres de tous leurs pixels valides (bande 1
+    différente du no data) sont calculées d'un coup, et les distances aux deux centroïdes
+    sont cumulées par bincount, par classe et par polygone.
+
+    Args :
+        gdf (GeoDataFrame) : Polygones, dans la projection du raster.
+        class_column (str) : Colonne des codes de classe.
+        ref_raster (str) : Raster définissant la grille et les pixels valides (bande 1).
+        block_size (int) : Taille des blocs lus (par défaut 1024 pixels).
+        no_data (float) : Valeur des pixels ignorés (par défaut celle du raster).
+        all_touched (bool) : Si True, prend tous les pixels touchés par un polygone.
+
+    Return :
+        tuple : DataFrame par classe ('distance_moyenne', 'nb_pixels', indexé par code) et
+        DataFrame par polygone ('distance_moyenne', 'nb_pixels', même index que `gdf`).
+    """
+    dataset = gdal.Open(ref_raster)
+    if dataset is None:
+        raise ValueError(f"Impossible d'ouvrir le raster '{ref_raster}'.")
+    geotransform, projection = dataset.GetGeoTransform(), dataset.GetProjection()
+    band = dataset.GetRasterBand(1)
+    if no_data is None:
+        no_data = band.GetNoDataValue()
+
+    centroids = gdf.geometry.centroid
+    polygon_x, polygon_y = centroids.x.to_numpy(), centroids.y.to_numpy()
+    classes, polygon_class = np.unique(gdf[class_column].to_numpy(), return_inverse=True)
+    class_x = np.bincount(polygon_class, weights=polygon_x) / np.bincount(polygon_class)
+    class_y = np.bincount(polygon_class, weights=polygon_y) / np.bincount(polygon_class)
+
+    nb_polygons, nb_classes = len(gdf), len(classes)
+    polygon_sum, polygon_count = np.zeros(nb_polygons), np.zeros(nb_polygons)
+    class_sum, class_count = np.zeros(nb_classes), np.zeros(nb_classes)
+
+    geometries = gdf.geometry.to_numpy()
+    sindex = gdf.sindex
+    for window in _iter_blocks(dataset.RasterXSize, dataset.RasterYSize, block_size):
+        positions = _block_polygons(sindex, geometries, geotransform, window)
+        if positions.size == 0:
+            continue
+        xoff, yoff, xsize, ysize = window
+        ids = _rasterize_window(
+            geometries[positions], np.arange(1, positions.size + 1), geotransform,
+            projection, window, all_touched=all_touched
+        )
+        valid = ids > 0
+        if no_data is not None:
+            valid &= band.ReadAsArray(xoff, yoff, xsize, ysize) != no_data
+        rows, cols = np.nonzero(valid)
+        if rows.size == 0:
+            continue
+
+        # Coordonnées des centres de tous les pixels valides du bloc
+        x = geotransform[0] + (xoff + cols + 0.5) * geotransform[1]
+        y = geotransform[3] + (yoff + rows + 0.5) * geotransform[5]
+        polygon = positions[ids[rows, cols] - 1]
+        cls = polygon_class[polygon]
+
+        polygon_sum += np.bincount(
+            polygon, weights=np.hypot(x - polygon_x[polygon], y - polygon_y[polygon]),
+            minlength=nb_polygons
+        )
+        polygon_count += np.bincount(polygon, minlength=nb_polygons)
+        class_sum += np.bincount(
+            cls, weights=np.hypot(x - class_x[cls], y - class_y[cls]), minlength=nb_classes
+        )
+        class_count += np.bincount(cls, minlength=nb_classes)
+    dataset = None
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        by_class = pd.DataFrame(
+            {"distance_moyenne": class_sum / class_count,
+             "nb_pixels": class_count.astype(np.int64)},
+            index=pd.Index(classes, name=class_column)
+        )
+        by_polygon = pd.DataFrame(
+            {"distance_moyenne": polygon_sum / polygon_count,
+             "nb_pixels": polygon_count.astype(np.int64)},
+            index=gdf.index
+        )
+    return by_class, by_polygon
+
+
+def _spectral_pass(datasets, gdf, band_indices, nodata_values, block_size, all_touched,
+                   centroids=None):
+    """Une passe par blocs sur l'empilement, pour `spectral_distances`.
+
+    Sans centroïdes : renvoie l'effectif, les sommes et les sommes des carrés par polygone.
+    Avec centroïdes (par polygone et de la classe de chaque polygone) : renvoie les sommes
+    des distances de chaque pixel à ces deux centroïdes, par polygone.
+    """
+    reference = datasets[0]
+    geotransform, projection = reference.GetGeoTransform(), reference.GetProjection()
+    geometries = gdf.geometry.to_numpy()
+    sindex = gdf.sindex
+    nb_polygons, nb_band = len(gdf), len(nodata_values)
+    if centroids is None:
+        results = [np.zeros(nb_polygons), np.zeros((nb_polygons, nb_band)),
+                   np.zeros((nb_polygons, nb_band))]
+    else:
+        results = [np.zeros(nb_polygons), np.zeros(nb_polygons)]
+        centroids = [c.astype(np.float32) for c in centroids]
+
+    for window in _iter_blocks(reference.RasterXSize, reference.RasterYSize, block_size):
+        positions = _block_polygons(sindex, geometries, geotransform, window)
+        if positions.size == 0:
+            continue
+        ids = _rasterize_window(
+            geometries[positions], np.arange(1, positions.size + 1), geotransform,
+            projection, window, all_touched=all_touched
+        ).ravel()
+        block = _read_window(datasets, window, band_indices).reshape(nb_band, -1)
+        valid = (ids > 0) & np.any(block != nodata_values[:, np.newaxis], axis=0)
+        if not valid.any():
+            continue
+        polygon = positions[ids[valid] - 1]
+        # Pixels du bloc en float32 (n_pixels, n_bandes)
+        pixels = np.ascontiguousarray(block[:, valid].T, dtype=np.float32)
+
+        if centroids is None:
+            results[0] += np.bincount(polygon, minlength=nb_polygons)
+            for band in range(nb_band):
+                values = pixels[:, band].astype(np.float64)
+                results[1][:, band] += np.bincount(polygon, weights=values, minlength=nb_polygons)
+                results[2][:, band] += np.bincount(
+                    polygon, weights=values * values, minlength=nb_polygons
+                )
+        else:
+            for result, centroid in zip(results, centroids):
+                distances = np.linalg.norm(pixels - centroid[polygon], axis=1)
+                result += np.bincount(polygon, weights=distances, minlength=nb_polygons)
+    return results
+
+
+def spectral_distances(
+    gdf,
+    class_column,
+    image_filename,
+    band_indices=None,
+    block_size=512,
+    no_data=0,
+    all_touched=False
+):
+    """Dispersion spectrale par classe et par polygone dans l'espace bandes x dates complet.
+
+    Deux passes par blocs sur l'empilement, en float32 : la première cumule effectifs,
+    sommes et sommes des carrés par polygone, d'où les centroïdes des polygones et des
+    classes (moyenne des pixels) ; la seconde cumule la distance euclidienne de chaque pixel
+    au centroïde de son polygone et à celui de sa classe. La distance quadratique moyenne
+    (somme des variances) est aussi déduite des moments de la première passe. La mémoire
+    dépend des blocs et du nombre de polygones, pas de la taille de l'image.
+
+    Args :
+        gdf (GeoDataFrame) : Polygones, dans la projection de l'image.
+        class_column (str) : Colonne des codes de classe.
+        image_filename (str | list) : Empilement (ex. Serie_temp_S2_allbands.tif) ou liste
+            d'images sur la même grille.
+        band_indices (list) : Positions (à partir de 0) des bandes utilisées, toutes par défaut.
+        block_size (int) : Taille des blocs lus (par défaut 512 pixels).
+        no_data (int) : Valeur de no data des bandes qui n'en déclarent pas.
+        all_touched (bool) : Si True, prend tous les pixels touchés par un polygone.
+
+    Return :
+        tuple : DataFrame par classe ('distance_moyenne', 'distance_quadratique',
+        'nb_pixels', indexé par code) et DataFrame par polygone ('distance_moyenne' au
+        centroïde du polygone, 'distance_centroide_classe', 'nb_pixels', même index que `gdf`).
+    """
+    datasets = _open_stack(image_filename)
+    nodata_values = _stack_nodata(datasets, band_indices, no_data)
+    params = (datasets, gdf, band_indices, nodata_values, block_size, all_touched)
+
+    # Passe 1 : moments par polygone, centroïdes des polygones et des classes
+    count, sums, squares = _spectral_pass(*params)
+    classes, polygon_class = np.unique(gdf[class_column].to_numpy(), return_inverse=True)
+    class_count = np.bincount(polygon_class, weights=count, minlength=len(classes))
+    class_sums = np.stack([
+        np.bincount(polygon_class, weights=sums[:, band], minlength=len(classes))
+        for band in range(sums.shape[1])
+    ], axis=1)
+    class_squares = np.stack([
+        np.bincount(polygon_class, weights=squares[:, band], minlength=len(classes))
+        for band in range(squares.shape[1])
+    ], axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        polygon_centroids = np.nan_to_num(sums / count[:, np.newaxis])
+        class_centroids = class_sums / class_count[:, np.newaxis]
+        class_variance = class_squares / class_count[:, np.newaxis] - class_centroids ** 2
+    class_centroids = np.nan_to_num(class_centroids)
+
+    # Passe 2 : distances de chaque pixel aux centroïdes
+    polygon_distance, class_distance = _spectral_pass(
+        *params, centroids=(polygon_centroids, class_centroids[polygon_class])
+    )
+    datasets = None
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        by_class = pd.DataFrame({
+            "distance_moyenne": np.bincount(
+                polygon_class, weights=class_distance, minlength=len(classes)
+            ) / class_count,
+            "distance_quadratique": np.sqrt(np.maximum(class_variance.sum(axis=1), 0)),
+            "nb_pixels": class_count.astype(np.int64),
+        }, index=pd.Index(classes, name=class_column))
+        by_polygon = pd.DataFrame({
+            "distance_moyenne": polygon_distance / count,
+            "distance_centroide_classe": class_distance / count,
+            "nb_pixels": count.astype(np.int64),
+        }, index=gdf.index)
+    return by_class, by_polygon
@@ -5,10 +5,21 @@
 
 import os
 import sys
-import re
+import json
 import geopandas as gpd
 sys.path.append('/home/onyxia/work/projet_901_21/script')
-from my_function import clip_raster, apply_mask, concat_bands, calculate_ndvi
+from my_function import (
+    clip_raster,
+    apply_mask,
+    concat_bands,
+    calculate_ndvi,
+    select_band_files,
+    band_dates,
+    custom_sort_key,
+    compute_phenology_metrics,
+    clean_time_series,
+    export_quicklook
+)
 
 # Initialisation des chemins nécessaires
 raster_folder = "/home/onyxia/work/data/images"
@@ -19,6 +30,18 @@ output_decoupe_folder = "/home/onyxia/work/data/project/pretraitement_decoupe"
 output_masque_folder = "/home/onyxia/work/data/project/pretraitement_masque"
 output_masque_ndvi_folder = "/home/onyxia/work/data/project/pretraitement_masque_ndvi"
 output_ndvi_folder = "/home/onyxia/work/data/project/pretraitement_ndvi" 
+output_brute_folder = "/home/onyxia/work/data/project/pretraitement_brute"
+# Sélection de bandes/dates produite par feature_selection.py (None pour tout empiler)
+selection_file = None  # ex. "/home/onyxia/work/data/project/tmp_classif/selection_bandes.json"
+# Nettoyage de la série NDVI (nuages, trous, lissage) avant le calcul de la phénologie
+clean_ndvi = True
+ndvi_valid_range = (0.1, 1.0)  # Un NDVI forestier sous 0.1 est considéré comme nuageux
+# Nettoyage de l'empilement de toutes les bandes (masques nuages, trous, lissage)
+clean_stack = True
+cloud_mask_files = None  # Masques nuages Sentinel-2 (CLM) découpés, un par date (optionnel)
+smoothing_window = None  # Fenêtre impaire de Savitzky-Golay (None : pas de lissage)
+# Aperçus des séries produites pour l'affichage dans un SIG ('internal', 'external' ou None)
+overviews = 'internal'
 
 # Initialisation des variables nécessaires
 spatial_res = 10  # Résolution spatiale de 10 m
@@ -41,6 +64,10 @@ if not os.path.exists(output_masque_folder):
 if not os.path.exists(output_masque_ndvi_folder):
    os.makedirs(output_masque_ndvi_folder)
 
+# Créer le dossier de sortie s'il n'existe pas
+if clean_stack and not os.path.exists(output_brute_folder):
+    os.makedirs(output_brute_folder)
+
 # Traitements pour générer le fichier multibandes concaténés
 # Liste de tous les fichiers .tif dans le dossier de rasters
 raster_files = [f for f in os.listdir(raster_folder) if f.endswith('.tif')]
@@ -84,23 +111,37 @@ for raster_file_decoupee in raster_files_decoupee:
 # Ordre des bandes chromatiques
 band_order = ["B2", "B3", "B4", "B5", "B6", "B7", "B8", "B8A", "B11", "B12"]
 
-# Fonction de tri personnalisé
-def custom_sort_key(filename):
-    # Modifier l'expression régulière pour capturer correctement B8A
-    match = re.search(r"(\d{8}-\d{6}-\d{3}).*_(B(?:8A|\d{1,2}))_", filename)
-    if match:
-        date = match.group(1)
-        band = match.group(2)
-        # Retourner une clé basée sur l'ordre des dates et des bandes
-        return (date, band_order.index(band))
-    # Clé par défaut pour les fichiers ne correspondant pas au schéma
-    return ("", float('inf'))
-
-
-raster_files_masque = sorted([os.path.join(output_masque_folder, f) for f in os.listdir(output_masque_folder) if f.endswith('.tif')], key=lambda x: custom_sort_key(os.path.basename(x)))
+raster_files_masque = sorted([os.path.join(output_masque_folder, f) for f in os.listdir(output_masque_folder) if f.endswith('.tif')], key=lambda x: custom_sort_key(os.path.basename(x), band_order))
 out_result = os.path.join(output_result, "Serie_temp_S2_allbands.tif")
 
-concat_bands(raster_files_masque, out_result, data_type, no_data)
+# Empilement réduit aux seules bandes/dates retenues par la sélection de variables
+if selection_file is not None:
+    with open(selection_file, encoding="utf-8") as f:
+        selected_features = json.load(f)["variables"]
+    raster_files_masque = select_band_files(raster_files_masque, selected_features, band_order)
+    out_result = os.path.join(output_result, "Serie_temp_S2_selection.tif")
+
+if clean_stack:
+    # Empilement brut à part : la série nettoyée garde le nom attendu par la classification
+    out_brute = os.path.join(output_brute_folder, os.path.basename(out_result))
+    concat_bands(raster_files_masque, out_brute, data_type, no_data)
+
+    # Dates lues dans l'empilement : une date par groupe de bandes consécutives
+    stack_dates = band_dates(out_brute)
+    acquisitions = list(dict.fromkeys(stack_dates or []))
+    bands_per_date = len(stack_dates) // len(acquisitions) if acquisitions else 0
+    if acquisitions and stack_dates == [d for d in acquisitions for _ in range(bands_per_date)]:
+        clean_time_series(
+            out_brute, out_result, acquisitions, bands_per_date=bands_per_date,
+            mask_rasters=cloud_mask_files, smoothing_window=smoothing_window, no_data=no_data,
+            overviews=overviews
+        )
+    else:
+        # Sélection avec un nombre de bandes variable selon la date : pas de nettoyage
+        print(f"Bandes de {out_brute} non rangées par date : empilement non nettoyé")
+        concat_bands(raster_files_masque, out_result, data_type, no_data, overviews=overviews)
+else:
+    concat_bands(raster_files_masque, out_result, data_type, no_data, overviews=overviews)
 
 data_type = "Float32"
 no_data = -9999
@@ -134,4 +175,23 @@ raster_files_ndvi = sorted([os.path.join(output_ndvi_folder, f) for f in os.list
 out_result = os.path.join(output_result, "Serie_temp_S2_ndvi.tif")
 
 # Concaténation des 6 rasters préalablement créés
-concat_bands(raster_files_ndvi, out_result, data_type, no_data)
\ No newline at end of file
+concat_bands(raster_files_ndvi, out_result, data_type, no_data, overviews=overviews)
+
+# Métriques phénologiques (amplitude, date du maximum, intégrale...) à partir de la série NDVI
+# Dates lues dans les descriptions des bandes : elles suivent les images réellement empilées
+dates = band_dates(out_result)
+if dates is None:
+    raise ValueError(f"Les bandes de '{out_result}' n'ont pas de date dans leur description.")
+out_phenologie = os.path.join(output_result, "Serie_temp_S2_phenologie.tif")
+if clean_ndvi:
+    out_nettoyee = os.path.join(output_result, "Serie_temp_S2_ndvi_nettoyee.tif")
+    clean_time_series(
+        out_result, out_nettoyee, dates, mask_rasters=cloud_mask_files,
+        valid_range=ndvi_valid_range, smoothing_window=smoothing_window, no_data=no_data,
+        overviews=overviews
+    )
+    out_result = out_nettoyee
+compute_phenology_metrics(out_result, out_phenologie, dates, no_data=no_data, overviews=overviews)
+
+# Aperçu de l'amplitude NDVI pour le rapport
+export_quicklook(out_phenologie, os.path.join(output_result, "apercu_amplitude_ndvi.png"), bands=[3])
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Service local de prédiction : le classifieur et l'image sont chargés une seule fois,
+puis le service répond en HTTP aux demandes de classification d'une emprise ou d'un
+polygone, sans relancer classification_pixel.py.
+
+Requêtes :
+    POST /classify  {"bbox": [xmin, ymin, xmax, ymax]} ou {"polygon": "<WKT>"},
+                    "format": "npy" (par défaut) ou "geotiff"
+    GET  /metrics   latences et taille des lots traités
+
+Les requêtes concurrentes sont regroupées en lots : un seul appel à `predict` est fait
+pour tous les pixels des requêtes arrivées pendant BATCH_WAIT_S.
+
+Les variables lues sont celles de l'apprentissage dans classification_pixel.py : mêmes
+PHENOLOGY_FILENAME et SELECTION_FILE à renseigner ici.
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import os
+import io
+import json
+import time
+import uuid
+import queue
+import pickle
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from shapely import wkt
+from shapely.errors import ShapelyError
+from osgeo import gdal
+
+# personal libraries
+from my_function import StackReader
+
+logging.basicConfig(level=logging.INFO)
+
+MY_FOLDER = '/home/onyxia/work/data/project/tmp_classif'
+MY_FOLDER_RESULT = '/home/onyxia/work/projet_901_21/results/data'
+MODEL_FILE = os.path.join(MY_FOLDER, 'modele_echelle_pixel.pkl')  # ou modele_compact.pkl
+image_filename = os.path.join(MY_FOLDER_RESULT, 'img_pretraitees', 'Serie_temp_S2_allbands.tif')
+# Variables de l'apprentissage (voir classification_pixel.py)
+PHENOLOGY_FILENAME = None  # ex. os.path.join(MY_FOLDER_RESULT, 'img_pretraitees', 'Serie_temp_S2_phenologie.tif')
+SELECTION_FILE = None  # ex. os.path.join(MY_FOLDER, 'selection_bandes.json')
+if PHENOLOGY_FILENAME is not None:
+    image_filename = [image_filename, PHENOLOGY_FILENAME]
+
+HOST = '127.0.0.1'
+PORT = 8765
+BATCH_WAIT_S = 0.01  # Attente maximale pour regrouper des requêtes
+MAX_BATCH_PIXELS = 2_000_000  # Nombre maximal de pixels par lot
+MAX_REQUEST_PIXELS = 4_000_000  # Taille maximale d'une fenêtre demandée
+NO_DATA = 0
+LATENCY_WINDOW = 1000  # Nombre de requêtes gardées pour les métriques
+
+
+def load_model(model_file):
+    """Charge un modèle pickle scikit-learn (modèle complet ou forêt compacte)."""
+    with open(model_file, 'rb') as f:
+        return pickle.load(f)
+
+
+class PredictionService:
+    """Modèle et image chargés une fois, avec un thread qui traite les requêtes par lots.
+
+    Args :
+        model_file (str) : Modèle pickle scikit-learn.
+        stack_filename (str | list) : Image des variables, ou liste d'images empilées
+            (ex. empilement Sentinel-2 puis métriques phénologiques).
+        band_indices (list) : Positions des bandes utilisées à l'apprentissage, toutes par
+            défaut.
+
+    Exceptions :
+        ValueError : Si une image ne peut pas être ouverte ou si le nombre de bandes lues ne
+            correspond pas au nombre de variables du modèle.
+    """
+
+    def __init__(self, model_file, stack_filename, band_indices=None):
+        self.clf = load_model(model_file)
+        # Les datasets GDAL ne sont lus que par le thread de traitement des lots
+        self.reader = StackReader(stack_filename, band_indices, NO_DATA)
+        nb_features = getattr(self.clf, "n_features_in_", self.reader.nb_band)
+        if nb_features != self.reader.nb_band:
+            raise ValueError(
+                f"Le modèle attend {nb_features} variables, {self.reader.nb_band} bandes "
+                "sont lues : vérifier PHENOLOGY_FILENAME et SELECTION_FILE."
+            )
+        self.geotransform = self.reader.geotransform
+        self.projection = self.reader.projection
+        self.jobs = queue.Queue()
+        self.latencies = []
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self._batch_worker, daemon=True).start()
+
+    def window_for(self, request):
+        """Fenêtre pixel et masque optionnel d'une requête (emprise ou polygone WKT).
+
+        Exceptions :
+            ValueError : Si la requête est mal formée, hors de l'image ou trop grande.
+        """
+        if not isinstance(request, dict):
+            raise ValueError("La requête doit être un objet JSON.")
+        geometry = None
+        if 'polygon' in request:
+            if not isinstance(request['polygon'], str):
+                raise ValueError("'polygon' doit être une géométrie WKT.")
+            try:
+                geometry = wkt.loads(request['polygon'])
+            except ShapelyError as e:
+                raise ValueError(f"Géométrie WKT invalide : {e}") from e
+            if geometry.is_empty:
+                raise ValueError("La géométrie demandée est vide.")
+            bounds = geometry.bounds
+        elif 'bbox' in request:
+            bounds = request['bbox']
+            if not (
+                isinstance(bounds, list) and len(bounds) == 4
+                and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in bounds)
+                and all(np.isfinite(bounds))
+            ):
+                raise ValueError("'bbox' doit être une liste [xmin, ymin, xmax, ymax] de nombres.")
+        else:
+            raise ValueError("La requête doit contenir 'bbox' ou 'polygon'.")
+        window = self.reader.window(bounds)
+        if window is None:
+            raise ValueError("La zone demandée est en dehors de l'image.")
+        if window[2] * window[3] > MAX_REQUEST_PIXELS:
+            raise ValueError("La zone demandée est trop grande.")
+        mask = None
+        if geometry is not None:
+            mask = self.reader.mask(geometry, window)
+        return window, mask
+
+    def classify(self, request):
+        """Met une requête dans la file et attend sa carte de classes."""
+        window, mask = self.window_for(request)
+        job = {"window": window, "mask": mask, "done": threading.Event()}
+        self.jobs.put(job)
+        job["done"].wait()
+        if "error" in job:
+            raise job["error"]
+        return window, job["labels"]
+
+    def _batch_worker(self):
+        """Regroupe les requêtes en attente et fait une seule prédiction par lot."""
+        while True:
+            batch = [self.jobs.get()]
+            nb_pixels = batch[0]["window"][2] * batch[0]["window"][3]
+            deadline = time.perf_counter() + BATCH_WAIT_S
+            while nb_pixels < MAX_BATCH_PIXELS:
+                try:
+                    job = self.jobs.get(timeout=max(0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                batch.append(job)
+                nb_pixels += job["window"][2] * job["window"][3]
+
+            try:
+                self._predict_batch(batch)
+            except Exception as e:  # L'erreur est renvoyée à chaque requête du lot
+                for job in batch:
+                    job["error"] = e
+            for job in batch:
+                job["done"].set()
+
+            with self.lock:
+                self.batch_sizes = (self.batch_sizes + [len(batch)])[-LATENCY_WINDOW:]
+
+    def _predict_batch(self, batch):
+        """Lit les fenêtres du lot et les classe en un seul appel au modèle."""
+        pixels, valids = [], []
+        for job in batch:
+            block, valid = self.reader.read(job["window"])
+            if job["mask"] is not None:
+                valid &= job["mask"]
+            valids.append(valid)
+            pixels.append(block[:, valid].T)
+
+        stacked = np.ascontiguousarray(np.concatenate(pixels), dtype=np.float32)
+        predicted = self.clf.predict(stacked) if stacked.shape[0] else np.empty(0)
+
+        start = 0
+        for job, valid in zip(batch, valids):
+            labels = np.zeros(valid.shape, dtype=np.uint8)
+            count = int(valid.sum())
+            labels[valid] = predicted[start:start + count]
+            start += count
+            job["labels"] = labels
+
+    def record_latency(self, latency):
+        """Garde la latence d'une requête pour les métriques."""
+        with self.lock:
+            self.latencies = (self.latencies + [latency])[-LATENCY_WINDOW:]
+
+    def metrics(self):
+        """Percentiles de latence (ms) et taille moyenne des lots."""
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            batch_sizes = np.array(self.batch_sizes)
+        if latencies.size == 0:
+            return {"nb_requetes": 0}
+        return {
+            "nb_requetes": int(latencies.size),
+            "latence_ms_p50": float(np.percentile(latencies, 50)),
+            "latence_ms_p95": float(np.percentile(latencies, 95)),
+            "latence_ms_p99": float(np.percentile(latencies, 99)),
+            "latence_ms_max": float(latencies.max()),
+            "taille_lot_moyenne": float(batch_sizes.mean()) if batch_sizes.size else 0.0,
+        }
+
+    def to_geotiff(self, window, labels):
+        """Encode une fenêtre classée en GeoTIFF (octets) via le système de fichiers virtuel GDAL."""
+        xoff, yoff, xsize, ysize = window
+        vsi_filename = f"/vsimem/{uuid.uuid4().hex}.tif"
+        out_ds = gdal.GetDriverByName('GTiff').Create(vsi_filename, xsize, ysize, 1, gdal.GDT_Byte)
+        gt = self.geotransform
+        out_ds.SetGeoTransform((gt[0] + xoff * gt[1], gt[1], 0, gt[3] + yoff * gt[5], 0, gt[5]))
+        out_ds.SetProjection(self.projection)
+        out_ds.GetRasterBand(1).WriteArray(labels)
+        out_ds.GetRasterBand(1).SetNoDataValue(0)
+        out_ds = None
+
+        vsi_file = gdal.VSIFOpenL(vsi_filename, 'rb')
+        gdal.VSIFSeekL(vsi_file, 0, 2)
+        size = gdal.VSIFTellL(vsi_file)
+        gdal.VSIFSeekL(vsi_file, 0, 0)
+        content = gdal.VSIFReadL(1, size, vsi_file)
+        gdal.VSIFCloseL(vsi_file)
+        gdal.Unlink(vsi_filename)
+        return content
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """Routes HTTP du service de prédiction."""
+
+    service = None
+
+    def _send(self, status, content, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode(), 'application/json')
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send_json(200, self.service.metrics())
+        else:
+            self._send_json(404, {"erreur": "route inconnue"})
+
+    def do_POST(self):
+        if self.path != '/classify':
+            self._send_json(404, {"erreur": "route inconnue"})
+            return
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            window, labels = self.service.classify(request)
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            self._send_json(400, {"erreur": str(e)})
+            self.service.record_latency(time.perf_counter() - start)
+            return
+        except Exception as e:  # Erreur de lecture GDAL, mémoire... renvoyée par le lot
+            logging.exception("Échec de la classification")
+            self._send_json(500, {"erreur": str(e)})
+            self.service.record_latency(time.perf_counter() - start)
+            return
+
+        # La fenêtre (xoff, yoff) permet de replacer le tableau dans l'image
+        headers = {'X-Window': ','.join(str(v) for v in window)}
+        if request.get('format', 'npy') == 'geotiff':
+            self._send(200, self.service.to_geotiff(window, labels), 'image/tiff', headers)
+        else:
+            buffer = io.BytesIO()
+            np.save(buffer, labels)
+            self._send(200, buffer.getvalue(), 'application/octet-stream', headers)
+        self.service.record_latency(time.perf_counter() - start)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logging.debug(format, *args)
+
+
+if __name__ == '__main__':
+    band_indices = None
+    if SELECTION_FILE is not None:
+        with open(SELECTION_FILE, encoding="utf-8") as f:
+            band_indices = json.load(f)["indices"]
+    PredictionHandler.service = PredictionService(MODEL_FILE, image_filename, band_indices)
+    server = ThreadingHTTPServer((HOST, PORT), PredictionHandler)
+    logging.info("Service de prédiction à l'écoute sur http://%s:%i", HOST, PORT)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
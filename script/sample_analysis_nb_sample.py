@@ -8,12 +8,14 @@ import geopandas as gpd
 import matplotlib.pyplot as plt
 from matplotlib import cm
 from matplotlib.colors import LogNorm
-from my_function import count_polygons_by_class, count_pixels_by_class, prepare_violin_plot_data
+from my_function import count_polygons_by_class, count_pixels_by_polygon, prepare_violin_plot_data
 
 import numpy as np
 
 # Définition des chemins des fichiers
 INPUT_FILE = "/home/onyxia/work/projet_901_21/results/data/sample/Sample_BD_foret_T31TCJ.shp"
+# Grille de l'emprise d'étude (10 m) sur laquelle les pixels sont comptés
+REF_RASTER = "/home/onyxia/work/projet_901_21/results/data/img_pretraitees/masque_foret.tif"
 OUTPUT_DIR = "/home/onyxia/work/projet_901_21/results/figure"
 diag_poly_file = os.path.join(OUTPUT_DIR, "diag_baton_nb_poly_by_class.png")
 diag_pix_file = os.path.join(OUTPUT_DIR, "diag_baton_nb_pix_by_class.png")
@@ -65,8 +67,9 @@ plt.close()
 
 print(f"diag_baton_nb_poly_by_class sauvegardé dans {diag_poly_file}")
 
-# Comptage du nombre de pixels par classe
-class_pixel_counts = count_pixels_by_class(gdf, "Code", selected_classes)
+# Comptage exact du nombre de pixels par polygone et par classe (une seule rasterisation)
+pixels_by_polygon, pixels_by_class = count_pixels_by_polygon(gdf, "Code", ref_raster=REF_RASTER)
+class_pixel_counts = {code: int(pixels_by_class.get(code, 0)) for code in selected_classes}
 
 # Conversion des codes en noms pour le diagramme en bâtons (pixels)
 class_names_pix = [code_to_name[code] for code in class_pixel_counts.keys()]
@@ -98,9 +101,8 @@ plt.close()
 
 print(f"diag_baton_nb_pix_by_class sauvegardé dans {diag_pix_file}")
 
-# Calculer la surface de chaque polygone en pixels (adapté à la résolution du raster)
-RESOLUTION = 10  # Résolution spatiale utilisée pour le raster
-gdf["Nombre_de_pixels"] = (gdf.geometry.area / (RESOLUTION**2)).astype(int)
+# Nombre exact de pixels de chaque polygone sur la grille du raster
+gdf["Nombre_de_pixels"] = pixels_by_polygon
 
 # Préparer les données pour le "violin plot"
 violin_data = prepare_violin_plot_data(gdf, "Code", "Nombre_de_pixels")
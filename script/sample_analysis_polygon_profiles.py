@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Profil temporel de chaque polygone d'échantillon (effectif, moyenne, variance, min, max
+du NDVI à chaque date), écrit dans une table Parquet indexée par l'identifiant des
+polygones. Les peuplements dont le profil s'écarte le plus de celui de leur classe sont
+listés pour repérer les échantillons atypiques.
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import os
+import geopandas as gpd
+
+# personal libraries
+from my_function import polygon_band_profiles, stand_ids
+
+# Initialisation des paramètres
+RASTER = "/home/onyxia/work/projet_901_21/results/data/img_pretraitees/Serie_temp_S2_ndvi.tif"
+SAMPLE_SHAPEFILE = "/home/onyxia/work/projet_901_21/results/data/sample/Sample_BD_foret_T31TCJ.shp"
+OUTPUT_FOLDER = "/home/onyxia/work/projet_901_21/results/data/sample"
+out_table = os.path.join(OUTPUT_FOLDER, "profils_temporels_polygones.parquet")
+BAND_INDICES = None  # Bandes à résumer (None : toutes), ex. pour l'empilement complet
+BLOCK_SIZE = 1024
+NB_ATYPIQUES = 10  # Nombre de peuplements atypiques affichés
+
+gdf = gpd.read_file(SAMPLE_SHAPEFILE)
+
+# Une seule lecture du raster par blocs, statistiques fusionnées au fil des blocs
+profiles = polygon_band_profiles(
+    gdf, RASTER, band_indices=BAND_INDICES, block_size=BLOCK_SIZE, out_table=out_table
+    )
+print(f"Profils de {len(gdf)} polygones sauvegardés dans {out_table}")
+
+# Écart de chaque polygone à la moyenne de sa classe, à chaque date (score z)
+ids = stand_ids(gdf)
+id_field = ids.name
+profiles = profiles.merge(gdf.assign(**{id_field: ids})[[id_field, "Code"]], on=id_field)
+by_class = profiles.groupby(["Code", "bande"])["moyenne"]
+profiles["score_z"] = (profiles["moyenne"] - by_class.transform("mean")) / by_class.transform("std")
+
+outliers = (
+    profiles.assign(score_abs=profiles["score_z"].abs())
+    .groupby([id_field, "Code"])["score_abs"].max()
+    .sort_values(ascending=False)
+    .head(NB_ATYPIQUES)
+    )
+print("Peuplements les plus atypiques (score z maximal sur les dates) :")
+print(outliers.to_string())
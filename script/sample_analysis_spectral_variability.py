@@ -8,10 +8,9 @@ import sys
 import geopandas as gpd
 import numpy as np
 import matplotlib.pyplot as plt
-from osgeo import gdal
 import pandas as pd
 sys.path.append('/home/onyxia/work/projet_901_21/script')
-from my_function import calculate_distance
+from my_function import centroid_distances, spectral_distances
 
 # Charger les données shapefile
 BD_FORET_CLASS = "/home/onyxia/work/projet_901_21/results/data/sample/Sample_BD_foret_T31TCJ.shp"
@@ -19,21 +18,15 @@ OUTPUT_PATH = "/home/onyxia/work/projet_901_21/results/figure"
 os.makedirs(OUTPUT_PATH, exist_ok=True)
 output_1 = os.path.join(OUTPUT_PATH, "diag_baton_dist_centroide_classe.png")
 output_2 = os.path.join(OUTPUT_PATH, "violin_plot_dist_centroide_by_poly_by_class.png")
+output_3 = os.path.join(OUTPUT_PATH, "diag_baton_dist_spectrale_classe.png")
+output_4 = os.path.join(OUTPUT_PATH, "violin_plot_dist_spectrale_by_poly_by_class.png")
 
 data = gpd.read_file(BD_FORET_CLASS)
 
-# Charger le raster NDVI avec GDAL
+# Raster NDVI : grille des pixels, dont les valides sont ceux où la bande 1 est renseignée
 NDVI_PATH = "/home/onyxia/work/projet_901_21/results/data/img_pretraitees/Serie_temp_S2_ndvi.tif"
-dataset = gdal.Open(NDVI_PATH)
-
-# Lire la première bande du raster NDVI
-band = dataset.GetRasterBand(1)
-ndvi_array = band.ReadAsArray()
-no_data = band.GetNoDataValue()
-
-# Récupérer les dimensions et la géométrie du raster
-nrows, ncols = ndvi_array.shape
-transform = dataset.GetGeoTransform()
+# Empilement complet (bandes x dates) pour la variabilité dans l'espace spectral
+STACK_PATH = "/home/onyxia/work/projet_901_21/results/data/img_pretraitees/Serie_temp_S2_allbands.tif"
 
 # Définir les classes bleues et rouges avec leur code et nom associé
 classes_bleues = {
@@ -56,36 +49,15 @@ classes_rouges = {
 # Filtrer les données par classe
 all_data = data[data["Code"].isin(list(classes_bleues.keys()) + list(classes_rouges.keys()))]
 
+# Questions 1 et 2 : distances des pixels (intérieur des polygones) aux centroïdes de leur
+# classe et de leur polygone, calculées en une seule passe sur le raster
+class_distances, polygon_distances = centroid_distances(all_data, "Code", NDVI_PATH)
+
 # Question 1 : Distance moyenne au centroïde par classe
-mean_distances = {}
-
-for class_code, group in all_data.groupby("Code"):
-    centroid = group.geometry.centroid
-    centroid_x = centroid.x.mean()
-    centroid_y = centroid.y.mean()
-
-    distances = []
-    for _, row in group.iterrows():
-        min_x, min_y, max_x, max_y = row['geometry'].bounds
-        start_col = max(0, int((min_x - transform[0]) / transform[1]))
-        end_col = min(ncols - 1, int((max_x - transform[0]) / transform[1]))
-        start_row = max(0, int((max_y - transform[3]) / transform[5]))
-        end_row = min(nrows - 1, int((min_y - transform[3]) / transform[5]))
-
-        for row_idx in range(start_row, end_row + 1):
-            for col_idx in range(start_col, end_col + 1):
-                pixel_value = ndvi_array[row_idx, col_idx]
-                if pixel_value != no_data:
-                    pixel_x = transform[0] + col_idx * transform[1] + transform[1] / 2
-                    pixel_y = transform[3] + row_idx * transform[5] + transform[5] / 2
-                    distances.append(calculate_distance((centroid_x, centroid_y), pixel_x, pixel_y))
-
-    # Calculer la distance moyenne
-    if distances:
-        mean_distances[class_code] = np.mean(distances)
-    else:
+mean_distances = class_distances["distance_moyenne"].to_dict()
+for class_code, distance in mean_distances.items():
+    if np.isnan(distance):
         print(f"Attention : aucune distance calculée pour la classe {class_code}")
-        mean_distances[class_code] = np.nan
 
 # Diagramme en bâtons pour la question 1
 # Diagramme en bâtons pour la question 1
@@ -124,36 +96,13 @@ plt.savefig(output_1)
 plt.show()
 
 # Question 2 : Analyse à l'échelle de chaque polygone
-polygon_distances = []
-
-for _, row in all_data.iterrows():
-    centroid = row.geometry.centroid
-    centroid_x, centroid_y = centroid.x, centroid.y
-
-    min_x, min_y, max_x, max_y = row['geometry'].bounds
-    start_col = max(0, int((min_x - transform[0]) / transform[1]))
-    end_col = min(ncols - 1, int((max_x - transform[0]) / transform[1]))
-    start_row = max(0, int((max_y - transform[3]) / transform[5]))
-    end_row = min(nrows - 1, int((min_y - transform[3]) / transform[5]))
-
-    distances = []
-    for row_idx in range(start_row, end_row + 1):
-        for col_idx in range(start_col, end_col + 1):
-            pixel_value = ndvi_array[row_idx, col_idx]
-            if pixel_value != no_data:
-                pixel_x = transform[0] + col_idx * transform[1] + transform[1] / 2
-                pixel_y = transform[3] + row_idx * transform[5] + transform[5] / 2
-                distances.append(calculate_distance((centroid_x, centroid_y), pixel_x, pixel_y))
-
-    if distances:
-        mean_distance = np.mean(distances)
-    else:
-        mean_distance = np.nan
-
-    polygon_distances.append({"Classe": row["Nom"], "Distance moyenne": mean_distance})
+polygon_distances = pd.DataFrame({
+    "Classe": all_data["Nom"],
+    "Distance moyenne": polygon_distances["distance_moyenne"],
+})
 
 # Convertir en DataFrame pour le plot
-polygon_distances_df = pd.DataFrame(polygon_distances)
+polygon_distances_df = polygon_distances.reset_index(drop=True)
 
 # Violin plot pour la question 2
 plt.figure(figsize=(12, 8))
@@ -179,3 +128,49 @@ plt.title("Distribution des distances moyennes au centroïde par classe")
 plt.tight_layout()
 plt.savefig(output_2)
 plt.show()
+
+# Variabilité spectrale : distances des pixels aux centroïdes dans l'espace bandes x dates,
+# en deux passes par blocs sur l'empilement complet
+spectral_class, spectral_polygon = spectral_distances(all_data, "Code", STACK_PATH)
+
+# Diagramme en bâtons : distance spectrale moyenne au centroïde de chaque classe
+plt.figure(figsize=(10, 6))
+codes = spectral_class.index.tolist()
+bars = plt.bar(
+    [classes_bleues.get(code, classes_rouges.get(code, "Inconnue")) for code in codes],
+    spectral_class["distance_moyenne"],
+    color=["blue" if code in classes_bleues else "red" for code in codes]
+    )
+plt.xlabel("Classe")
+plt.ylabel("Distance spectrale moyenne au centroïde (réflectance)")
+plt.title("Distance spectrale moyenne au centroïde par classe")
+plt.xticks(rotation=45, ha="right")
+for bar in bars:
+    yval = bar.get_height()
+    plt.text(bar.get_x() + bar.get_width() / 2, yval, f'{yval:.0f}',
+             ha='center', va='bottom', fontsize=10)
+plt.tight_layout()
+plt.savefig(output_3)
+plt.show()
+
+# Violin plot : dispersion spectrale interne de chaque polygone, par classe
+spectral_polygon = spectral_polygon.assign(Code=all_data["Code"])
+spectral_polygon = spectral_polygon.dropna(subset=["distance_moyenne"])
+plt.figure(figsize=(12, 8))
+for idx, code in enumerate(codes):
+    class_values = spectral_polygon.loc[spectral_polygon["Code"] == code, "distance_moyenne"]
+    if not class_values.empty:
+        violon = plt.violinplot(class_values, positions=[idx], showmeans=True,
+                                showextrema=True, widths=0.7)
+        for body in violon['bodies']:
+            body.set_facecolor("blue" if code in classes_bleues else "red")
+            body.set_edgecolor("black")
+plt.xticks(range(len(codes)),
+           [classes_bleues.get(code, classes_rouges.get(code, "Inconnue")) for code in codes],
+           rotation=45, ha="right")
+plt.xlabel("Classe")
+plt.ylabel("Distance spectrale moyenne au centroïde du polygone")
+plt.title("Distribution de la dispersion spectrale des polygones par classe")
+plt.tight_layout()
+plt.savefig(output_4)
+plt.show()
@@ -13,7 +13,6 @@ from my_function import analyze_phenology_gdal_alternative
 NDVI_RASTER = "/home/onyxia/work/projet_901_21/results/data/img_pretraitees/Serie_temp_S2_ndvi.tif"
 SAMPLE_SHAPEFILE = "/home/onyxia/work/projet_901_21/results/data/sample/Sample_BD_foret_T31TCJ.shp"
 OUTPUT_FOLDER = "/home/onyxia/work/projet_901_21/results/figure"
-dates = ["2022-04-17", "2022-05-17", "2022-08-28", "2022-11-13", "2022-11-16", "2023-02-14"]
 
-# Appel de la fonction
-analyze_phenology_gdal_alternative(NDVI_RASTER, SAMPLE_SHAPEFILE, OUTPUT_FOLDER, dates)
+# Appel de la fonction (le nombre de bandes et les dates sont lus dans la série NDVI)
+analyze_phenology_gdal_alternative(NDVI_RASTER, SAMPLE_SHAPEFILE, OUTPUT_FOLDER)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Recherche des hyperparamètres du classifieur pixel par division successive
+(successive halving) sur les échantillons extraits une seule fois et mis en cache.
+Les plis sont les mêmes que ceux de classification_pixel.py (StratifiedKFold, 5 plis)
+et la meilleure configuration est sauvegardée en JSON pour l'apprentissage final.
+"""
+
+import sys
+sys.path.append('/home/onyxia/work/libsigma')
+sys.path.append('/home/onyxia/work/projet_901_21/script')
+
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingGridSearchCV, StratifiedKFold
+
+# personal libraries
+from my_function import cache_samples, make_classifier
+
+logging.basicConfig(level=logging.INFO)
+
+MY_FOLDER = '/home/onyxia/work/data/project/tmp_classif'
+MY_FOLDER_RESULT = '/home/onyxia/work/projet_901_21/results/data'
+SAMPLE_SHP = os.path.join(MY_FOLDER_RESULT, 'sample', 'Sample_BD_foret_T31TCJ.shp')
+image_filename = os.path.join(MY_FOLDER_RESULT, 'img_pretraitees', 'Serie_temp_S2_allbands.tif')
+CACHE_FOLDER = os.path.join(MY_FOLDER, 'cache_echantillons')
+
+# outputs
+out_results = os.path.join(MY_FOLDER, 'tuning_resultats.csv')
+out_best = os.path.join(MY_FOLDER, 'meilleurs_parametres.json')
+
+codes_classif_pixel = [11, 12, 13, 14, 21, 22, 23, 24, 25]
+BACKEND = 'rf'
+# Budget de la division successive : 'n_samples' (pixels) ou 'n_estimators' (arbres)
+RESOURCE = 'n_samples'
+FACTOR = 3  # Facteur d'élimination à chaque tour
+PARAM_GRID = {
+    "max_depth": [15, 25, 35, 50, None],
+    "max_features": ["sqrt", 0.2, 0.4],
+    "min_samples_leaf": [1, 3, 10],
+    "max_samples": [0.5, 0.75, None],
+}
+SEED = 0
+
+if not os.path.exists(MY_FOLDER):
+    os.makedirs(MY_FOLDER)
+
+# Extraction unique des échantillons, relus ensuite en mémoire mappée
+bd_foret = gpd.read_file(SAMPLE_SHP)
+bd_foret_filtree = bd_foret[bd_foret['Code'].isin(codes_classif_pixel)]
+X, Y, _ = cache_samples(bd_foret_filtree, image_filename, CACHE_FOLDER, 'Code')
+Y = np.ravel(Y)
+
+if RESOURCE == 'n_estimators':
+    search_params = {"resource": "n_estimators", "max_resources": 200, "min_resources": 10}
+else:
+    search_params = {"resource": "n_samples"}
+
+search = HalvingGridSearchCV(
+    make_classifier(BACKEND, random_state=SEED),
+    PARAM_GRID,
+    factor=FACTOR,
+    cv=StratifiedKFold(n_splits=5),
+    scoring="f1_macro",
+    random_state=SEED,
+    refit=False,
+    verbose=1,
+    **search_params
+    )
+# X reste en mémoire mappée : seuls les sous-échantillons de chaque tour sont chargés
+search.fit(X, Y)
+
+# Journal de tous les tours de la recherche
+results_df = pd.DataFrame(search.cv_results_)
+results_df.to_csv(out_results, index=False)
+
+best_params = {
+    key: (value.item() if isinstance(value, np.generic) else value)
+    for key, value in search.best_params_.items()
+}
+with open(out_best, "w", encoding="utf-8") as f:
+    json.dump({"backend": BACKEND, "parametres": best_params,
+               "f1_macro": float(search.best_score_)}, f, indent=2)
+
+print(results_df[["iter", "n_resources", "params", "mean_test_score"]]
+      .sort_values(["iter", "mean_test_score"], ascending=[False, False]).head(20).to_string())
+print(f"Meilleurs paramètres ({search.best_score_:.3f}) : {best_params}")
+print(f"Sauvegardés dans {out_best}")
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Configuration commune des tests : la bibliothèque my_function est dans script/.
+"""
+
+import os
+import sys
+
+SCRIPT_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'script')
+if SCRIPT_FOLDER not in sys.path:
+    sys.path.insert(0, SCRIPT_FOLDER)
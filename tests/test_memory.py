@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+Mémoire crête (RSS) de l'extraction, de l'apprentissage et de la prédiction sur une image
+synthétique UInt16 de NB_PIXELS pixels x NB_BANDS bandes. Chaque étape tourne dans un
+processus neuf (méthode 'spawn') et sa crête, mesurée à partir de l'état du processus au
+début de l'étape, doit rester dans le budget des matrices uint16 / float32 : une copie
+cachée en float64 le dépasse.
+
+Le nombre de pixels se change avec la variable d'environnement TEST_MEMORY_PIXELS.
+"""
+
+import os
+import sys
+import multiprocessing as mp
+
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip("osgeo.gdal")
+resource = pytest.importorskip("resource")
+
+NB_PIXELS = int(os.environ.get("TEST_MEMORY_PIXELS", 250_000))
+NB_BANDS = 60  # 10 bandes x 6 dates
+BLOCK_SIZE = 512
+POLYGON_SIZE = 50  # Côté des polygones synthétiques en pixels
+CODES = [11, 12, 13, 14, 21, 22, 23, 24, 25]
+MARGIN = 1.5  # Tolérance sur les budgets théoriques
+SLACK = 32 * 1024 ** 2  # Allocations fixes (tampons GDAL, arbres...) indépendantes de la taille
+
+
+def peak_rss():
+    """Mémoire crête du processus courant en octets (Linux : ru_maxrss en Ko)."""
+    factor = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * factor
+
+
+def create_synthetic_data(folder):
+    """Crée une image UInt16 et une grille de polygones couvrant toute l'image."""
+    import geopandas as gpd
+    from shapely.geometry import box
+    from osgeo import osr
+
+    side = int(np.sqrt(NB_PIXELS))
+    image_filename = os.path.join(folder, 'stack.tif')
+    dataset = gdal.GetDriverByName('GTiff').Create(
+        image_filename, side, side, NB_BANDS, gdal.GDT_UInt16, options=['TILED=YES']
+        )
+    dataset.SetGeoTransform((0, 10, 0, side * 10, 0, -10))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(2154)
+    dataset.SetProjection(srs.ExportToWkt())
+    rng = np.random.default_rng(0)
+    for band in range(1, NB_BANDS + 1):
+        dataset.GetRasterBand(band).WriteArray(
+            rng.integers(1, 10000, size=(side, side), dtype=np.uint16)
+            )
+    dataset = None
+
+    step = POLYGON_SIZE * 10
+    geometries = [box(x, y, x + step, y + step)
+                  for x in range(0, side * 10, step) for y in range(0, side * 10, step)]
+    gdf = gpd.GeoDataFrame(
+        {'Code': rng.choice(CODES, size=len(geometries))}, geometry=geometries, crs='EPSG:2154'
+        )
+    vector_filename = os.path.join(folder, 'polygones.gpkg')
+    gdf.to_file(vector_filename)
+    return image_filename, vector_filename, side * side
+
+
+def stage_extraction(image_filename, vector_filename, out_filename, queue):
+    """Extraction des échantillons puis conversion unique en float32."""
+    import geopandas as gpd
+    from my_function import extract_samples_from_polygons
+    gdf = gpd.read_file(vector_filename)
+    baseline = peak_rss()
+    X, _, _, _ = extract_samples_from_polygons(gdf, image_filename, 'Code')
+    X = X.astype(np.float32, copy=False)
+    queue.put(peak_rss() - baseline)
+
+
+def stage_training(image_filename, vector_filename, out_filename, queue):
+    """Apprentissage d'une petite forêt sur les échantillons extraits."""
+    import geopandas as gpd
+    from sklearn.ensemble import RandomForestClassifier
+    from my_function import extract_samples_from_polygons
+    gdf = gpd.read_file(vector_filename)
+    X, Y, _, _ = extract_samples_from_polygons(gdf, image_filename, 'Code')
+    X = X.astype(np.float32, copy=False)
+    clf = RandomForestClassifier(n_estimators=10, max_depth=10, n_jobs=1, random_state=0)
+    baseline = peak_rss()
+    clf.fit(X, Y.ravel())
+    queue.put(peak_rss() - baseline)
+
+
+def stage_prediction(image_filename, vector_filename, out_filename, queue):
+    """Prédiction bloc par bloc de l'image complète."""
+    import geopandas as gpd
+    from sklearn.ensemble import RandomForestClassifier
+    from my_function import extract_samples_from_polygons, predict_image_by_blocks
+    gdf = gpd.read_file(vector_filename)
+    X, Y, _, _ = extract_samples_from_polygons(
+        gdf, image_filename, 'Code', max_per_class=1000, seed=0
+        )
+    clf = RandomForestClassifier(n_estimators=10, max_depth=10, n_jobs=1, random_state=0)
+    clf.fit(X.astype(np.float32), Y.ravel())
+    del X, Y
+    baseline = peak_rss()
+    predict_image_by_blocks(clf, image_filename, out_filename, block_size=BLOCK_SIZE)
+    queue.put(peak_rss() - baseline)
+
+
+@pytest.fixture(scope="module")
+def synthetic_data(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("memoire")
+    image_filename, vector_filename, nb_pixels = create_synthetic_data(str(folder))
+    return image_filename, vector_filename, str(folder / 'carte.tif'), nb_pixels
+
+
+def run_stage(target, *args):
+    """Exécute une étape dans un processus neuf et renvoie l'augmentation de sa crête."""
+    context = mp.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=target, args=(*args, queue))
+    process.start()
+    try:
+        return queue.get(timeout=600)
+    finally:
+        process.join()
+
+
+# Budgets théoriques : matrice UInt16 et sa copie float32 pour l'extraction, une copie
+# float32 pour l'apprentissage, quelques blocs (UInt16 et float32) pour la prédiction
+@pytest.mark.parametrize("target, budget", [
+    (stage_extraction, lambda n: n * NB_BANDS * (2 + 4)),
+    (stage_training, lambda n: n * NB_BANDS * 4),
+    (stage_prediction, lambda n: 4 * BLOCK_SIZE * BLOCK_SIZE * NB_BANDS * (2 + 4)),
+], ids=["extraction", "apprentissage", "prediction"])
+def test_peak_rss_within_budget(synthetic_data, target, budget):
+    image_filename, vector_filename, out_filename, nb_pixels = synthetic_data
+    delta = run_stage(target, image_filename, vector_filename, out_filename)
+    limit = MARGIN * budget(nb_pixels) + SLACK
+    assert delta <= limit, (
+        f"Crête +{delta / 1024 ** 2:.1f} Mo pour un budget de {limit / 1024 ** 2:.1f} Mo "
+        f"({nb_pixels} pixels x {NB_BANDS} bandes)"
+    )
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+@author: navarro leo, biou romain, sala mathieu
+
+`classify_polygons` (vectorisée) doit donner exactement les codes de `classify_polygon`
+sur un corpus aléatoire de comptages : comptages quelconques, essence dominante, seuils de
+75 % atteints exactement, égalités feuillus / conifères, polygones sans pixel, classes
+hors des deux groupes, surfaces autour de 2 ha.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+from my_function import classify_polygon, classify_polygons  # noqa: E402
+
+CLASSES = [11, 12, 13, 14, 21, 22, 23, 24, 25, 31]  # 31 : classe hors des deux groupes
+AREAS = np.array([0.0, 0.01, 1.0, 1.999, 2.0, 2.001, 15.0])
+NB_CASES = 20_000
+
+
+def reference(counts, areas, classes=CLASSES):
+    """Codes de `classify_polygon`, polygone par polygone."""
+    return np.array([
+        classify_polygon({code: value for code, value in zip(classes, row) if value}, area)
+        for row, area in zip(counts.tolist(), areas.tolist())
+        ])
+
+
+def random_corpus(nb, rng):
+    """Comptages (nb, n_classes) et surfaces tirés dans plusieurs familles de cas."""
+    family = rng.integers(0, 6, nb)
+    counts = rng.integers(0, 50, (nb, len(CLASSES))) * rng.integers(0, 2, (nb, len(CLASSES)))
+
+    # Une essence dominante plus ou moins marquée
+    rows = np.nonzero(family == 1)[0]
+    counts[rows, rng.integers(0, 9, rows.size)] += rng.integers(0, 2000, rows.size)
+
+    # Exactement 75 % pour une essence ou un groupe
+    rows = np.nonzero(family == 2)[0]
+    scale = rng.integers(1, 40, rows.size)
+    counts[rows] = 0
+    counts[rows, rng.integers(0, 9, rows.size)] = 3 * scale
+    counts[rows, rng.integers(0, len(CLASSES), rows.size)] += scale
+
+    # Égalité stricte feuillus / conifères
+    rows = np.nonzero(family == 3)[0]
+    tie = rng.integers(1, 100, rows.size)
+    counts[rows] = 0
+    counts[rows, rng.integers(0, 4, rows.size)] = tie
+    counts[rows, rng.integers(4, 9, rows.size)] = tie
+
+    # Polygones sans pixel feuillus / conifères
+    rows = np.nonzero(family == 4)[0]
+    counts[rows, :9] = 0
+
+    # Très grands polygones
+    rows = np.nonzero(family == 5)[0]
+    counts[rows] *= rng.integers(1, 10_000, (rows.size, 1))
+
+    areas = np.where(rng.random(nb) < 0.5, rng.choice(AREAS, nb), rng.uniform(0, 20, nb))
+    return counts, areas
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_random_corpus_matches_reference(seed):
+    counts, areas = random_corpus(NB_CASES, np.random.default_rng(seed))
+    expected = reference(counts, areas)
+    predicted = classify_polygons(counts, CLASSES, areas)
+    mismatch = np.nonzero(predicted != expected)[0]
+    assert mismatch.size == 0, (
+        f"{mismatch.size} codes différents, ex. comptages {counts[mismatch[0]].tolist()}, "
+        f"surface {areas[mismatch[0]]} : attendu {expected[mismatch[0]]}, "
+        f"obtenu {predicted[mismatch[0]]}"
+    )
+
+
+@pytest.mark.parametrize("area", [0.5, 1.999, 2.0, 5.0])
+def test_zero_pixel_polygons(area):
+    counts = np.zeros((3, len(CLASSES)), dtype=np.int64)
+    counts[2, -1] = 7  # Uniquement une classe hors groupes
+    areas = np.full(3, area)
+    np.testing.assert_array_equal(
+        classify_polygons(counts, CLASSES, areas), reference(counts, areas)
+    )
+
+
+@pytest.mark.parametrize("area", [0.0, 0.5, 1.999, 2.0, 2.001])
+def test_small_and_large_stands_around_2_ha(area):
+    rows = []
+    for dominant in range(9):
+        for share in (74, 75, 76, 100):
+            row = np.zeros(len(CLASSES), dtype=np.int64)
+            row[dominant] = share
+            row[(dominant + 5) % 9] = 100 - share
+            rows.append(row)
+    counts = np.array(rows)
+    areas = np.full(len(counts), area)
+    np.testing.assert_array_equal(
+        classify_polygons(counts, CLASSES, areas), reference(counts, areas)
+    )
+
+
+def test_float_counts_and_class_order():
+    rng = np.random.default_rng(3)
+    counts, areas = random_corpus(2_000, rng)
+    order = rng.permutation(len(CLASSES))
+    classes = [CLASSES[i] for i in order]
+    np.testing.assert_array_equal(
+        classify_polygons(counts[:, order].astype(np.float64), classes, areas),
+        reference(counts, areas)
+    )